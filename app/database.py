@@ -1,15 +1,32 @@
 # app/database.py
+import atexit
+import hashlib
 import json
 import logging
 import re
 import sqlite3
 import os
+import threading
 import time
-from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple, Union
+import weakref
+from typing import Iterator, List, Dict, Any, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# --- SOFT DEPENDENCY: orjson (C/SIMD JSON); falls back to stdlib json ---
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+    _loads = json.loads
+
 # ------------------------------
 # Database Path Resolution
 # ------------------------------
@@ -35,6 +52,45 @@ DB_PATH = _resolve_db_path()
 # DB_NAME and DB_PATH must stay in sync for backward compatibility
 DB_NAME = DB_PATH
 
+# --- SOFT DEPENDENCY: numpy (SQ8 re-quantization); falls back to array ---
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+    from array import array as _array
+
+# Embeddings are L2-normalized, so every component lies in [-1, 1]; they are
+# stored as symmetric int8 (SQ8): round(x * 127), one byte per dimension.
+EMBEDDING_SQ8_SCALE = 127
+
+def _sq8_from_float32(blob: bytes) -> bytes:
+    """Re-quantizes a legacy float32 embedding blob to SQ8."""
+    if _np is not None:
+        vec = _np.frombuffer(blob, dtype=_np.float32)
+        return _np.clip(_np.rint(vec * EMBEDDING_SQ8_SCALE), -127, 127).astype(_np.int8).tobytes()
+    return _array("b", (
+        max(-127, min(127, round(x * EMBEDDING_SQ8_SCALE))) for x in _array("f", blob)
+    )).tobytes()
+
+# Per-second cache of the "YYYY-MM-DDTHH:MM:SS" prefix; swapped as one tuple so
+# concurrent writers never see a mismatched second/prefix pair.
+_iso_prefix_cache: Tuple[int, str] = (-1, "")
+
+def _now_iso(t: Optional[float] = None) -> str:
+    """
+    UTC time (default: now) in datetime.isoformat() form, always with microseconds.
+    Only re-formats the date/time prefix when the wall-clock second changes.
+    """
+    global _iso_prefix_cache
+    if t is None:
+        t = time.time()
+    secs = int(t)
+    cached_secs, prefix = _iso_prefix_cache
+    if secs != cached_secs:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(secs))
+        _iso_prefix_cache = (secs, prefix)
+    return "%s.%06d" % (prefix, (t - secs) * 1e6)
+
 def _ensure_db_directory():
     """Ensures the parent directory of the database exists."""
     # Use DB_NAME as canonical path (main.py may override it)
@@ -42,11 +98,94 @@ def _ensure_db_directory():
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
 
+# Per-connection tuning. journal_mode=WAL is persisted in the file header, so it
+# is switched once in init_db(); these settings must be applied to every connection.
+_CONNECTION_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+"""
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    """Applies per-connection performance pragmas (safe under WAL)."""
+    conn.executescript(_CONNECTION_PRAGMAS)
+
+class _PooledConnection(sqlite3.Connection):
+    """
+    Thread-local connection handed out by _connect_db().
+    close() releases it back to the pool instead of closing it: uncommitted
+    work is rolled back (matching a real close) but the connection and its
+    page cache stay open for the next call on the same thread.
+    """
+
+    def close(self) -> None:
+        if self.in_transaction:
+            self.rollback()
+        self.row_factory = None
+
+    def _close(self) -> None:
+        super().close()
+
+
+# One connection per thread; SQLite allows a single writer, so writes from
+# different threads are additionally serialized behind _WRITE_LOCK.
+_tls = threading.local()
+_POOL: "weakref.WeakSet[_PooledConnection]" = weakref.WeakSet()
+_POOL_LOCK = threading.Lock()
+_WRITE_LOCK = threading.RLock()
+
+# Session ids known to have a sessions row, so add_messages can skip the
+# INSERT OR IGNORE. Guarded by _WRITE_LOCK, like every sessions write.
+_known_sessions: set = set()
+
 def _connect_db() -> sqlite3.Connection:
-    """Creates a database connection, ensuring the directory exists first."""
-    _ensure_db_directory()
+    """Returns this thread's pooled connection, opening it on first use."""
+    conn = getattr(_tls, "conn", None)
     # Use DB_NAME as canonical path (supports main.py override)
-    return sqlite3.connect(DB_NAME)
+    if conn is None or _tls.path != DB_NAME:
+        _ensure_db_directory()
+        # check_same_thread=False only so _close_all() can close it at exit;
+        # the connection itself is never shared between threads.
+        # Long-lived connections make the sqlite3 statement cache worthwhile; size it
+        # above the number of distinct statements in this module.
+        conn = sqlite3.connect(
+            DB_NAME,
+            factory=_PooledConnection,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        _apply_pragmas(conn)
+        _tls.conn = conn
+        _tls.path = DB_NAME
+        with _POOL_LOCK:
+            _POOL.add(conn)
+    conn.row_factory = None
+    return conn
+
+def _discard_thread_connection() -> None:
+    """Really closes this thread's pooled connection (e.g. before moving the DB file)."""
+    conn = getattr(_tls, "conn", None)
+    if conn is not None:
+        _tls.conn = None
+        with _POOL_LOCK:
+            _POOL.discard(conn)
+        conn._close()
+
+def _close_all() -> None:
+    """Runs PRAGMA optimize on and closes every pooled connection. Registered with atexit."""
+    with _POOL_LOCK:
+        conns = list(_POOL)
+        _POOL.clear()
+    for conn in conns:
+        try:
+            # Let the planner refresh stale statistics before the connection goes away
+            conn.execute("PRAGMA optimize")
+            conn._close()
+        except Exception as e:
+            logger.debug(f"[Database] Error closing pooled connection: {e}")
+
+atexit.register(_close_all)
 
 # ------------------------------
 # Strict Auto-Memory Schema
@@ -104,16 +243,196 @@ _CANONICAL_ALIAS_MAP = {
 # Core DB Functions
 # ------------------------------
 
+# Bump whenever init_db() gains new DDL or a migration, so existing
+# databases take the full path once and then return to the fast path.
+SCHEMA_VERSION = 5
+
+def _get_schema_version() -> Optional[int]:
+    """Returns the schema version recorded in app_settings, or None if absent/unreadable."""
+    try:
+        value = get_app_setting("schema_version")
+    except sqlite3.Error:
+        return None  # app_settings missing (fresh or legacy DB)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+# Pure key-value tables, stored WITHOUT ROWID so the TEXT primary key is the
+# table B-tree itself rather than a separate index over a rowid table.
+_KV_TABLE_COLUMNS = {
+    "user_memory": "key TEXT PRIMARY KEY, value TEXT, category TEXT, last_updated TEXT",
+    "user_memory_meta": "key TEXT PRIMARY KEY, meta_json TEXT NOT NULL, created_at TEXT, last_updated TEXT",
+    "app_settings": "key TEXT PRIMARY KEY, value TEXT, last_updated TEXT",
+}
+
+# Full schema, run as one script inside init_db's single transaction.
+# Every statement is idempotent (IF NOT EXISTS).
+_SCHEMA_SQL = f"""
+-- 1. Sessions & Messages
+-- *_ms columns hold epoch milliseconds for sorting; the TEXT columns are kept for display
+CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, title TEXT, created_at TEXT, created_at_ms INTEGER);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT, role TEXT, content TEXT, tokens INTEGER, timestamp TEXT, timestamp_ms INTEGER,
+    FOREIGN KEY(session_id) REFERENCES sessions(id)
+);
+
+-- 2. User Memory (Value Store)
+CREATE TABLE IF NOT EXISTS user_memory (
+    {_KV_TABLE_COLUMNS["user_memory"]}
+) WITHOUT ROWID;
+
+-- 3. User Memory Metadata
+CREATE TABLE IF NOT EXISTS user_memory_meta (
+    {_KV_TABLE_COLUMNS["user_memory_meta"]}
+) WITHOUT ROWID;
+
+-- 4. Vector Memory
+CREATE TABLE IF NOT EXISTS vector_memory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content TEXT NOT NULL, embedding BLOB NOT NULL, meta_json TEXT NOT NULL,
+    created_at TEXT, last_updated TEXT, content_hash INTEGER
+);
+
+-- 5. Memory Events (Phase 6)
+CREATE TABLE IF NOT EXISTS memory_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL, session_id TEXT, event TEXT NOT NULL, payload_json TEXT NOT NULL
+);
+
+-- 6. App Settings (Persistence)
+CREATE TABLE IF NOT EXISTS app_settings (
+    {_KV_TABLE_COLUMNS["app_settings"]}
+) WITHOUT ROWID;
+
+-- 7. RAG Files (Phase 0A + Phase 1A)
+CREATE TABLE IF NOT EXISTS rag_files (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    original_name TEXT NOT NULL,
+    stored_path TEXT NOT NULL,
+    mime TEXT,
+    size_bytes INTEGER,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    extracted_path TEXT,
+    chunks_path TEXT,
+    page_count INTEGER,
+    char_count INTEGER,
+    chunk_count INTEGER,
+    error TEXT,
+    updated_at TEXT
+);
+
+-- RAG session settings
+CREATE TABLE IF NOT EXISTS rag_session_settings (
+    session_id TEXT PRIMARY KEY,
+    rag_enabled INTEGER NOT NULL DEFAULT 1,
+    auto_index INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT
+);
+
+-- 8. Finance Tables (Phase 2 — V2 schema with account_label)
+CREATE TABLE IF NOT EXISTS fin_uploads (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    account_label TEXT NOT NULL,
+    account_type TEXT NOT NULL,
+    uploaded_at TEXT NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS fin_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    upload_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL,
+    amount REAL NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT 'Other',
+    account_label TEXT NOT NULL,
+    account_type TEXT NOT NULL,
+    FOREIGN KEY(upload_id) REFERENCES fin_uploads(id),
+    UNIQUE (date, description, amount, account_label)
+);
+CREATE TABLE IF NOT EXISTS fin_goals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    goal_type TEXT,
+    life_events TEXT,
+    budgets TEXT,
+    horizon TEXT,
+    created_at TEXT NOT NULL
+);
+
+-- 9. Notes and Reminders (Phase 02.1)
+CREATE TABLE IF NOT EXISTS notes (
+    id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    note_type TEXT DEFAULT 'note',
+    due_at TEXT,
+    color TEXT DEFAULT 'default',
+    pinned INTEGER DEFAULT 0,
+    dismissed INTEGER DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_due_active ON notes(due_at, dismissed);
+
+-- Indexes on hot query paths
+CREATE INDEX IF NOT EXISTS idx_events_session_id ON memory_events(session_id, id DESC);
+CREATE INDEX IF NOT EXISTS idx_rag_files_session ON rag_files(session_id);
+CREATE INDEX IF NOT EXISTS idx_fin_transactions_upload ON fin_transactions(upload_id);
+"""
+
+# Columns added to rag_files after its first release (Phase 1A)
+_RAG_FILES_COLUMNS = {
+    'extracted_path': 'TEXT',
+    'chunks_path': 'TEXT',
+    'page_count': 'INTEGER',
+    'char_count': 'INTEGER',
+    'chunk_count': 'INTEGER',
+    'error': 'TEXT',
+    'updated_at': 'TEXT',
+    'vector_count': 'INTEGER',
+    'indexed_at': 'TEXT',
+    'index_backend': 'TEXT',
+    'index_collection': 'TEXT',
+    'is_active': 'INTEGER',
+    'content_sha256': 'TEXT'
+}
+
+# Integer sort keys added alongside TEXT timestamps: (table, new column, source column)
+_EPOCH_MS_COLUMNS = [
+    ("messages", "timestamp_ms", "timestamp"),
+    ("sessions", "created_at_ms", "created_at"),
+]
+
+_SQL_UPSERT_APP_SETTING = """
+    INSERT INTO app_settings (key, value, last_updated)
+    VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        value=excluded.value, last_updated=excluded.last_updated
+"""
+
 def init_db():
     """
     Initializes the SQLite database with the required tables.
     Performs a schema health check to handle legacy databases.
+    Returns early when the recorded schema version is current.
     """
     # Detect fresh install before connection creates the file
-    is_new_db = not os.path.exists(DB_PATH)
+    # Use DB_NAME as canonical path (main.py may override it)
+    is_new_db = not os.path.exists(DB_NAME)
+
+    # Fast path: schema already up to date, skip health checks and DDL
+    if not is_new_db and _get_schema_version() == SCHEMA_VERSION:
+        conn = _connect_db()
+        conn.execute("PRAGMA optimize")
+        conn.close()
+        return
 
     # 0. Schema Health Check
-    if os.path.exists(DB_PATH):
+    if not is_new_db:
         try:
             conn = _connect_db()
             c = conn.cursor()
@@ -138,9 +457,11 @@ def init_db():
             if is_legacy_sessions or is_legacy_messages:
                 logger.error("[Database] Critical: Database schema mismatch detected (legacy version).")
                 timestamp = int(time.time())
-                backup_name = f"{DB_PATH}.bak.{timestamp}"
+                backup_name = f"{DB_NAME}.bak.{timestamp}"
+                # Release the pooled handle so the file can be renamed
+                _discard_thread_connection()
                 try:
-                    os.rename(DB_PATH, backup_name)
+                    os.rename(DB_NAME, backup_name)
                     logger.info(f"[Database] Data Preservation: Renamed old DB to '{backup_name}'.")
                     logger.info("[Database] Creating fresh database with correct schema...")
                     # If we renamed the DB, the new one will be fresh
@@ -151,126 +472,82 @@ def init_db():
         except Exception as e:
             logger.warning(f"[Database] Database health check failed ({e}). Proceeding...")
 
+    # The file may have been replaced or DB_NAME repointed; forget cached sessions
+    # and invalidate in-memory embedding caches
+    global _vector_generation, _memory_generation
+    with _WRITE_LOCK:
+        _known_sessions.clear()
+        _vector_generation += 1
+        _memory_generation += 1
+
     conn = _connect_db()
     c = conn.cursor()
 
-    # 1. Sessions & Messages
-    c.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, title TEXT, created_at TEXT)")
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT, role TEXT, content TEXT, tokens INTEGER, timestamp TEXT,
-            FOREIGN KEY(session_id) REFERENCES sessions(id)
-        )
-    """)
-
-    # 2. User Memory (Value Store)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS user_memory (
-            key TEXT PRIMARY KEY, value TEXT, category TEXT, last_updated TEXT
-        )
-    """)
+    # WAL lets readers proceed alongside the writer; persisted in the DB file.
+    # journal_mode cannot change inside a transaction, so set it first.
+    c.execute("PRAGMA journal_mode=WAL")
 
-    # 3. User Memory Metadata
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS user_memory_meta (
-            key TEXT PRIMARY KEY, meta_json TEXT NOT NULL, created_at TEXT, last_updated TEXT
-        )
-    """)
+    # Checked before the schema script creates the index
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_events_session_id'")
+    needs_analyze = c.fetchone() is None
 
-    # 4. Vector Memory
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS vector_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            content TEXT NOT NULL, embedding BLOB NOT NULL, meta_json TEXT NOT NULL,
-            created_at TEXT, last_updated TEXT
-        )
-    """)
-
-    # 5. Memory Events (Phase 6)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS memory_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT NOT NULL, session_id TEXT, event TEXT NOT NULL, payload_json TEXT NOT NULL
-        )
-    """)
-
-    # 6. App Settings (Persistence)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS app_settings (
-            key TEXT PRIMARY KEY, value TEXT, last_updated TEXT
-        )
-    """)
-
-    # 7. RAG Files (Phase 0A + Phase 1A)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS rag_files (
-            id TEXT PRIMARY KEY,
-            session_id TEXT NOT NULL,
-            original_name TEXT NOT NULL,
-            stored_path TEXT NOT NULL,
-            mime TEXT,
-            size_bytes INTEGER,
-            status TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            extracted_path TEXT,
-            chunks_path TEXT,
-            page_count INTEGER,
-            char_count INTEGER,
-            chunk_count INTEGER,
-            error TEXT,
-            updated_at TEXT
-        )
-    """)
+    # executescript() commits any pending transaction before running, so the
+    # BEGIN lives inside the script and the transaction stays open for the
+    # migrations below. Everything lands in one commit (one fsync).
+    # Note: pooled close() rolls back, so no helper that closes the connection
+    # (get_app_setting/set_app_setting) may be called until conn.commit().
+    c.executescript("BEGIN;" + _SCHEMA_SQL)
 
     # Safe migration: Add new columns if they don't exist (Phase 1A)
     c.execute("PRAGMA table_info(rag_files)")
     existing_columns = {row[1] for row in c.fetchall()}
 
-    new_columns = {
-        'extracted_path': 'TEXT',
-        'chunks_path': 'TEXT',
-        'page_count': 'INTEGER',
-        'char_count': 'INTEGER',
-        'chunk_count': 'INTEGER',
-        'error': 'TEXT',
-        'updated_at': 'TEXT',
-        'vector_count': 'INTEGER',
-        'indexed_at': 'TEXT',
-        'index_backend': 'TEXT',
-        'index_collection': 'TEXT',
-        'is_active': 'INTEGER',
-        'content_sha256': 'TEXT'
-    }
-
-    for col_name, col_type in new_columns.items():
+    for col_name, col_type in _RAG_FILES_COLUMNS.items():
         if col_name not in existing_columns:
             c.execute(f"ALTER TABLE rag_files ADD COLUMN {col_name} {col_type}")
             logger.info(f"[Database] Added column '{col_name}' to rag_files table")
 
-
-
     # Create UNIQUE INDEX on (session_id, content_sha256) for deduplication
+    # (needs content_sha256, which legacy tables only gain above)
     c.execute("""
         CREATE UNIQUE INDEX IF NOT EXISTS idx_rag_session_sha256
         ON rag_files(session_id, content_sha256)
         WHERE content_sha256 IS NOT NULL
     """)
 
-    # Create RAG session settings table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS rag_session_settings (
-            session_id TEXT PRIMARY KEY,
-            rag_enabled INTEGER NOT NULL DEFAULT 1,
-            auto_index INTEGER NOT NULL DEFAULT 1,
-            updated_at TEXT
-        )
-    """)
-
-    # 8. Finance Tables (Phase 2 — V2 schema with account_label)
-    # One-time migration: add V2 columns to existing V1 tables (if needed)
-    fin_version = get_app_setting('fin_schema_version')
-    if fin_version is None:
+    # Epoch-ms sort columns: add and backfill from the ISO TEXT column on older DBs
+    for table, ms_col, text_col in _EPOCH_MS_COLUMNS:
+        c.execute(f"PRAGMA table_info({table})")
+        if ms_col not in {row[1] for row in c.fetchall()}:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {ms_col} INTEGER")
+            c.execute(f"""
+                UPDATE {table}
+                SET {ms_col} = CAST(ROUND((julianday({text_col}) - 2440587.5) * 86400000) AS INTEGER)
+                WHERE {text_col} IS NOT NULL
+            """)
+            logger.info(f"[Database] Added and backfilled '{ms_col}' on {table}")
+
+    # Rebuild key-value tables created before they were declared WITHOUT ROWID
+    for table, columns in _KV_TABLE_COLUMNS.items():
+        c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        row = c.fetchone()
+        if row and "WITHOUT ROWID" not in row[0].upper():
+            col_names = ", ".join(col.split()[0] for col in columns.split(", "))
+            c.execute(f"CREATE TABLE {table}_new ({columns}) WITHOUT ROWID")
+            # WITHOUT ROWID enforces NOT NULL on the key; rowid tables did not
+            c.execute(f"INSERT INTO {table}_new ({col_names}) SELECT {col_names} FROM {table} WHERE key IS NOT NULL")
+            c.execute(f"DROP TABLE {table}")
+            c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+            logger.info(f"[Database] Rebuilt '{table}' as WITHOUT ROWID")
+
+    # Chat history sorts on the integer key; the TEXT-keyed index is superseded
+    c.execute("DROP INDEX IF EXISTS idx_messages_session")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_ms ON messages(session_id, timestamp_ms)")
+
+    # Finance one-time migration: add V2 columns to existing V1 tables (if needed).
+    # The V2 CREATEs above leave V1 tables untouched; on V2 tables these fail harmlessly.
+    c.execute("SELECT value FROM app_settings WHERE key = 'fin_schema_version'")
+    if c.fetchone() is None:
         for stmt in [
             "ALTER TABLE fin_transactions ADD COLUMN account_label TEXT NOT NULL DEFAULT ''",
             "ALTER TABLE fin_transactions ADD COLUMN account_type TEXT NOT NULL DEFAULT ''",
@@ -280,88 +557,89 @@ def init_db():
             try:
                 c.execute(stmt)
             except Exception:
-                pass  # Column already exists or table doesn't exist yet
-        set_app_setting('fin_schema_version', '2')
+                pass  # Column already exists
+        c.execute(_SQL_UPSERT_APP_SETTING, ("fin_schema_version", "2", _now_iso()))
 
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS fin_uploads (
-            id TEXT PRIMARY KEY,
-            filename TEXT NOT NULL,
-            account_label TEXT NOT NULL,
-            account_type TEXT NOT NULL,
-            uploaded_at TEXT NOT NULL,
-            row_count INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS fin_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            upload_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            description TEXT NOT NULL,
-            amount REAL NOT NULL,
-            type TEXT NOT NULL,
-            category TEXT NOT NULL DEFAULT 'Other',
-            account_label TEXT NOT NULL,
-            account_type TEXT NOT NULL,
-            FOREIGN KEY(upload_id) REFERENCES fin_uploads(id),
-            UNIQUE (date, description, amount, account_label)
+    # Vector memory embeddings: float32 -> SQ8 (int8), converted once in place
+    c.execute("SELECT value FROM app_settings WHERE key = 'embedding_format'")
+    row = c.fetchone()
+    if not row or row[0] != "sq8":
+        rows = c.execute("SELECT id, embedding FROM vector_memory").fetchall()
+        c.executemany(
+            "UPDATE vector_memory SET embedding = ? WHERE id = ?",
+            [(_sq8_from_float32(blob), row_id) for row_id, blob in rows if blob and len(blob) % 4 == 0],
         )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS fin_goals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            goal_type TEXT,
-            life_events TEXT,
-            budgets TEXT,
-            horizon TEXT,
-            created_at TEXT NOT NULL
+        c.execute(_SQL_UPSERT_APP_SETTING, ("embedding_format", "sq8", _now_iso()))
+        if rows:
+            logger.info(f"[Database] Re-quantized {len(rows)} vector memory embeddings to int8")
+
+    # Vector memory content hash: add and backfill on older DBs, dropping exact
+    # duplicate rows (oldest kept, as INSERT OR IGNORE would) before the unique index
+    c.execute("PRAGMA table_info(vector_memory)")
+    if "content_hash" not in {row[1] for row in c.fetchall()}:
+        c.execute("ALTER TABLE vector_memory ADD COLUMN content_hash INTEGER")
+        rows = c.execute("SELECT id, content FROM vector_memory").fetchall()
+        c.executemany(
+            "UPDATE vector_memory SET content_hash = ? WHERE id = ?",
+            [(vector_content_hash(content), row_id) for row_id, content in rows],
         )
-    """)
-
-    # 9. Notes and Reminders (Phase 02.1)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS notes (
-            id TEXT PRIMARY KEY,
-            content TEXT NOT NULL,
-            note_type TEXT DEFAULT 'note',
-            due_at TEXT,
-            color TEXT DEFAULT 'default',
-            pinned INTEGER DEFAULT 0,
-            dismissed INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-    """)
+        c.execute("""
+            DELETE FROM vector_memory WHERE id NOT IN (
+                SELECT MIN(id) FROM vector_memory GROUP BY content_hash
+            )
+        """)
+        logger.info(f"[Database] Added and backfilled 'content_hash' on vector_memory ({len(rows)} rows)")
     c.execute("""
-        CREATE INDEX IF NOT EXISTS idx_notes_due_active
-        ON notes(due_at, dismissed)
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vector_memory_content_hash
+        ON vector_memory(content_hash)
     """)
 
-    # Indexes on hot query paths
-    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, timestamp)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_rag_files_session ON rag_files(session_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_fin_transactions_upload ON fin_transactions(upload_id)")
-
     # Seed tutorial flag ONLY if this is a fresh install (or recreated after backup)
     if is_new_db:
-        now = datetime.utcnow().isoformat()
+        now = _now_iso()
         c.execute("INSERT OR IGNORE INTO app_settings (key, value, last_updated) VALUES (?, ?, ?)",
                   ("tutorial_completed", "false", now))
 
+    # Record the schema version so later starts take the fast path
+    c.execute(_SQL_UPSERT_APP_SETTING, ("schema_version", str(SCHEMA_VERSION), _now_iso()))
+
     conn.commit()
+
+    # Gather full statistics once when the event index is first created
+    if needs_analyze:
+        c.execute("ANALYZE")
+
+    # Refresh planner statistics for tables whose indexes changed shape
+    c.execute("PRAGMA optimize")
     conn.close()
 
+_SAFE_KEY_RE = re.compile(r"[^a-z0-9_]")
+# Keys that are already canonical and pass through _safe_key unchanged
+_CANONICAL_KEYS = frozenset(ALLOWED_AUTO_MEMORY_KEYS | TIER_A_KEYS)
+_canonical_alias = _CANONICAL_ALIAS_MAP.get
+
 def _safe_key(raw_key: str) -> Optional[str]:
     if not raw_key: return None
+    # Fast path: API callers almost always pass a canonical key already
+    if raw_key in _CANONICAL_KEYS: return raw_key
     k = raw_key.strip().lower().replace(" ", "_")
-    k = re.sub(r"[^a-z0-9_]", "", k)
-    return _CANONICAL_ALIAS_MAP.get(k, k)
+    k = _SAFE_KEY_RE.sub("", k)
+    return _canonical_alias(k, k)
 
 # ------------------------------
 # Memory Operations (Values)
 # ------------------------------
 
+# Bumped on every user_memory / user_memory_meta write so in-memory indexes
+# built from those tables (memory_core's KV index) know to rebuild
+_memory_generation = 0
+
+def mark_user_memory_changed() -> None:
+    """Invalidates user_memory read caches after a write made outside this module."""
+    global _memory_generation
+    with _WRITE_LOCK:
+        _memory_generation += 1
+
 def upsert_user_memory(key: str, value: str, category: str = "auto") -> None:
     k = _safe_key(key)
     if not k: return
@@ -372,28 +650,41 @@ def upsert_user_memory(key: str, value: str, category: str = "auto") -> None:
     else:
         if k not in ALLOWED_AUTO_MEMORY_KEYS: k = "misc"
 
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO user_memory (key, value, category, last_updated)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(key) DO UPDATE SET
-            value=excluded.value, category=excluded.category, last_updated=excluded.last_updated
-    """, (k, value, category, now))
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO user_memory (key, value, category, last_updated)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value=excluded.value, category=excluded.category, last_updated=excluded.last_updated
+        """, (k, value, category, now))
+        conn.commit()
+        conn.close()
+        mark_user_memory_changed()
+
+# RETURNING (SQLite 3.35+) reports the deleted row from the DELETE itself
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _delete_one(sql: str, params: Tuple) -> bool:
+    """Runs a keyed DELETE and reports whether a row was removed."""
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        if _HAS_RETURNING:
+            deleted = bool(conn.execute(sql + " RETURNING 1", params).fetchall())
+        else:
+            deleted = conn.execute(sql, params).rowcount > 0
+        conn.commit()
+        conn.close()
+    return deleted
 
 def delete_user_memory(key: str) -> bool:
     k = _safe_key(key)
     if not k: return False
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM user_memory WHERE key = ?", (k,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows > 0
+    deleted = _delete_one("DELETE FROM user_memory WHERE key = ?", (k,))
+    mark_user_memory_changed()
+    return deleted
 
 def get_user_memory_value(key: str) -> Optional[str]:
     k = _safe_key(key)
@@ -413,30 +704,28 @@ def upsert_user_memory_meta(key: str, meta: Dict[str, Any]) -> None:
     safe_key = _safe_key(key)
     if not safe_key: return
 
-    meta_json = json.dumps(meta, sort_keys=True, separators=(",", ":"))
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("SELECT created_at FROM user_memory_meta WHERE key = ?", (safe_key,))
-    row = c.fetchone()
-
-    if row:
-        c.execute("UPDATE user_memory_meta SET meta_json = ?, last_updated = ? WHERE key = ?", (meta_json, now, safe_key))
-    else:
-        c.execute("INSERT INTO user_memory_meta (key, meta_json, created_at, last_updated) VALUES (?, ?, ?, ?)", (safe_key, meta_json, now, now))
-    conn.commit()
-    conn.close()
+    meta_json = _dumps(meta)
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        # created_at is only written on insert; the conflict path preserves it
+        c.execute("""
+            INSERT INTO user_memory_meta (key, meta_json, created_at, last_updated)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                meta_json=excluded.meta_json, last_updated=excluded.last_updated
+        """, (safe_key, meta_json, now, now))
+        conn.commit()
+        conn.close()
+        mark_user_memory_changed()
 
 def delete_user_memory_meta(key: str) -> bool:
     k = _safe_key(key)
     if not k: return False
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM user_memory_meta WHERE key = ?", (k,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows > 0
+    deleted = _delete_one("DELETE FROM user_memory_meta WHERE key = ?", (k,))
+    mark_user_memory_changed()
+    return deleted
 
 def merge_user_memory_meta(key: str, updates: Dict[str, Any]) -> Dict[str, Any]:
     existing_meta = get_user_memory_meta(key) or {}
@@ -450,33 +739,60 @@ def get_user_memory_meta(key: str) -> Optional[Dict[str, Any]]:
     row = c.fetchone()
     conn.close()
     if row and row[0]:
-        try: return json.loads(row[0])
+        try: return _loads(row[0])
         except: return None
     return None
 
+# Tier-A key set is fixed, so the IN (...) lists and full SQL text are built once
+_TIER_A_TUPLE = tuple(sorted(TIER_A_KEYS))
+_TIER_A_PLACEHOLDERS = ",".join("?" * len(_TIER_A_TUPLE))
+
+_SQL_CORE_WITH_META = f"""
+    SELECT m.key, m.value, m.category, meta.meta_json, meta.created_at AS meta_created_at
+    FROM user_memory m
+    LEFT JOIN user_memory_meta meta ON m.key = meta.key
+    WHERE m.key IN ({_TIER_A_PLACEHOLDERS})
+    ORDER BY m.category, m.key
+"""
+
+_SQL_EXTENDED_WITH_META = f"""
+    SELECT m.key, m.value, m.category, meta.meta_json, meta.created_at AS meta_created_at
+    FROM user_memory m
+    LEFT JOIN user_memory_meta meta ON m.key = meta.key
+    WHERE m.key NOT IN ({_TIER_A_PLACEHOLDERS})
+    ORDER BY m.last_updated DESC
+    LIMIT 200
+"""
+
+def _memories_with_meta(rows: List[Tuple]) -> List[Dict[str, Any]]:
+    # Positional over (key, value, category, meta_json, meta_created_at)
+    return [
+        {"key": key, "value": value, "category": category,
+         "meta_created_at": meta_created_at,
+         "meta": _loads(meta_json) if meta_json else None}
+        for key, value, category, meta_json, meta_created_at in rows
+    ]
+
 def get_core_user_memories_with_meta() -> List[Dict[str, Any]]:
     conn = _connect_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    placeholders = ",".join("?" for _ in TIER_A_KEYS)
-    sql = f"""
-        SELECT m.key, m.value, m.category, meta.meta_json, meta.created_at AS meta_created_at
-        FROM user_memory m
-        LEFT JOIN user_memory_meta meta ON m.key = meta.key
-        WHERE m.key IN ({placeholders})
-        ORDER BY m.category, m.key
-    """
-    c.execute(sql, list(TIER_A_KEYS))
+    c.execute(_SQL_CORE_WITH_META, _TIER_A_TUPLE)
     rows = c.fetchall()
     conn.close()
+    return _memories_with_meta(rows)
 
-    results = []
-    for row in rows:
-        item = dict(row)
-        item["meta"] = json.loads(item["meta_json"]) if item["meta_json"] else None
-        del item["meta_json"]
-        results.append(item)
-    return results
+def iter_extended_user_memories() -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Yields raw (key, value, meta_json) rows of the extended (non Tier-A) set,
+    same order and cap as get_extended_user_memories_with_meta. meta_json is
+    left undecoded so callers only parse the rows they keep.
+    """
+    conn = _connect_db()
+    try:
+        for row in conn.execute(_SQL_EXTENDED_WITH_META, _TIER_A_TUPLE):
+            yield row[0], row[1], row[3]
+    finally:
+        conn.close()
 
 def get_extended_user_memories_with_meta() -> List[Dict[str, Any]]:
     """
@@ -484,108 +800,137 @@ def get_extended_user_memories_with_meta() -> List[Dict[str, Any]]:
     Used for tool-based retrieval and general knowledge.
     """
     conn = _connect_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    placeholders = ",".join("?" for _ in TIER_A_KEYS)
-    sql = f"""
-        SELECT m.key, m.value, m.category, meta.meta_json, meta.created_at AS meta_created_at
-        FROM user_memory m
-        LEFT JOIN user_memory_meta meta ON m.key = meta.key
-        WHERE m.key NOT IN ({placeholders})
-        ORDER BY m.last_updated DESC
-        LIMIT 200
-    """
-    c.execute(sql, list(TIER_A_KEYS))
+    c.execute(_SQL_EXTENDED_WITH_META, _TIER_A_TUPLE)
     rows = c.fetchall()
     conn.close()
-
-    results = []
-    for row in rows:
-        item = dict(row)
-        item["meta"] = json.loads(item["meta_json"]) if item["meta_json"] else None
-        del item["meta_json"]
-        results.append(item)
-    return results
+    return _memories_with_meta(rows)
 
 # ------------------------------
 # Vector Memory Operations
 # ------------------------------
 
-def add_vector_memory_item(content: str, embedding: bytes, meta: Dict[str, Any]) -> int:
-    meta_json = json.dumps(meta, sort_keys=True, separators=(",", ":"))
-    now = datetime.utcnow().isoformat()
+def vector_content_hash(content: str) -> int:
+    """Signed 64-bit digest of the exact content; the vector_memory dedupe key."""
+    return int.from_bytes(hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+# An existing row with the same content wins; its id is returned instead
+_SQL_INSERT_VECTOR_MEMORY = """
+    INSERT OR IGNORE INTO vector_memory (content, embedding, meta_json, created_at, last_updated, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+def _insert_vector_memory(c: sqlite3.Cursor, content: str, embedding: bytes, meta: Dict[str, Any], now: str) -> int:
+    content_hash = vector_content_hash(content)
+    c.execute(_SQL_INSERT_VECTOR_MEMORY, (content, embedding, _dumps(meta), now, now, content_hash))
+    if c.rowcount:
+        return c.lastrowid
+    return c.execute("SELECT id FROM vector_memory WHERE content_hash = ?", (content_hash,)).fetchone()[0]
+
+def add_vector_memory_items(items: List[Tuple[str, bytes, Dict[str, Any]]]) -> List[int]:
+    """Inserts (content, embedding, meta) rows in one transaction; returns their ids."""
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        row_ids = [_insert_vector_memory(c, content, embedding, meta, now) for content, embedding, meta in items]
+        conn.commit()
+        conn.close()
+    return row_ids
+
+def find_vector_memory_id(content: str) -> Optional[int]:
+    """Id of the vector memory row storing exactly this content, if any."""
     conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO vector_memory (content, embedding, meta_json, created_at, last_updated)
-        VALUES (?, ?, ?, ?, ?)
-    """, (content, embedding, meta_json, now, now))
-    row_id = c.lastrowid
-    conn.commit()
+    row = conn.execute(
+        "SELECT id FROM vector_memory WHERE content_hash = ?", (vector_content_hash(content),)
+    ).fetchone()
     conn.close()
-    return row_id
+    return row[0] if row else None
 
-def list_vector_memory_items(limit: int = 5000) -> List[Dict[str, Any]]:
+def iter_vector_embeddings_after(after_id: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yields (id, embedding) pairs with id > after_id, oldest first. Ids are
+    AUTOINCREMENT, so callers holding everything up to after_id can append.
+    """
+    conn = _connect_db()
+    try:
+        yield from conn.execute(
+            "SELECT id, embedding FROM vector_memory WHERE id > ? ORDER BY id", (after_id,)
+        )
+    finally:
+        conn.close()
+
+def get_vector_memory_items(item_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Fetches content + meta for specific vector memory ids (e.g. top-k hits), keyed by id."""
+    if not item_ids:
+        return {}
+    placeholders = ",".join("?" * len(item_ids))
     conn = _connect_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute("""
-        SELECT id, content, embedding, meta_json, created_at, last_updated
-        FROM vector_memory ORDER BY id DESC LIMIT ?
-    """, (limit,))
+    c.execute(f"""
+        SELECT id, content, meta_json, created_at, last_updated
+        FROM vector_memory WHERE id IN ({placeholders})
+    """, list(item_ids))
     rows = c.fetchall()
     conn.close()
-    results = []
-    for row in rows:
-        item = dict(row)
-        item["meta"] = json.loads(item["meta_json"]) if item["meta_json"] else {}
-        del item["meta_json"]
-        results.append(item)
-    return results
+    return {
+        row[0]: {
+            "id": row[0],
+            "content": row[1],
+            "created_at": row[3],
+            "last_updated": row[4],
+            "meta": _loads(row[2]) if row[2] else {},
+        }
+        for row in rows
+    }
+
+# Bumped whenever vector_memory rows are removed, so in-memory embedding
+# caches (which only ever append newer ids) know to rebuild
+_vector_generation = 0
 
 def delete_vector_memory_item(item_id: int) -> bool:
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM vector_memory WHERE id = ?", (item_id,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows > 0
+    global _vector_generation
+    deleted = _delete_one("DELETE FROM vector_memory WHERE id = ?", (item_id,))
+    with _WRITE_LOCK:
+        _vector_generation += 1
+    return deleted
 
 # ------------------------------
 # Memory Events (Phase 6)
 # ------------------------------
 
 def add_memory_event(event: str, payload: Dict[str, Any], session_id: Optional[str] = None) -> None:
-    ts = datetime.utcnow().isoformat()
-    try: payload_json = json.dumps(payload, sort_keys=True)
+    ts = _now_iso()
+    try: payload_json = _dumps(payload)
     except: payload_json = "{}"
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("INSERT INTO memory_events (ts, session_id, event, payload_json) VALUES (?, ?, ?, ?)", (ts, session_id, event, payload_json))
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("INSERT INTO memory_events (ts, session_id, event, payload_json) VALUES (?, ?, ?, ?)", (ts, session_id, event, payload_json))
+        conn.commit()
+        conn.close()
+
+_SQL_MEMORY_EVENTS = "SELECT id, ts, session_id, event, payload_json FROM memory_events ORDER BY id DESC LIMIT 200"
+_SQL_MEMORY_EVENTS_FOR_SESSION = (
+    "SELECT id, ts, session_id, event, payload_json FROM memory_events "
+    "WHERE session_id = ? ORDER BY id DESC LIMIT 200"
+)
 
 def get_memory_events(session_id: Optional[str] = None) -> List[Dict[str, Any]]:
     conn = _connect_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    sql = "SELECT id, ts, session_id, event, payload_json FROM memory_events "
-    params = []
+    # Fixed SQL text per branch so the prepared statement is reused from the cache
     if session_id:
-        sql += "WHERE session_id = ? "
-        params.append(session_id)
-    sql += "ORDER BY id DESC LIMIT 200"
-    c.execute(sql, params)
+        c.execute(_SQL_MEMORY_EVENTS_FOR_SESSION, (session_id,))
+    else:
+        c.execute(_SQL_MEMORY_EVENTS)
     rows = c.fetchall()
     conn.close()
-    results = []
-    for row in rows:
-        item = dict(row)
-        item["payload"] = json.loads(item["payload_json"]) if item["payload_json"] else {}
-        del item["payload_json"]
-        results.append(item)
-    return results
+    return [
+        {"id": row_id, "ts": ts, "session_id": sid, "event": event,
+         "payload": _loads(payload_json) if payload_json else {}}
+        for row_id, ts, sid, event, payload_json in rows
+    ]
 
 # ------------------------------
 # App Settings (Persistence)
@@ -601,40 +946,39 @@ def get_app_setting(key: str) -> Optional[str]:
     return row[0] if row else None
 
 
+# Bumped on every app_settings write so callers' read caches can detect staleness
+_settings_generation = 0
+
 def set_app_setting(key: str, value: str) -> None:
     """Upserts a setting value."""
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO app_settings (key, value, last_updated)
-        VALUES (?, ?, ?)
-        ON CONFLICT(key) DO UPDATE SET
-            value=excluded.value, last_updated=excluded.last_updated
-    """, (key, value, now))
-    conn.commit()
-    conn.close()
+    global _settings_generation
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute(_SQL_UPSERT_APP_SETTING, (key, value, now))
+        conn.commit()
+        conn.close()
+        _settings_generation += 1
 
 
 def delete_app_setting(key: str) -> bool:
     """Deletes a setting key."""
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM app_settings WHERE key = ?", (key,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows > 0
+    global _settings_generation
+    deleted = _delete_one("DELETE FROM app_settings WHERE key = ?", (key,))
+    with _WRITE_LOCK:
+        _settings_generation += 1
+    return deleted
 
 
 def get_all_app_settings() -> Dict[str, str]:
     """Retrieves all settings as a dictionary."""
     conn = _connect_db()
     c = conn.cursor()
-    c.execute("SELECT key, value FROM app_settings")
-    rows = c.fetchall()
+    # dict() drains the cursor directly; no intermediate fetchall() list
+    settings = dict(c.execute("SELECT key, value FROM app_settings"))
     conn.close()
-    return {row[0]: row[1] for row in rows}
+    return settings
 
 # ------------------------------
 # Session & History Functions
@@ -642,12 +986,11 @@ def get_all_app_settings() -> Dict[str, str]:
 
 def get_recent_sessions(limit: int = 20) -> List[Dict[str, Any]]:
     conn = _connect_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute("SELECT id, title, created_at FROM sessions ORDER BY created_at DESC LIMIT ?", (limit,))
-    rows = c.fetchall()
+    c.execute("SELECT id, title, created_at FROM sessions ORDER BY created_at_ms DESC LIMIT ?", (limit,))
+    sessions = [{"id": sid, "title": title, "created_at": created_at} for sid, title, created_at in c]
     conn.close()
-    return [dict(row) for row in rows]
+    return sessions
 
 
 def get_chat_history(session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
@@ -659,14 +1002,14 @@ def get_chat_history(session_id: str, limit: Optional[int] = None) -> List[Dict[
     if limit:
         # Get N most recent messages (reversed to maintain chronological order)
         c.execute("""
-            SELECT * FROM (
-                SELECT role, content, timestamp, tokens
+            SELECT role, content, timestamp, tokens FROM (
+                SELECT id, role, content, timestamp, timestamp_ms, tokens
                 FROM messages
                 WHERE session_id = ?
-                ORDER BY timestamp DESC
+                ORDER BY timestamp_ms DESC, id DESC
                 LIMIT ?
             )
-            ORDER BY timestamp ASC
+            ORDER BY timestamp_ms ASC, id ASC
         """, (session_id, limit))
     else:
         # Get all messages
@@ -674,7 +1017,7 @@ def get_chat_history(session_id: str, limit: Optional[int] = None) -> List[Dict[
             SELECT role, content, timestamp, tokens
             FROM messages
             WHERE session_id = ?
-            ORDER BY timestamp ASC
+            ORDER BY timestamp_ms ASC, id ASC
         """, (session_id,))
 
     rows = c.fetchall()
@@ -683,27 +1026,47 @@ def get_chat_history(session_id: str, limit: Optional[int] = None) -> List[Dict[
 
 
 def add_message(session_id: str, role: str, content: str, tokens: int = 0) -> None:
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
+    add_messages(session_id, [(role, content, tokens)])
 
-    c.execute("INSERT OR IGNORE INTO sessions (id, title, created_at) VALUES (?, ?, ?)",
-              (session_id, f"Session {session_id[:8]}", now))
 
-    c.execute("INSERT INTO messages (session_id, role, content, tokens, timestamp) VALUES (?, ?, ?, ?, ?)",
-              (session_id, role, content, tokens, now))
+def add_messages(session_id: str, rows: List[Tuple[str, str, int]]) -> None:
+    """
+    Appends several (role, content, tokens) messages to a session in one transaction.
+    Rows share a timestamp; insertion order is preserved via the rowid tie-break.
+    """
+    if not rows:
+        return
+    t = time.time()
+    now = _now_iso(t)
+    now_ms = int(t * 1000)
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+
+        new_session = session_id not in _known_sessions
+        if new_session:
+            c.execute("INSERT OR IGNORE INTO sessions (id, title, created_at, created_at_ms) VALUES (?, ?, ?, ?)",
+                      (session_id, f"Session {session_id[:8]}", now, now_ms))
+
+        c.executemany("INSERT INTO messages (session_id, role, content, tokens, timestamp, timestamp_ms) VALUES (?, ?, ?, ?, ?, ?)",
+                      [(session_id, role, content, tokens, now, now_ms) for role, content, tokens in rows])
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+        conn.close()
+        # Only after the commit, so a failed insert is retried next time
+        if new_session:
+            _known_sessions.add(session_id)
 
 
 def update_session_title(session_id: str, title: str) -> None:
     """Update the title of a session."""
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
+        conn.commit()
+        conn.close()
 
 
 def get_session_title(session_id: str) -> Optional[str]:
@@ -718,14 +1081,16 @@ def get_session_title(session_id: str) -> Optional[str]:
 
 def delete_session(session_id: str) -> bool:
     """Delete session, its messages, and its RAG file records."""
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-    c.execute("DELETE FROM rag_files WHERE session_id = ?", (session_id,))
-    c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        c.execute("DELETE FROM rag_files WHERE session_id = ?", (session_id,))
+        c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        deleted = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        _known_sessions.discard(session_id)
     return deleted
 
 
@@ -738,24 +1103,25 @@ def rag_add_file(file_dict: Dict[str, Any]) -> None:
     Adds a RAG file record to the database.
     Expects a dict with keys: id, session_id, original_name, stored_path, mime, size_bytes, status, created_at
     """
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO rag_files (id, session_id, original_name, stored_path, mime, size_bytes, status, created_at, content_sha256)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        file_dict["id"],
-        file_dict["session_id"],
-        file_dict["original_name"],
-        file_dict["stored_path"],
-        file_dict.get("mime"),
-        file_dict.get("size_bytes"),
-        file_dict["status"],
-        file_dict["created_at"],
-        file_dict.get("content_sha256")
-    ))
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO rag_files (id, session_id, original_name, stored_path, mime, size_bytes, status, created_at, content_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            file_dict["id"],
+            file_dict["session_id"],
+            file_dict["original_name"],
+            file_dict["stored_path"],
+            file_dict.get("mime"),
+            file_dict.get("size_bytes"),
+            file_dict["status"],
+            file_dict["created_at"],
+            file_dict.get("content_sha256")
+        ))
+        conn.commit()
+        conn.close()
 
 
 def rag_list_files(session_id: str) -> List[Dict[str, Any]]:
@@ -823,12 +1189,13 @@ def rag_delete_file(file_id: str) -> bool:
     Deletes a RAG file record from the database by ID.
     Returns True if a row was deleted, False otherwise.
     """
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM rag_files WHERE id = ?", (file_id,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("DELETE FROM rag_files WHERE id = ?", (file_id,))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
@@ -837,17 +1204,18 @@ def rag_update_status(file_id: str, status: str) -> bool:
     Updates the status of a RAG file.
     Returns True if a row was updated, False otherwise.
     """
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE rag_files
-        SET status = ?, updated_at = ?
-        WHERE id = ?
-    """, (status, now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE rag_files
+            SET status = ?, updated_at = ?
+            WHERE id = ?
+        """, (status, now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
@@ -863,22 +1231,23 @@ def rag_update_extraction(
     Clears any previous error.
     Returns True if a row was updated, False otherwise.
     """
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE rag_files
-        SET extracted_path = ?,
-            page_count = ?,
-            char_count = ?,
-            status = ?,
-            error = NULL,
-            updated_at = ?
-        WHERE id = ?
-    """, (extracted_path, page_count, char_count, status, now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE rag_files
+            SET extracted_path = ?,
+                page_count = ?,
+                char_count = ?,
+                status = ?,
+                error = NULL,
+                updated_at = ?
+            WHERE id = ?
+        """, (extracted_path, page_count, char_count, status, now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
@@ -887,19 +1256,20 @@ def rag_set_error(file_id: str, error_message: str, status: str = "error") -> bo
     Sets error message and status for a RAG file.
     Returns True if a row was updated, False otherwise.
     """
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE rag_files
-        SET error = ?,
-            status = ?,
-            updated_at = ?
-        WHERE id = ?
-    """, (error_message, status, now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE rag_files
+            SET error = ?,
+                status = ?,
+                updated_at = ?
+            WHERE id = ?
+        """, (error_message, status, now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
@@ -916,23 +1286,24 @@ def rag_update_chunking(
     Clears any previous error.
     Returns True if a row was updated, False otherwise.
     """
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE rag_files
-        SET chunks_path = ?,
-            chunk_count = ?,
-            page_count = COALESCE(?, page_count),
-            char_count = COALESCE(?, char_count),
-            status = ?,
-            error = NULL,
-            updated_at = ?
-        WHERE id = ?
-    """, (chunks_path, chunk_count, page_count, char_count, status, now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE rag_files
+            SET chunks_path = ?,
+                chunk_count = ?,
+                page_count = COALESCE(?, page_count),
+                char_count = COALESCE(?, char_count),
+                status = ?,
+                error = NULL,
+                updated_at = ?
+            WHERE id = ?
+        """, (chunks_path, chunk_count, page_count, char_count, status, now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
@@ -948,74 +1319,77 @@ def rag_update_indexing(
     Clears any previous error.
     Returns True if a row was updated, False otherwise.
     """
-    now = datetime.utcnow().isoformat()
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE rag_files
-        SET vector_count = ?,
-            index_backend = ?,
-            index_collection = ?,
-            status = ?,
-            error = NULL,
-            indexed_at = ?
-        WHERE id = ?
-    """, (vector_count, index_backend, index_collection, status, now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    now = _now_iso()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE rag_files
+            SET vector_count = ?,
+                index_backend = ?,
+                index_collection = ?,
+                status = ?,
+                error = NULL,
+                indexed_at = ?
+            WHERE id = ?
+        """, (vector_count, index_backend, index_collection, status, now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
 
 
 def rag_get_session_settings(session_id: str) -> Dict[str, bool]:
     """Get or create RAG session settings."""
-    conn = _connect_db()
-    c = conn.cursor()
-    c.execute("SELECT rag_enabled, auto_index FROM rag_session_settings WHERE session_id = ?",
-              (session_id,))
-    row = c.fetchone()
-
-    if not row:
-        # Auto-create with defaults
-        now = datetime.utcnow().isoformat()
-        c.execute("INSERT INTO rag_session_settings (session_id, rag_enabled, auto_index, updated_at) VALUES (?, 1, 1, ?)",
-                  (session_id, now))
-        conn.commit()
-        result = {"rag_enabled": True, "auto_index": True}
-    else:
-        result = {"rag_enabled": bool(row[0]), "auto_index": bool(row[1])}
-
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        c.execute("SELECT rag_enabled, auto_index FROM rag_session_settings WHERE session_id = ?",
+                  (session_id,))
+        row = c.fetchone()
+
+        if not row:
+            # Auto-create with defaults
+            now = _now_iso()
+            c.execute("INSERT INTO rag_session_settings (session_id, rag_enabled, auto_index, updated_at) VALUES (?, 1, 1, ?)",
+                      (session_id, now))
+            conn.commit()
+            result = {"rag_enabled": True, "auto_index": True}
+        else:
+            result = {"rag_enabled": bool(row[0]), "auto_index": bool(row[1])}
+
+        conn.close()
     return result
 
 
 def rag_set_session_settings(session_id: str, rag_enabled: Optional[bool] = None, auto_index: Optional[bool] = None) -> Dict[str, bool]:
     """Update RAG session settings."""
-    conn = _connect_db()
-    c = conn.cursor()
-
-    # Get current values
-    c.execute("SELECT rag_enabled, auto_index FROM rag_session_settings WHERE session_id = ?", (session_id,))
-    row = c.fetchone()
-
-    if not row:
-        # Create row if missing
-        now = datetime.utcnow().isoformat()
-        c.execute("INSERT INTO rag_session_settings (session_id, rag_enabled, auto_index, updated_at) VALUES (?, 1, 1, ?)",
-                  (session_id, now))
-        current = {"rag_enabled": True, "auto_index": True}
-    else:
-        current = {"rag_enabled": bool(row[0]), "auto_index": bool(row[1])}
-
-    # Update changed values
-    new_rag_enabled = rag_enabled if rag_enabled is not None else current["rag_enabled"]
-    new_auto_index = auto_index if auto_index is not None else current["auto_index"]
-
-    now = datetime.utcnow().isoformat()
-    c.execute("UPDATE rag_session_settings SET rag_enabled = ?, auto_index = ?, updated_at = ? WHERE session_id = ?",
-              (int(new_rag_enabled), int(new_auto_index), now, session_id))
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+
+        # Get current values
+        c.execute("SELECT rag_enabled, auto_index FROM rag_session_settings WHERE session_id = ?", (session_id,))
+        row = c.fetchone()
+
+        if not row:
+            # Create row if missing
+            now = _now_iso()
+            c.execute("INSERT INTO rag_session_settings (session_id, rag_enabled, auto_index, updated_at) VALUES (?, 1, 1, ?)",
+                      (session_id, now))
+            current = {"rag_enabled": True, "auto_index": True}
+        else:
+            current = {"rag_enabled": bool(row[0]), "auto_index": bool(row[1])}
+
+        # Update changed values
+        new_rag_enabled = rag_enabled if rag_enabled is not None else current["rag_enabled"]
+        new_auto_index = auto_index if auto_index is not None else current["auto_index"]
+
+        now = _now_iso()
+        c.execute("UPDATE rag_session_settings SET rag_enabled = ?, auto_index = ?, updated_at = ? WHERE session_id = ?",
+                  (int(new_rag_enabled), int(new_auto_index), now, session_id))
+        conn.commit()
+        conn.close()
 
     return {"rag_enabled": new_rag_enabled, "auto_index": new_auto_index}
 
@@ -1027,12 +1401,13 @@ def rag_set_file_active(session_id: str, file_id: str, is_active: bool) -> bool:
     if not file_record or file_record["session_id"] != session_id:
         return False
 
-    conn = _connect_db()
-    c = conn.cursor()
-    now = datetime.utcnow().isoformat()
-    c.execute("UPDATE rag_files SET is_active = ?, updated_at = ? WHERE id = ?",
-              (int(is_active), now, file_id))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn = _connect_db()
+        c = conn.cursor()
+        now = _now_iso()
+        c.execute("UPDATE rag_files SET is_active = ?, updated_at = ? WHERE id = ?",
+                  (int(is_active), now, file_id))
+        rows = c.rowcount
+        conn.commit()
+        conn.close()
     return rows > 0
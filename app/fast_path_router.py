@@ -15,8 +15,11 @@ Caller contract:
 Text chat input must NEVER call try_fast_path.
 """
 
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 LIGHT_ENTITY = "light.rishi_room_light"
 
 ALLOWED_COLORS = [
@@ -69,7 +72,7 @@ def try_fast_path(text: str) -> dict | None:
 
     # 1. Toggle on
     if _TURN_ON_RE.search(normalized):
-        print("[FastPath] matched: toggle_on")
+        logger.debug("[FastPath] matched: toggle_on")
         return {
             "endpoint": f"{HA_BASE}/turn_on",
             "payload": {"entity_id": LIGHT_ENTITY},
@@ -77,7 +80,7 @@ def try_fast_path(text: str) -> dict | None:
 
     # 2. Toggle off
     if _TURN_OFF_RE.search(normalized):
-        print("[FastPath] matched: toggle_off")
+        logger.debug("[FastPath] matched: toggle_off")
         return {
             "endpoint": f"{HA_BASE}/turn_off",
             "payload": {"entity_id": LIGHT_ENTITY},
@@ -90,7 +93,7 @@ def try_fast_path(text: str) -> dict | None:
         value = int(raw)
         if not (0 <= value <= 100):
             return None
-        print(f"[FastPath] matched: brightness={value}")
+        logger.debug("[FastPath] matched: brightness=%s", value)
         return {
             "endpoint": f"{HA_BASE}/turn_on",
             "payload": {"entity_id": LIGHT_ENTITY, "brightness_pct": value},
@@ -101,7 +104,7 @@ def try_fast_path(text: str) -> dict | None:
     if m:
         color_raw = (m.group(1) or m.group(2) or "").strip()
         if color_raw in ALLOWED_COLORS:
-            print(f"[FastPath] matched: color={color_raw}")
+            logger.debug("[FastPath] matched: color=%s", color_raw)
             return {
                 "endpoint": f"{HA_BASE}/turn_on",
                 "payload": {"entity_id": LIGHT_ENTITY, "color_name": color_raw},
@@ -1,16 +1,18 @@
 # app/main.py
 import os
 import gc
+import io
 import json
 import re
 import time
 import shutil
 import asyncio
 import threading
-import sqlite3
+import concurrent.futures
 import logging
 from pathlib import Path
 from datetime import datetime, timezone
+from collections import OrderedDict, deque
 from typing import Union, List, Dict, Any, Optional
 
 from fastapi import FastAPI, HTTPException, File, UploadFile
@@ -19,9 +21,43 @@ from fastapi.staticfiles import StaticFiles
 import sys
 
 import psutil
+import aiofiles
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+# --- SOFT DEPENDENCY: orjson (SSE payloads + default JSON responses); falls back to stdlib json ---
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as _DefaultJSONResponse
+
+    _loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+
+    def _sse(obj: Any) -> bytes:
+        """One SSE event as bytes, ready for StreamingResponse (no re-encode)."""
+        return _SSE_PREFIX + orjson.dumps(obj) + _SSE_SUFFIX
+
+    def _sse_content(text: str) -> bytes:
+        """Equivalent to _sse({'content': text, 'stop': False}) without building the dict."""
+        return _CONTENT_PREFIX + orjson.dumps(text) + _CONTENT_SUFFIX
+except ImportError:
+    from fastapi.responses import JSONResponse as _DefaultJSONResponse
+
+    _loads = json.loads
+
+    def _sse(obj: Any) -> bytes:
+        """One SSE event as bytes, ready for StreamingResponse (no re-encode)."""
+        return _SSE_PREFIX + json.dumps(obj).encode() + _SSE_SUFFIX
+
+    def _sse_content(text: str) -> bytes:
+        """Equivalent to _sse({'content': text, 'stop': False}) without building the dict."""
+        return _CONTENT_PREFIX + json.dumps(text).encode() + _CONTENT_SUFFIX
+
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+# Token frames are the hot path: only the content string is serialized per frame
+_CONTENT_PREFIX = _SSE_PREFIX + b'{"content":'
+_CONTENT_SUFFIX = b',"stop":false}' + _SSE_SUFFIX
+
 # --- Resolve DATA_DIR and load secret.env FIRST, before any local imports ---
 # Local modules (voice.py, wakeword.py, assist.py) evaluate env-var constants at
 # import time, so dotenv must be loaded before those imports run.
@@ -56,6 +92,7 @@ except Exception:
 # --- Now safe to import local modules (env vars are set) ---
 from .setup_wizard import register_setup_wizard
 from .updater import register_updater
+from .smalltalk import is_smalltalk
 from .rag import register_rag
 from .assist import register_assist
 from .voice import register_voice
@@ -70,6 +107,21 @@ from .notes import register_notes
 # memory_core is the only memory module.
 from . import database, memory_core, tools, rag_vector
 
+# Memory key allow-lists, bound once (never mutated at runtime)
+_TIER_A_KEYS = frozenset(memory_core.TIER_A_KEYS)
+_AUTO_KEYS = frozenset(database.ALLOWED_AUTO_MEMORY_KEYS)
+
+# app_settings keys /tutorial/commit may write and /tutorial/reset clears
+_TUTORIAL_DEFAULT_KEYS = frozenset({
+    "default_model_name", "default_ctx_size", "default_max_tokens",
+    "default_temperature", "default_temp_profile", "default_system_prompt",
+    "web_search_mode", "web_search_provider", "web_search_custom_endpoint",
+    "theme", "accent_color",
+    "background_image", "background_opacity"
+})
+_SQL_CLEAR_TUTORIAL_DEFAULTS = "DELETE FROM app_settings WHERE key IN (%s)" % ",".join("?" * len(_TUTORIAL_DEFAULT_KEYS))
+_TUTORIAL_DEFAULT_KEYS_TUPLE = tuple(sorted(_TUTORIAL_DEFAULT_KEYS))
+
 # ------------------------------
 # llama.cpp Python binding
 # ------------------------------
@@ -139,36 +191,71 @@ INDEX_TEMPLATE_PATH = BASE_DIR / "templates" / "index.html"
 RESOURCE_STATIC_DIR = BASE_DIR / "static"      # bundled assets (read-only-ish)
 STATIC_DIR = DATA_DIR / "static"              # persistent copy (writeable)
 
+# Kept outside STATIC_DIR so it is never served under /static
+SEED_MANIFEST_FILE = DATA_DIR / "static_seed_manifest.json"
+
+# User-owned files that should not be overwritten
+USER_OWNED_FILES = {"wallpaper.bg"}
+
+
+def _scan_bundled_assets() -> Dict[str, list]:
+    """Maps each bundled asset's relative path to [size, mtime_ns]; changes after git pull or edits."""
+    manifest = {}
+    stack = [RESOURCE_STATIC_DIR]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                else:
+                    st = entry.stat()
+                    rel = os.path.relpath(entry.path, RESOURCE_STATIC_DIR).replace(os.sep, "/")
+                    manifest[rel] = [st.st_size, st.st_mtime_ns]
+    return manifest
+
+
 def _seed_static_assets():
     """
     Syncs shipped static assets from RESOURCE_STATIC_DIR into STATIC_DIR.
     Overwrites shipped assets to apply updates after git pull.
-    Preserves user-owned files (wallpaper.bg, .temp_user_name).
+    Preserves user-owned files (wallpaper.bg).
+    Only copies assets that changed since the manifest of the last sync,
+    or that have gone missing from STATIC_DIR.
     """
     STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    # Earlier builds kept the manifest inside the publicly served directory
+    (STATIC_DIR / ".seed_manifest.json").unlink(missing_ok=True)
     if not RESOURCE_STATIC_DIR.exists():
         return
 
-    # User-owned files that should not be overwritten
-    USER_OWNED_FILES = {"wallpaper.bg", ".temp_user_name"}
+    manifest = _scan_bundled_assets()
+    try:
+        previous = json.loads(SEED_MANIFEST_FILE.read_text("utf-8"))
+    except (OSError, ValueError):
+        previous = None  # No manifest yet: first run or pre-manifest install
+    if previous == manifest and all((STATIC_DIR / rel).exists() for rel in manifest):
+        return
 
-    for src in RESOURCE_STATIC_DIR.rglob("*"):
-        if src.is_dir():
-            continue
-        rel = src.relative_to(RESOURCE_STATIC_DIR)
-        dst = STATIC_DIR / rel
-
-        # Skip user-owned files to preserve them
-        if dst.name in USER_OWNED_FILES:
-            # Only copy if it doesn't exist (first-time setup)
-            if not dst.exists():
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src, dst)
-            continue
+    if not any(STATIC_DIR.iterdir()):
+        # Fresh install: one bulk copy of the whole bundled tree
+        shutil.copytree(RESOURCE_STATIC_DIR, STATIC_DIR, dirs_exist_ok=True)
+    else:
+        previous = previous or {}
+        for rel, sig in manifest.items():
+            dst = STATIC_DIR / rel
+
+            # Skip user-owned files to preserve them (only copy on first-time setup)
+            if dst.name in USER_OWNED_FILES:
+                if dst.exists():
+                    continue
+            # Unchanged shipped asset that is already in place
+            elif previous.get(rel) == sig and dst.exists():
+                continue
 
-        # Overwrite all other shipped assets (sync updates)
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(src, dst)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(RESOURCE_STATIC_DIR / rel, dst)
+
+    SEED_MANIFEST_FILE.write_text(json.dumps(manifest), "utf-8")
 
 _seed_static_assets()
 
@@ -178,14 +265,143 @@ _seed_static_assets()
 # ------------------------------
 current_model: Llama | None = None
 current_model_name: str | None = None
+current_model_key: tuple | None = None  # (model_name, n_gpu_layers, n_ctx)
+
+# Warm Model Cache
+# Recently replaced CPU-only models stay in RAM for instant switch-back.
+# GPU-offloaded models are always closed so they never pin VRAM.
+MAX_CACHED_MODELS = int(os.getenv("LOCALIS_MAX_CACHED_MODELS", "1"))
+_model_cache: "OrderedDict[tuple, Llama]" = OrderedDict()
+
+class _FifoLock:
+    """
+    Mutex that hands ownership to waiters in arrival order. threading.Lock wakes
+    an arbitrary waiter, so a request queued behind a long generation could be
+    overtaken again and again by newer ones.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters: deque = deque()
+        self._held = False
+
+    def acquire(self, blocking: bool = True) -> bool:
+        with self._cond:
+            if not self._held and not self._waiters:
+                self._held = True
+                return True
+            if not blocking:
+                return False
+            ticket = object()
+            self._waiters.append(ticket)
+            while self._held or self._waiters[0] is not ticket:
+                self._cond.wait()
+            self._waiters.popleft()
+            self._held = True
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._held = False
+            if self._waiters:
+                self._cond.notify_all()
+
+    def locked(self) -> bool:
+        return self._held
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
 
 # Global Inference Lock (Router + Gen)
-# Protects the shared llama-cpp-python instance from concurrent access
-MODEL_LOCK = threading.Lock()
+# Protects the shared llama-cpp-python instance from concurrent access.
+# FIFO so /chat, /tutorial/chat and finance requests are served in arrival order.
+MODEL_LOCK = _FifoLock()
+
+# Optional Dedicated Router Model (Pass 1 tool decision)
+# ROUTER_MODEL names a small .gguf in MODELS_DIR; it gets its own lock so tool
+# routing for one request can overlap generation for another.
+ROUTER_MODEL = os.getenv("ROUTER_MODEL") or None
+ROUTER_LOCK = threading.Lock()
+router_model: Llama | None = None
+
+# Global DB Write Lock
+# SQLite allows one writer at a time; queue writers here instead of
+# parking threadpool workers on the database lock.
+DB_WRITE_LOCK = asyncio.Lock()
+
+
+async def _db_write(fn, *args, **kwargs):
+    """Runs a blocking database write on a worker thread, one writer at a time."""
+    async with DB_WRITE_LOCK:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# Strong references to fire-and-forget write tasks (the loop only keeps weak ones)
+_pending_writes: set = set()
+
+
+# App Settings Read Cache (TTL)
+# key -> (expires_at, settings generation, value). Entries also expire when
+# database.set_app_setting/delete_app_setting bump the generation; raw SQL
+# writers here call _invalidate_settings() instead.
+SETTINGS_CACHE_TTL = 30.0
+_settings_cache: Dict[str, tuple] = {}
+_ALL_SETTINGS = object()  # cache key for get_all_app_settings()
+
+
+def _cached_lookup(cache_key, loader):
+    now = time.monotonic()
+    gen = database._settings_generation
+    hit = _settings_cache.get(cache_key)
+    if hit and hit[0] > now and hit[1] == gen:
+        return hit[2]
+    value = loader()
+    _settings_cache[cache_key] = (now + SETTINGS_CACHE_TTL, gen, value)
+    return value
+
+
+def _cached_setting(key: str) -> Optional[str]:
+    """database.get_app_setting() through the TTL cache."""
+    return _cached_lookup(key, lambda: database.get_app_setting(key))
+
+
+def _cached_all_settings() -> Dict[str, str]:
+    """database.get_all_app_settings() through the TTL cache (do not mutate)."""
+    return _cached_lookup(_ALL_SETTINGS, database.get_all_app_settings)
+
+
+def _invalidate_settings() -> None:
+    _settings_cache.clear()
 
 # Tutorial System Prompts (In-Memory, Session-Scoped)
-# Stores temporary system prompts for tutorial experimentation
-tutorial_prompts: Dict[str, str] = {}
+# Stores temporary system prompts for tutorial experimentation.
+# Capped LRU: sessions that are never committed must not accumulate forever.
+_TUTORIAL_PROMPTS_MAX = 1024
+tutorial_prompts: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _set_tutorial_prompt(session_id: str, prompt: str) -> None:
+    tutorial_prompts[session_id] = prompt
+    tutorial_prompts.move_to_end(session_id)
+    while len(tutorial_prompts) > _TUTORIAL_PROMPTS_MAX:
+        tutorial_prompts.popitem(last=False)
+
+
+# Fallbacks when neither a tutorial override nor a request prompt is set
+_DEBUG_SYS_PROMPT = "You are a helpful AI assistant."
+_TUTORIAL_SYS_PROMPT = "You are a helpful AI assistant explaining how to use this application."
+
+
+def _resolve_system_prompt(session_id: Optional[str], req_prompt: Optional[str] = None) -> Optional[str]:
+    """The session's tutorial prompt override, else the request's prompt, else None."""
+    return (session_id and tutorial_prompts.get(session_id)) or req_prompt or None
+
+# Questionnaire-provided user name, held until tutorial/commit
+_temp_user_name: Optional[str] = None
 
 # Predefined Tutorial Prompts
 PROMPT_DEFAULT = (
@@ -352,6 +568,11 @@ def get_permitted_tools(web_search_on: bool) -> list:
     return result
 
 
+_TOOL_CALL_RE = re.compile(r"<tool_call>(.*?)</tool_call>", re.DOTALL)
+_FUNCTION_TAG_RE = re.compile(r"<function=([^>]+)>")
+_PARAMETER_TAG_RE = re.compile(r"<parameter=([^>]+)>(.*?)</parameter>", re.DOTALL)
+
+
 def parse_raw_tool_calls(content: str) -> list[dict] | None:
     """
     Fallback parser for models that output tool calls as raw text instead of
@@ -367,9 +588,10 @@ def parse_raw_tool_calls(content: str) -> list[dict] | None:
         </function>
         </tool_call>
     """
-    import re as _re, json as _json
-    pattern = r"<tool_call>(.*?)</tool_call>"
-    matches = _re.findall(pattern, content, _re.DOTALL)
+    import json as _json
+    if "<tool_call>" not in content:
+        return None
+    matches = _TOOL_CALL_RE.findall(content)
     if not matches:
         return None
 
@@ -392,12 +614,12 @@ def parse_raw_tool_calls(content: str) -> list[dict] | None:
             pass
 
         # --- Format B: <function=name><parameter=key>val</parameter></function> ---
-        fn_match = _re.search(r"<function=([^>]+)>", raw)
+        fn_match = _FUNCTION_TAG_RE.search(raw)
         if not fn_match:
             continue
         func_name = fn_match.group(1).strip()
         params = {}
-        for pm in _re.finditer(r"<parameter=([^>]+)>(.*?)</parameter>", raw, _re.DOTALL):
+        for pm in _PARAMETER_TAG_RE.finditer(raw):
             params[pm.group(1).strip()] = pm.group(2).strip()
         tool_calls.append({
             "id": f"call_{i}",
@@ -411,6 +633,16 @@ def parse_raw_tool_calls(content: str) -> list[dict] | None:
     return tool_calls if tool_calls else None
 
 
+def _tool_call_args(tc: dict) -> dict:
+    """Decoded arguments of one tool call ({} if they are not valid JSON)."""
+    raw_args = tc["function"].get("arguments", "{}")
+    try:
+        args = _loads(raw_args) if isinstance(raw_args, str) else raw_args
+    except json.JSONDecodeError:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
 async def execute_tool_call(
     tool_name: str,
     tool_args: dict,
@@ -431,11 +663,11 @@ async def execute_tool_call(
             _time_keywords = {"next", "upcoming", "current", "latest", "today", "this week",
                               "schedule", "when is", "when are", "now"}
             if any(kw in query.lower() for kw in _time_keywords):
-                from datetime import datetime as _dtnow
-                _date_str = _dtnow.now().strftime("%B %d, %Y")
-                query = f"{query} {_date_str}"
-            provider = web_search_provider or database.get_app_setting("web_search_provider") or "auto"
-            endpoint = web_search_custom_endpoint or database.get_app_setting("web_search_custom_endpoint")
+                query = f"{query} {_local_date_str()}"
+            # Both keys come from one cached settings snapshot (a single query when cold)
+            settings = _cached_all_settings()
+            provider = web_search_provider or settings.get("web_search_provider") or "auto"
+            endpoint = web_search_custom_endpoint or settings.get("web_search_custom_endpoint")
             result = await tools.tool_web_search(
                 query=query, provider=provider,
                 custom_endpoint=endpoint, custom_api_key=web_search_custom_api_key
@@ -472,14 +704,18 @@ async def execute_tool_call(
             due_at = tool_args.get("due_at") or None
             note_id = str(_uuid.uuid4())
             now = _dt2.now(_tz2.utc).isoformat()
-            conn = _sqlite3.connect(database.DB_NAME)
-            conn.execute(
-                "INSERT INTO notes (id, content, note_type, due_at, color, pinned, dismissed, created_at, updated_at) "
-                "VALUES (?, ?, ?, ?, 'default', 0, 0, ?, ?)",
-                (note_id, content, note_type, due_at, now, now)
-            )
-            conn.commit()
-            conn.close()
+
+            def _insert_note():
+                conn = _sqlite3.connect(database.DB_NAME)
+                conn.execute(
+                    "INSERT INTO notes (id, content, note_type, due_at, color, pinned, dismissed, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'default', 0, 0, ?, ?)",
+                    (note_id, content, note_type, due_at, now, now)
+                )
+                conn.commit()
+                conn.close()
+
+            await _db_write(_insert_note)
             if note_type == "reminder" and due_at:
                 return f"Reminder set: \"{content}\" due {due_at}."
             return f"Note saved: \"{content}\"."
@@ -487,28 +723,33 @@ async def execute_tool_call(
         elif tool_name == "notes.retrieve":
             import sqlite3 as _sqlite3
             note_filter = tool_args.get("filter", "all")
-            conn = _sqlite3.connect(database.DB_NAME)
-            if note_filter == "reminders":
-                rows = conn.execute(
-                    "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
-                    "AND note_type='reminder' ORDER BY created_at DESC LIMIT 10"
-                ).fetchall()
-            elif note_filter == "notes":
-                rows = conn.execute(
-                    "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
-                    "AND note_type='note' ORDER BY created_at DESC LIMIT 10"
-                ).fetchall()
-            elif note_filter == "due_soon":
-                rows = conn.execute(
-                    "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
-                    "AND due_at IS NOT NULL ORDER BY due_at ASC LIMIT 10"
-                ).fetchall()
-            else:
-                rows = conn.execute(
-                    "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
-                    "ORDER BY created_at DESC LIMIT 10"
-                ).fetchall()
-            conn.close()
+
+            def _select_notes():
+                conn = _sqlite3.connect(database.DB_NAME)
+                if note_filter == "reminders":
+                    rows = conn.execute(
+                        "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
+                        "AND note_type='reminder' ORDER BY created_at DESC LIMIT 10"
+                    ).fetchall()
+                elif note_filter == "notes":
+                    rows = conn.execute(
+                        "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
+                        "AND note_type='note' ORDER BY created_at DESC LIMIT 10"
+                    ).fetchall()
+                elif note_filter == "due_soon":
+                    rows = conn.execute(
+                        "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
+                        "AND due_at IS NOT NULL ORDER BY due_at ASC LIMIT 10"
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT content, note_type, due_at FROM notes WHERE dismissed = 0 "
+                        "ORDER BY created_at DESC LIMIT 10"
+                    ).fetchall()
+                conn.close()
+                return rows
+
+            rows = await asyncio.to_thread(_select_notes)
             if not rows:
                 return "No notes found."
             parts = []
@@ -522,14 +763,15 @@ async def execute_tool_call(
         # --- Memory ---
         elif tool_name == "memory.retrieve":
             query = tool_args.get("query", user_msg)
-            return memory_core.tool_memory_retrieve(query=query, session_id=session_id)
+            return await asyncio.to_thread(memory_core.tool_memory_retrieve, query=query, session_id=session_id)
 
         elif tool_name == "memory.write":
             key = tool_args.get("key", "fact").strip()
             value = tool_args.get("value", "").strip()
             if not value:
                 return "Could not save memory — value was empty."
-            res = memory_core.tool_memory_write(
+            res = await _db_write(
+                memory_core.tool_memory_write,
                 session_id=session_id, key=key, value=value,
                 intent="preference", authority="user_explicit",
                 source="user", confidence=0.9,
@@ -618,25 +860,59 @@ NOTES_TOOL_SCHEMAS = [
 # ------------------------------
 # Helper Functions
 # ------------------------------
+def _close_model(model) -> None:
+    # Call close() if available for cleaner shutdown
+    if hasattr(model, 'close'):
+        try:
+            model.close()
+        except Exception as e:
+            logger.debug(f"[System] Model close() failed: {e}")
+
+
+def _trim_model_cache(limit: int) -> None:
+    """Closes least-recently-used cached models until at most `limit` remain. Caller holds MODEL_LOCK."""
+    if len(_model_cache) <= limit:
+        return
+    while len(_model_cache) > limit:
+        key, model = _model_cache.popitem(last=False)
+        logger.info(f"[System] Evicting cached model {key[0]}")
+        _close_model(model)
+        del model
+    gc.collect()
+
+
 def _load_model_internal(model_name: str, n_gpu_layers: int, n_ctx: int):
     """Internal logic to load a model."""
-    global current_model, current_model_name
+    global current_model, current_model_name, current_model_key
 
     path = MODELS_DIR / model_name
     if not path.exists():
         raise FileNotFoundError(f"Model {model_name} not found at {path}")
 
-    # Unload existing to free VRAM
+    key = (model_name, n_gpu_layers, n_ctx)
+
+    # Park (CPU-only) or unload (GPU, to free VRAM) the existing model
     if current_model:
-        logger.info("[System] Unloading previous model...")
-        # Call close() if available for cleaner shutdown
-        if hasattr(current_model, 'close'):
-            try:
-                current_model.close()
-            except Exception as e:
-                logger.debug(f"[System] Model close() failed: {e}")
-        del current_model
-        gc.collect()
+        if current_model_key and current_model_key[1] == 0 and MAX_CACHED_MODELS > 0:
+            logger.info(f"[System] Keeping {current_model_name} warm in RAM")
+            _model_cache[current_model_key] = current_model
+            _model_cache.move_to_end(current_model_key)
+            current_model = None
+            _trim_model_cache(MAX_CACHED_MODELS)
+        else:
+            logger.info("[System] Unloading previous model...")
+            _close_model(current_model)
+            del current_model
+            current_model = None
+            gc.collect()
+
+    cached = _model_cache.pop(key, None)
+    if cached is not None:
+        logger.info(f"[System] Reusing warm model {model_name}")
+        current_model = cached
+        current_model_name = model_name
+        current_model_key = key
+        return current_model_name
 
     # Check GPU backend availability
     gpu_available = False
@@ -677,6 +953,7 @@ def _load_model_internal(model_name: str, n_gpu_layers: int, n_ctx: int):
         verbose=DEBUG,  # Gate verbose output behind debug flag
     )
     current_model_name = model_name
+    current_model_key = key
 
     # Verify GPU usage after loading
     logger.info("[System] Model loaded successfully")
@@ -700,7 +977,7 @@ def _load_model_internal(model_name: str, n_gpu_layers: int, n_ctx: int):
 # ------------------------------
 # App & Lifecycle
 # ------------------------------
-app = FastAPI(title="Localis")
+app = FastAPI(title="Localis", default_response_class=_DefaultJSONResponse)
 app.state.debug = DEBUG  # Expose debug flag to frontend
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
@@ -726,6 +1003,23 @@ async def _startup():
     logger.info("[System] Initializing database...")
     database.init_db()
 
+    # Dedicated router model (optional, CPU-only so it never competes for VRAM)
+    global router_model
+    if ROUTER_MODEL:
+        router_path = MODELS_DIR / ROUTER_MODEL
+        try:
+            logger.info(f"[System] Loading router model {ROUTER_MODEL}")
+            router_model = await asyncio.to_thread(
+                Llama,
+                model_path=str(router_path),
+                n_gpu_layers=0,
+                n_ctx=int(os.getenv("ROUTER_CTX", "4096")),
+                verbose=DEBUG,
+            )
+        except Exception as e:
+            logger.warning(f"[System] Router model load failed ({e}); routing with the main model.")
+            router_model = None
+
     # Preload/warm embeddings at startup to avoid first-use latency.
     try:
         logger.info("[System] Preloading embedding model...")
@@ -803,6 +1097,8 @@ async def _startup():
 
 @app.on_event("shutdown")
 async def _shutdown():
+    _GEN_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    await tools.aclose_http_client()
     if _NVML_OK:
         try:
             _pynvml.nvmlShutdown()
@@ -887,16 +1183,39 @@ class AppSettingsRequest(BaseModel):
 # ------------------------------
 # Routes: UI & Static
 # ------------------------------
+# Rendered index.html bytes, re-read only when the template's mtime changes.
+# The stat itself is throttled to once per INDEX_RECHECK_SECONDS.
+INDEX_RECHECK_SECONDS = 2.0
+_index_cache: Dict[str, Any] = {"mtime": None, "checked": 0.0, "html": None}
+
+
+def _render_index() -> Optional[bytes]:
+    now = time.monotonic()
+    if _index_cache["html"] is not None and now - _index_cache["checked"] < INDEX_RECHECK_SECONDS:
+        return _index_cache["html"]
+    _index_cache["checked"] = now
+    try:
+        mtime = INDEX_TEMPLATE_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        _index_cache["mtime"] = _index_cache["html"] = None
+        return None
+    if mtime != _index_cache["mtime"]:
+        content = INDEX_TEMPLATE_PATH.read_text("utf-8")
+        voice_key = os.getenv("LOCALIS_VOICE_KEY", "")
+        if voice_key:
+            injection = f'<script>window._LOCALIS_VOICE_KEY={json.dumps(voice_key)};</script>\n'
+            content = content.replace("</head>", injection + "</head>", 1)
+        _index_cache["mtime"] = mtime
+        _index_cache["html"] = content.encode("utf-8")
+    return _index_cache["html"]
+
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_ui():
-    if not INDEX_TEMPLATE_PATH.exists():
+    html = _render_index()
+    if html is None:
         return HTMLResponse(content="Error: index.html not found in app/templates", status_code=404)
-    content = INDEX_TEMPLATE_PATH.read_text("utf-8")
-    voice_key = os.getenv("LOCALIS_VOICE_KEY", "")
-    if voice_key:
-        injection = f'<script>window._LOCALIS_VOICE_KEY={json.dumps(voice_key)};</script>\n'
-        content = content.replace("</head>", injection + "</head>", 1)
-    return HTMLResponse(content=content)
+    return HTMLResponse(content=html)
 
 
 # ------------------------------
@@ -906,15 +1225,15 @@ async def serve_ui():
 async def get_app_state():
     """Returns the current application state for frontend initialization."""
     # Logic matches startup: None -> True (legacy), "true" -> True, else False
-    tutorial_setting = database.get_app_setting("tutorial_completed")
+    # Get all settings and filter allowed keys
+    all_settings = _cached_all_settings()
+
+    tutorial_setting = all_settings.get("tutorial_completed")
     if tutorial_setting is None:
         tutorial_completed = True
     else:
         tutorial_completed = (tutorial_setting == "true")
 
-    # Get all settings and filter allowed keys
-    all_settings = database.get_all_app_settings()
-
     allowed_keys = {
         "default_model_name", "default_ctx_size", "default_max_tokens",
         "default_temperature", "default_temp_profile", "default_system_prompt",
@@ -931,23 +1250,34 @@ async def get_app_state():
         "models_dir_exists": MODELS_DIR.exists(),
         "debug": DEBUG,  # Expose debug flag to frontend
         "n_ctx": (current_model.n_ctx if current_model and hasattr(current_model, 'n_ctx')
-                  else int(database.get_app_setting('n_ctx') or 8192)),
+                  else int(all_settings.get('n_ctx') or 8192)),
     }
 
 
+# Cached MODELS_DIR listing, rebuilt when the directory mtime changes
+_models_cache: Dict[str, Any] = {"mtime": None, "data": []}
+
+
 @app.get("/models")
 async def list_models():
-    if not MODELS_DIR.exists():
+    try:
+        dir_mtime = MODELS_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
         return {"models": [], "current": current_model_name}
 
-    model_files = sorted([f for f in MODELS_DIR.glob("*.gguf")])
-    models_data = []
+    # Directory mtime changes whenever a model is added, removed or renamed
+    if _models_cache["mtime"] != dir_mtime:
+        models_data = []
+        with os.scandir(MODELS_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".gguf"):
+                    size_gb = round(entry.stat().st_size / (1024 * 1024 * 1024), 2)
+                    models_data.append({"name": entry.name, "size_gb": size_gb})
+        models_data.sort(key=lambda m: m["name"])
+        _models_cache["mtime"] = dir_mtime
+        _models_cache["data"] = models_data
 
-    for f in model_files:
-        size_gb = round(f.stat().st_size / (1024 * 1024 * 1024), 2)
-        models_data.append({"name": f.name, "size_gb": size_gb})
-
-    return {"models": models_data, "current": current_model_name}
+    return {"models": _models_cache["data"], "current": current_model_name}
 
 
 @app.post("/models/load")
@@ -957,9 +1287,13 @@ async def load_model_route(req: ModelLoadRequest):
     if current_model_name == req.model_name and current_model:
         return {"status": "ok", "loaded": req.model_name}
 
-    try:
+    def _locked_load():
         with MODEL_LOCK:
-            loaded_name = _load_model_internal(req.model_name, req.n_gpu_layers, req.n_ctx)
+            return _load_model_internal(req.model_name, req.n_gpu_layers, req.n_ctx)
+
+    try:
+        # Loading takes seconds and may wait on an in-flight generation
+        loaded_name = await asyncio.to_thread(_locked_load)
         return {"status": "success", "loaded": loaded_name}
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Model file not found")
@@ -971,20 +1305,18 @@ async def load_model_route(req: ModelLoadRequest):
 @app.post("/models/unload")
 async def unload_model_route():
     """Unload the current model to free resources."""
-    global current_model, current_model_name
+    global current_model, current_model_name, current_model_key
 
     with MODEL_LOCK:
+        # Unload means free everything, including warm cached models
+        _trim_model_cache(0)
         if current_model:
             logger.info("[System] Unloading model...")
-            # Call close() if available for cleaner shutdown
-            if hasattr(current_model, 'close'):
-                try:
-                    current_model.close()
-                except Exception as e:
-                    logger.debug(f"[System] Model close() failed: {e}")
+            _close_model(current_model)
             del current_model
             current_model = None
             current_model_name = None
+            current_model_key = None
             gc.collect()
             logger.info("[System] Model unloaded.")
             return {"status": "ok", "message": "Model unloaded"}
@@ -992,15 +1324,24 @@ async def unload_model_route():
             return {"status": "ok", "message": "No model was loaded"}
 
 
+WALLPAPER_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
 @app.post("/settings/wallpaper")
 async def upload_wallpaper(file: UploadFile = File(...)):
     """Handles background image upload."""
+    dest_path = STATIC_DIR / "wallpaper.bg"
+    tmp_path = dest_path.with_name(dest_path.name + ".tmp")
     try:
-        dest_path = STATIC_DIR / "wallpaper.bg"
-        with dest_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Chunked async copy keeps the event loop free during large uploads;
+        # the rename means /static never serves a half-written wallpaper.
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while chunk := await file.read(WALLPAPER_CHUNK_SIZE):
+                await out.write(chunk)
+        os.replace(tmp_path, dest_path)
         return {"url": f"/static/wallpaper.bg?v={int(time.time())}"}
     except Exception as e:
+        tmp_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
@@ -1016,7 +1357,7 @@ async def delete_wallpaper():
 @app.get("/settings/default-system-prompt")
 async def get_default_system_prompt():
     """Get the persisted default system prompt."""
-    prompt = database.get_app_setting("default_system_prompt")
+    prompt = _cached_setting("default_system_prompt")
     if prompt is None:
         prompt = PROMPT_DEFAULT
     return {"prompt": prompt}
@@ -1029,7 +1370,7 @@ async def save_default_system_prompt(req: SystemPromptRequest):
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty")
 
-    database.set_app_setting("default_system_prompt", prompt)
+    await _db_write(database.set_app_setting, "default_system_prompt", prompt)
     return {"status": "ok", "prompt": prompt}
 
 
@@ -1052,14 +1393,13 @@ async def save_system_prompt(req: SystemPromptRequest):
 
         # Use a default session ID for questionnaire-derived prompt
         temp_session_id = "__questionnaire_prompt__"
-        tutorial_prompts[temp_session_id] = prompt
+        _set_tutorial_prompt(temp_session_id, prompt)
 
-        # If name provided, attempt to store it in memory
-        # This requires a session context, so it's stored for later application
+        # If name provided, keep it in process memory until tutorial/commit
+        # (no disk write on the event loop, and nothing under /static)
         if name:
-            # Store in a temporary location that tutorial/commit can access
-            with open(STATIC_DIR / ".temp_user_name", "w") as f:
-                f.write(name)
+            global _temp_user_name
+            _temp_user_name = name
 
         return {
             "status": "ok",
@@ -1075,13 +1415,13 @@ async def save_system_prompt(req: SystemPromptRequest):
 # ------------------------------
 @app.get("/sessions")
 async def get_sessions():
-    return {"sessions": database.get_recent_sessions(20)}
+    return {"sessions": await asyncio.to_thread(database.get_recent_sessions, 20)}
 
 
 @app.delete("/sessions/{session_id}")
 async def delete_session_endpoint(session_id: str):
     # 1. Delete DB records (messages, rag_files, session row)
-    db_deleted = database.delete_session(session_id)
+    db_deleted = await _db_write(database.delete_session, session_id)
 
     # 2. Delete RAG files on disk
     rag_cleaned = False
@@ -1109,12 +1449,12 @@ async def delete_session_endpoint(session_id: str):
 
 @app.get("/history/{session_id}")
 async def get_history(session_id: str):
-    return database.get_chat_history(session_id)
+    return await asyncio.to_thread(database.get_chat_history, session_id)
 
 
 @app.get("/memory/events/{session_id}")
 async def get_memory_events(session_id: str):
-    return database.get_memory_events(session_id)
+    return await asyncio.to_thread(database.get_memory_events, session_id)
 
 
 # ------------------------------
@@ -1123,56 +1463,38 @@ async def get_memory_events(session_id: str):
 @app.get("/memory")
 async def get_all_memory():
     """Returns all Tier A and Tier B memories."""
-    # Assuming database module has these functions or helper logic
-    # Since database.py was not provided with these exact function names in the snippet,
-    # we will implement a direct query approach if needed or assume existence.
-    # The prompt implies adding memory endpoints for the UI.
-
-    # We'll use the existing generic fetchers if specific ones aren't available,
-    # but based on the prompt "database.get_core_user_memories_with_meta()",
-    # we will assume we need to implement this logic if it's missing or call it.
-    # Let's verify if database.py has them. If not, we'll query directly here for safety.
-
-    # Direct DB query implementation for robustness since we can't edit database.py here
-    conn = sqlite3.connect(database.DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
-    # Tier A (Identity)
-    c.execute("""
-        SELECT um.key, um.value, um.category, um.last_updated, meta.meta_json
-        FROM user_memory um
-        LEFT JOIN user_memory_meta meta ON um.key = meta.key
-        WHERE um.category = 'identity'
-    """)
-    tier_a_rows = c.fetchall()
-
-    # Tier B (Extended/Auto)
-    c.execute("""
-        SELECT um.key, um.value, um.category, um.last_updated, meta.meta_json
-        FROM user_memory um
-        LEFT JOIN user_memory_meta meta ON um.key = meta.key
-        WHERE um.category != 'identity'
-    """)
-    tier_b_rows = c.fetchall()
-    conn.close()
-
-    def format_rows(rows):
-        res = []
-        for r in rows:
-            d = dict(r)
-            if d.get("meta_json"):
-                try:
-                    d["meta"] = json.loads(d["meta_json"])
-                except:
-                    d["meta"] = {}
-            del d["meta_json"]
-            res.append(d)
-        return res
+    def _load_tiers():
+        # Pooled per-thread connection (WAL + tuned pragmas, see database._connect_db)
+        conn = database._connect_db()
+        c = conn.cursor()
+
+        # One pass over user_memory, bucketed by tier as rows stream in
+        c.execute("""
+            SELECT um.key, um.value, um.category, um.last_updated, meta.meta_json
+            FROM user_memory um
+            LEFT JOIN user_memory_meta meta ON um.key = meta.key
+        """)
+        tier_a, tier_b = [], []
+        while rows := c.fetchmany(256):
+            for key, value, category, last_updated, meta_json in rows:
+                d = {"key": key, "value": value, "category": category, "last_updated": last_updated}
+                if meta_json:
+                    try:
+                        d["meta"] = _loads(meta_json)
+                    except:
+                        d["meta"] = {}
+                if category == "identity":
+                    tier_a.append(d)
+                elif category is not None:  # SQL "!= 'identity'" never matched NULL
+                    tier_b.append(d)
+        conn.close()
+        return tier_a, tier_b
+
+    tier_a, tier_b = await asyncio.to_thread(_load_tiers)
 
     return {
-        "tier_a": format_rows(tier_a_rows),
-        "tier_b": format_rows(tier_b_rows)
+        "tier_a": tier_a,
+        "tier_b": tier_b
     }
 
 
@@ -1191,10 +1513,11 @@ async def upsert_memory(req: MemoryUpsertRequest):
     if target == "tier_a":
         # Enforce key in Tier A allow-list
         safe_key = database._safe_key(key)
-        if safe_key not in memory_core.TIER_A_KEYS:
+        if safe_key not in _TIER_A_KEYS:
              raise HTTPException(status_code=400, detail=f"Key '{key}' is not allowed in Tier A (Identity).")
 
-        res = memory_core.tool_memory_write(
+        res = await _db_write(
+            memory_core.tool_memory_write,
             session_id="ui_edit",
             key=safe_key,
             value=value,
@@ -1209,10 +1532,11 @@ async def upsert_memory(req: MemoryUpsertRequest):
     elif target == "tier_b":
         safe_key = database._safe_key(key)
         # Allow misc fallback
-        if safe_key not in database.ALLOWED_AUTO_MEMORY_KEYS:
+        if safe_key not in _AUTO_KEYS:
             safe_key = "misc"
 
-        res = memory_core.tool_memory_write(
+        res = await _db_write(
+            memory_core.tool_memory_write,
             session_id="ui_edit",
             key=safe_key,
             value=value,
@@ -1234,7 +1558,7 @@ async def delete_memory_endpoint(key: str):
     """
     Delete a specific memory key.
     """
-    success = memory_core.forget_memory(key, session_id="ui_delete")
+    success = await _db_write(memory_core.forget_memory, key, session_id="ui_delete")
     return {"ok": success}
 
 
@@ -1255,16 +1579,11 @@ async def debug_context_endpoint(
     if limit < 1 or limit > 50:
         raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
 
-    # Resolve system prompt (same logic as /chat)
-    # Check tutorial_prompts override first, then fallback to default
-    global tutorial_prompts
-    if session_id in tutorial_prompts:
-        system_prompt_text = tutorial_prompts[session_id]
-    else:
-        system_prompt_text = "You are a helpful AI assistant."
+    # Resolve system prompt: tutorial_prompts override first, then fallback to default
+    system_prompt_text = _resolve_system_prompt(session_id) or _DEBUG_SYS_PROMPT
 
     # Load history (same as /chat uses database.get_chat_history)
-    full_history = database.get_chat_history(session_id)
+    full_history = await asyncio.to_thread(database.get_chat_history, session_id)
 
     # Cap history to limit to avoid huge responses
     if len(full_history) > limit:
@@ -1273,7 +1592,8 @@ async def debug_context_endpoint(
         capped_history = full_history
 
     # Build messages via memory_core.build_chat_context_v2 (same call signature as /chat)
-    messages = memory_core.build_chat_context_v2(
+    messages = await asyncio.to_thread(
+        memory_core.build_chat_context_v2,
         session_id=session_id,
         system_prompt=system_prompt_text,
         chat_messages=capped_history,
@@ -1281,13 +1601,13 @@ async def debug_context_endpoint(
     )
 
     # Get generation parameters from app settings or use defaults
-    default_max_tokens_str = database.get_app_setting("default_max_tokens")
+    default_max_tokens_str = _cached_setting("default_max_tokens")
     try:
         max_tokens = int(default_max_tokens_str) if default_max_tokens_str else 1024
     except ValueError:
         max_tokens = 1024
 
-    default_temperature_str = database.get_app_setting("default_temperature")
+    default_temperature_str = _cached_setting("default_temperature")
     try:
         temperature = float(default_temperature_str) if default_temperature_str else 0.7
     except ValueError:
@@ -1297,7 +1617,7 @@ async def debug_context_endpoint(
     top_p = 0.95
 
     # Get ctx_size from settings (same as startup logic)
-    default_ctx_str = database.get_app_setting("default_ctx_size")
+    default_ctx_str = _cached_setting("default_ctx_size")
     try:
         ctx_size = int(default_ctx_str) if default_ctx_str else 4096
     except ValueError:
@@ -1315,6 +1635,222 @@ async def debug_context_endpoint(
     }
 
 
+# ------------------------------
+# Time Context (cached per local minute)
+# ------------------------------
+_time_context_cache: tuple = (-1, "", "")  # (epoch minute, system prompt line, date string)
+
+
+def _time_context() -> tuple:
+    """Returns (system prompt line, date string), re-formatted only when the minute changes."""
+    global _time_context_cache
+    t = time.time()
+    minute = int(t // 60)
+    if _time_context_cache[0] != minute:
+        now = time.localtime(t)
+        line = f"\n\nCurrent date and time: {time.strftime('%A, %B %d, %Y %H:%M', now)}"
+        _time_context_cache = (minute, line, time.strftime("%B %d, %Y", now))
+    return _time_context_cache[1:]
+
+
+def _time_context_line() -> str:
+    return _time_context()[0]
+
+
+def _local_date_str() -> str:
+    return _time_context()[1]
+
+
+# ------------------------------
+# Token Estimates (stored with each message)
+# ------------------------------
+# Short texts are tokenized exactly (cached); longer ones use a chars/token
+# ratio calibrated by exactly tokenizing one in CALIBRATE_EVERY long texts
+# (Pass 1's prompt_tokens can't be used: they include the tool schemas).
+# Call off the event loop (e.g. inside a _db_write function): tokenizing takes
+# MODEL_LOCK, but only if it is free, so a running generation never delays it.
+EXACT_TOKENIZE_MAX_BYTES = 64
+TOKEN_COUNT_CACHE_MAX = 4096
+CALIBRATE_EVERY = 8
+CALIBRATE_SAMPLE_CHARS = 4096
+_chars_per_token = 3.0
+_long_texts_seen = 0
+_token_count_cache: "OrderedDict[tuple, int]" = OrderedDict()  # (model_name, text bytes) -> count
+
+
+def _exact_token_count(model: Llama, model_name: str, text_bytes: bytes) -> int:
+    """Caller holds MODEL_LOCK, so model and model_name belong to the same load."""
+    key = (model_name, text_bytes)
+    count = _token_count_cache.get(key)
+    if count is None:
+        count = len(model.tokenize(text_bytes, add_bos=False))
+        _token_count_cache[key] = count
+        if len(_token_count_cache) > TOKEN_COUNT_CACHE_MAX:
+            _token_count_cache.popitem(last=False)
+    else:
+        _token_count_cache.move_to_end(key)
+    return count
+
+
+def _estimate_tokens(text: str) -> int:
+    global _long_texts_seen
+    text_bytes = text.encode("utf-8")
+    exact = len(text_bytes) < EXACT_TOKENIZE_MAX_BYTES
+    if not exact:
+        _long_texts_seen += 1
+    # The first long text calibrates straight away, then every CALIBRATE_EVERY-th
+    sample = not exact and _long_texts_seen % CALIBRATE_EVERY == 1
+    if (exact or sample) and MODEL_LOCK.acquire(blocking=False):
+        try:
+            # Model swaps happen under MODEL_LOCK, so these two reads agree
+            model, model_name = current_model, current_model_name
+            if model is not None:
+                if exact:
+                    return _exact_token_count(model, model_name, text_bytes)
+                _sample_token_ratio(model, text)
+        except Exception:
+            pass
+        finally:
+            MODEL_LOCK.release()
+    return int(len(text) / _chars_per_token)
+
+
+def _sample_token_ratio(model: Llama, text: str) -> None:
+    """Tokenizes (a prefix of) one long text and folds it into the ratio. Caller holds MODEL_LOCK."""
+    sample = text[:CALIBRATE_SAMPLE_CHARS]
+    _calibrate_token_ratio(len(sample), len(model.tokenize(sample.encode("utf-8"), add_bos=False)))
+
+
+def _add_counted_message(session_id: str, role: str, content: str) -> None:
+    """database.add_message with the token estimate computed on the writer thread."""
+    database.add_message(session_id, role, content, _estimate_tokens(content))
+
+
+def _calibrate_token_ratio(char_count: int, token_count: int) -> None:
+    """Folds one observed (chars, tokens) sample into the running chars/token ratio."""
+    global _chars_per_token
+    if char_count > 0 and token_count > 0:
+        _chars_per_token = 0.9 * _chars_per_token + 0.1 * (char_count / token_count)
+
+
+# ------------------------------
+# Slash Commands (/confirm, /reject)
+# ------------------------------
+def _parse_confirm(arg: str) -> Optional[Dict[str, str]]:
+    parts = arg.split("=", 1)
+    if len(parts) == 2:
+        return {"cmd": "confirm", "key": parts[0].strip(), "value": parts[1].strip()}
+    return None
+
+
+def _parse_reject(arg: str) -> Optional[Dict[str, str]]:
+    # Allow /reject key or /reject key=value
+    key = arg.strip().split("=")[0].strip()
+    return {"cmd": "reject", "key": key}
+
+
+# Lowercased prefix (including trailing space) -> parser of the remainder
+_SLASH_COMMANDS = {
+    "/confirm ": _parse_confirm,
+    "/reject ": _parse_reject,
+}
+_SLASH_PREFIX_LENGTHS = sorted({len(p) for p in _SLASH_COMMANDS}, reverse=True)
+_SLASH_PREFIX_MAX = _SLASH_PREFIX_LENGTHS[0]
+
+
+# ------------------------------
+# Token Streaming (SSE batching)
+# ------------------------------
+# Tokens are coalesced into one SSE frame per batch: a batch is flushed once
+# it holds N tokens or the interval since the last flush has elapsed.
+SSE_BATCH_TOKENS = int(os.getenv("LOCALIS_SSE_BATCH_TOKENS", "8"))
+SSE_BATCH_MS = float(os.getenv("LOCALIS_SSE_BATCH_MS", "20"))
+TUTORIAL_SSE_BATCH_TOKENS = int(os.getenv("LOCALIS_TUTORIAL_SSE_BATCH_TOKENS", "4"))
+TUTORIAL_SSE_BATCH_MS = float(os.getenv("LOCALIS_TUTORIAL_SSE_BATCH_MS", "10"))
+# Undrained batches a stream may buffer before generation waits for the client
+SSE_CHANNEL_MAX_ITEMS = int(os.getenv("LOCALIS_SSE_CHANNEL_MAX_ITEMS", "64"))
+
+
+def _batched_deltas(stream, max_tokens: int, max_ms: float):
+    """Yields (text, token_count) batches from a llama-cpp completion stream."""
+    interval = max_ms / 1000.0
+    buf: List[str] = []
+    last_flush = time.monotonic()
+    for chunk in stream:
+        content = chunk["choices"][0]["delta"].get("content", "")
+        if not content:
+            continue
+        buf.append(content)
+        now = time.monotonic()
+        if len(buf) >= max_tokens or now - last_flush >= interval:
+            yield "".join(buf), len(buf)
+            buf.clear()
+            last_flush = now
+    if buf:
+        yield "".join(buf), len(buf)
+
+
+# Long-lived streaming workers shared by /chat and /tutorial/chat. MODEL_LOCK
+# serializes generation, so two threads are enough to overlap one stream
+# with the next request's setup.
+_GEN_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="llama-gen")
+
+
+class _TokenChannel:
+    """
+    Hands items from a generation thread to the event loop. Items collect in a
+    deque and the loop is woken once per drain, not once per item, so a burst
+    of batches costs a single call_soon_threadsafe.
+
+    The deque is bounded: when a slow client lets `maxsize` items pile up, put()
+    blocks the generation thread until the consumer drains. Once the consumer
+    has gone away it must close() the channel; put() then returns False so the
+    worker stops generating and releases MODEL_LOCK.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = SSE_CHANNEL_MAX_ITEMS):
+        self._loop = loop
+        self._items: deque = deque()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._ready = asyncio.Event()
+        self._wakeup_pending = False
+        self._closed = False
+
+    def put(self, item) -> bool:
+        """Called from the worker thread. Returns False once the consumer has closed."""
+        with self._lock:
+            while len(self._items) >= self._maxsize and not self._closed:
+                self._space.wait()
+            if self._closed:
+                return False
+            self._items.append(item)
+            if self._wakeup_pending:
+                return True
+            self._wakeup_pending = True
+        self._loop.call_soon_threadsafe(self._ready.set)
+        return True
+
+    async def drain(self) -> list:
+        """Waits for at least one wakeup, then takes everything queued so far."""
+        await self._ready.wait()
+        with self._lock:
+            self._ready.clear()
+            self._wakeup_pending = False
+            items = list(self._items)
+            self._items.clear()
+            self._space.notify_all()
+        return items
+
+    def close(self) -> None:
+        """Called by the consumer when it stops draining (done or disconnected)."""
+        with self._lock:
+            self._closed = True
+            self._items.clear()
+            self._space.notify_all()
+
+
 # ------------------------------
 # Routes: Chat
 # ------------------------------
@@ -1329,9 +1865,6 @@ async def chat_endpoint(req: ChatRequest):
     session_id = req.session_id
     user_msg = req.message.strip()
 
-    # 0. Log User Message
-    database.add_message(session_id, "user", user_msg, len(user_msg) // 3)
-
     # Fast-path: voice-sourced HA light commands bypass LLM entirely
     if req.input_mode == "voice":
         from .fast_path_router import try_fast_path
@@ -1349,14 +1882,23 @@ async def chat_endpoint(req: ChatRequest):
                 except Exception as e:
                     logger.error(f"[FastPath] HA call failed: {e}")
                     reply = "Could not reach Home Assistant."
-            database.add_message(session_id, "assistant", reply, 1)
+            # Log the user turn and the canned reply together in one transaction
+            def _log_fast_path():
+                database.add_messages(session_id, [
+                    ("user", user_msg, _estimate_tokens(user_msg)),
+                    ("assistant", reply, 1),
+                ])
+            await _db_write(_log_fast_path)
             async def _fp_stream():
-                yield f"data: {json.dumps({'content': reply, 'stop': False})}\n\n"
-                yield f"data: {json.dumps({'content': '', 'stop': True})}\n\n"
+                yield _sse_content(reply)
+                yield _sse({'content': '', 'stop': True})
             return StreamingResponse(_fp_stream(), media_type="text/event-stream")
 
+    # 0. Log User Message
+    await _db_write(_add_counted_message, session_id, "user", user_msg)
+
     # Auto-title: only if this is a new session with the default title
-    current_title = database.get_session_title(session_id)
+    current_title = await asyncio.to_thread(database.get_session_title, session_id)
     default_pattern = f"Session {session_id[:8]}"
     if current_title and (current_title == default_pattern or current_title.startswith("Session ")):
         # Sanitize: strip newlines, collapse whitespace
@@ -1368,23 +1910,23 @@ async def chat_endpoint(req: ChatRequest):
                 title = clean_msg
         else:
             title = "New chat"
-        database.update_session_title(session_id, title)
+        await _db_write(database.update_session_title, session_id, title)
 
     # 1. Handle Slash Commands - Fast Path
-    # We now handle /confirm and /reject manually here since memory_core might not support them yet.
-    cmd = memory_core.parse_memory_command(user_msg)
-
-    # Custom parsing for new commands if memory_core didn't catch them
-    if not cmd:
-        if user_msg.lower().startswith("/confirm "):
-            parts = user_msg[9:].split("=", 1)
-            if len(parts) == 2:
-                cmd = {"cmd": "confirm", "key": parts[0].strip(), "value": parts[1].strip()}
-        elif user_msg.lower().startswith("/reject "):
-            # Allow /reject key or /reject key=value
-            raw = user_msg[8:].strip()
-            key = raw.split("=")[0].strip()
-            cmd = {"cmd": "reject", "key": key}
+    # Plain messages skip all command parsing.
+    cmd = None
+    if user_msg.startswith("/"):
+        cmd = memory_core.parse_memory_command(user_msg)
+
+        # /confirm and /reject are handled here since memory_core doesn't parse them.
+        # Only the short prefix is lowercased, never the whole message.
+        if not cmd:
+            head = user_msg[:_SLASH_PREFIX_MAX].lower()
+            for n in _SLASH_PREFIX_LENGTHS:
+                parser = _SLASH_COMMANDS.get(head[:n])
+                if parser:
+                    cmd = parser(user_msg[n:])
+                    break
 
     if cmd:
         async def cmd_stream():
@@ -1392,7 +1934,7 @@ async def chat_endpoint(req: ChatRequest):
             if cmd["cmd"] == "remember":
                 proposal = memory_core.propose_memory_write(user_msg, session_id)
                 if proposal:
-                    success = memory_core.apply_memory_write(proposal, session_id)
+                    success = await _db_write(memory_core.apply_memory_write, proposal, session_id)
                     key_display = proposal.key if proposal.key else "misc"
                     msg = f"✅ **Memory Saved**\n- Key: `{key_display}`\n- Value: {proposal.content}"
                     if not success:
@@ -1401,7 +1943,7 @@ async def chat_endpoint(req: ChatRequest):
                     msg = "❌ Could not interpret memory command."
 
             elif cmd["cmd"] == "forget":
-                success = memory_core.forget_memory(cmd["key"], session_id)
+                success = await _db_write(memory_core.forget_memory, cmd["key"], session_id)
                 msg = (
                     f"🗑️ **Memory Deleted**\n- Key: `{cmd['key']}`"
                     if success
@@ -1413,11 +1955,12 @@ async def chat_endpoint(req: ChatRequest):
                 val = cmd["value"]
                 # Strict check: Confirm only allows Tier-A keys?
                 # Or we assume user knows what they are doing. Let's enforce Tier-A check as per spec.
-                if key in memory_core.TIER_A_KEYS:
+                if key in _TIER_A_KEYS:
                     old_val = database.get_user_memory_value(key)
 
                     # Force write to Tier A
-                    res = memory_core.tool_memory_write(
+                    res = await _db_write(
+                        memory_core.tool_memory_write,
                         session_id=session_id,
                         key=key,
                         value=val,
@@ -1439,11 +1982,11 @@ async def chat_endpoint(req: ChatRequest):
 
             elif cmd["cmd"] == "reject":
                 # Log event
-                database.add_memory_event("user_reject_proposal", {"key": cmd["key"]}, session_id)
+                await _db_write(database.add_memory_event, "user_reject_proposal", {"key": cmd["key"]}, session_id)
                 msg = "🚫 **Proposal Rejected.** No changes made."
 
-            yield f"data: {json.dumps({'content': msg, 'stop': True})}\n\n"
-            database.add_message(session_id, "assistant", msg, len(msg) // 3)
+            yield _sse({'content': msg, 'stop': True})
+            await _db_write(_add_counted_message, session_id, "assistant", msg)
 
         return StreamingResponse(
             cmd_stream(),
@@ -1458,54 +2001,59 @@ async def chat_endpoint(req: ChatRequest):
     tier_a_proposals = []
     # Limit history to 20 most recent messages for faster loading in long sessions
     MAX_HISTORY_MESSAGES = 20
-    history = database.get_chat_history(session_id, limit=MAX_HISTORY_MESSAGES)
+    history = await asyncio.to_thread(database.get_chat_history, session_id, limit=MAX_HISTORY_MESSAGES)
+    # The newest row is the current user turn (passed separately as user_prompt).
+    # history is this request's own list, so drop it in place instead of slicing a copy.
+    if history:
+        history.pop()
 
     # ---------------------------------------------------------
     # 4. Build Final Context
     # ---------------------------------------------------------
 
-    # Check for tutorial-specific system prompt first
-    global tutorial_prompts
-    if session_id in tutorial_prompts:
-        system_prompt_text = tutorial_prompts[session_id]
-        logger.debug(f"[Chat] Using tutorial system prompt for session {session_id}")
-    elif req.system_prompt:
-        system_prompt_text = req.system_prompt
-    else:
-        # Use persisted default from app settings
-        system_prompt_text = database.get_app_setting("default_system_prompt") or PROMPT_DEFAULT
-
-    # Prepend current datetime so model can anchor time-sensitive queries and tool calls
-    from datetime import datetime as _dt
-    _now_str = _dt.now().strftime("%A, %B %d, %Y %H:%M")
-    system_prompt_text = f"Current date and time: {_now_str}\n\n{system_prompt_text}"
+    # Tutorial-specific system prompt first, then the request's, then the
+    # persisted default from app settings
+    system_prompt_text = (
+        _resolve_system_prompt(session_id, req.system_prompt)
+        or _cached_setting("default_system_prompt")
+        or PROMPT_DEFAULT
+    )
 
     # Core Context Builder (Identity + History + User)
-    messages = memory_core.build_chat_context_v2(
+    # Off the event loop: reads memory tables and may embed the prompt
+    messages = await asyncio.to_thread(
+        memory_core.build_chat_context_v2,
         session_id=session_id,
         system_prompt=system_prompt_text,
-        chat_messages=history[:-1] if history else [],
+        chat_messages=history,
         user_prompt=user_msg,
     )
 
     # -------------------------------------------------------
     # 3. Auto-inject RAG context (passive — unchanged)
     # -------------------------------------------------------
-    session_rag_files = database.rag_list_files(session_id)
+    rag_block = ""
+    session_rag_files = await asyncio.to_thread(database.rag_list_files, session_id)
     has_indexed = any(
         f.get("status") in ("chunked", "indexed") and f.get("is_active") != 0
         for f in session_rag_files
     )
     if has_indexed:
         try:
-            rag_hits = rag_vector.query(session_id, user_msg, top_k=4, data_dir=DATA_DIR, truncate_chars=None)
+            rag_hits = await asyncio.to_thread(
+                rag_vector.query, session_id, user_msg, top_k=4, data_dir=DATA_DIR, truncate_chars=None
+            )
             if rag_hits:
-                rag_block = rag_vector.build_rag_context_block(rag_hits)
-                if messages and messages[0].get("role") == "system":
-                    messages[0]["content"] += "\n\n" + rag_block
+                rag_block = "\n\n" + rag_vector.build_rag_context_block(rag_hits)
         except Exception as e:
             logger.warning(f"[RAG] Auto-inject failed: {e}")
 
+    # Current datetime so model can anchor time-sensitive queries and tool calls.
+    # Appended after the static system prompt + identity (not prepended) so that
+    # prefix stays token-identical across requests and llama.cpp reuses its KV.
+    # The system prompt is several KB: build the suffixed string in one join.
+    messages[0]["content"] = "".join((messages[0]["content"], _time_context_line(), rag_block))
+
     # -------------------------------------------------------
     # 4. Think mode — Pass 1 always uses /no_think to avoid
     #    interference with tool-call detection (Qwen3.5 bug).
@@ -1538,20 +2086,23 @@ async def chat_endpoint(req: ChatRequest):
     # -------------------------------------------------------
     async def event_stream():
         loop = asyncio.get_running_loop()
-        full_parts: List[str] = []
+        full_buf = io.StringIO()  # assistant reply, written once per streamed frame
         _gen_stats: dict = {}  # filled with tokens_per_second, tokens_generated before stop
 
         # Emit any Tier-A memory proposals first
         for prop in tier_a_proposals:
             prop["target"] = "tier_a"
-            yield f"data: {json.dumps({'content': '', 'stop': False, 'proposal': prop})}\n\n"
+            yield _sse({'content': '', 'stop': False, 'proposal': prop})
 
         # --- Pass 1: Tool Decision (non-streaming) ---
-        pass1_response = None
-        _t_pass1_start = loop.time()
-        try:
-            with MODEL_LOCK:
-                pass1_response = current_model.create_chat_completion(
+        # Runs on a worker thread; the locks are threading locks, taken there.
+        # With a dedicated router model, Pass 1 only routes and never answers.
+        _router = router_model
+        _p1_model, _p1_lock = (_router, ROUTER_LOCK) if _router else (current_model, MODEL_LOCK)
+
+        def _run_pass1():
+            with _p1_lock:
+                return _p1_model.create_chat_completion(
                     messages=messages,
                     tools=permitted_tools if permitted_tools else None,
                     tool_choice="auto" if permitted_tools else None,
@@ -1561,51 +2112,72 @@ async def chat_endpoint(req: ChatRequest):
                     presence_penalty=1.5,
                     stream=False,
                 )
-        except Exception as e:
-            logger.error(f"[Chat] Pass 1 failed: {e}", exc_info=True)
-            yield f"data: {json.dumps({'content': f'Model error: {e}', 'stop': True})}\n\n"
-            return
-
-        _t_pass1_end = loop.time()
-        choice = pass1_response["choices"][0]
-        finish_reason = choice.get("finish_reason")
-        assistant_message = choice.get("message", {})
-        # Capture Pass 1 token stats for direct-answer path
-        _p1_usage = pass1_response.get("usage", {})
-        _p1_completion_tokens = _p1_usage.get("completion_tokens", 0)
-        _p1_elapsed = max(_t_pass1_end - _t_pass1_start, 0.001)
 
-        if req.think_mode:
-            raw_content = assistant_message.get("content") or ""
-            has_think = "<think>" in raw_content or "<thinking>" in raw_content
-            logger.debug(f"[Chat] think_mode: content_len={len(raw_content)}, has_think_tags={has_think}, finish_reason={finish_reason}")
-
-        # Resolve tool_calls: prefer structured, fallback to raw text parser
-        tool_calls = None
-        if finish_reason == "tool_calls" and assistant_message.get("tool_calls"):
-            tool_calls = assistant_message["tool_calls"]
+        # Small talk ("hi", "thanks", "2+2") never needs a tool: skip the
+        # decision pass and stream the answer from the main model directly.
+        _skip_router = is_smalltalk(user_msg)
+        if _skip_router:
+            logger.debug("[Chat] Small talk: skipping Pass 1 tool decision")
+            finish_reason = None
+            tool_calls = None
+            assistant_message = {}
         else:
-            raw_content = assistant_message.get("content") or ""
-            tool_calls = parse_raw_tool_calls(raw_content)
-            if tool_calls:
-                finish_reason = "tool_calls"
-                logger.debug(f"[Chat] Parsed {len(tool_calls)} raw tool call(s) from content text")
+            pass1_response = None
+            _t_pass1_start = loop.time()
+            try:
+                pass1_response = await asyncio.to_thread(_run_pass1)
+            except Exception as e:
+                logger.error(f"[Chat] Pass 1 failed: {e}", exc_info=True)
+                yield _sse({'content': f'Model error: {e}', 'stop': True})
+                return
+
+            _t_pass1_end = loop.time()
+            choice = pass1_response["choices"][0]
+            finish_reason = choice.get("finish_reason")
+            assistant_message = choice.get("message", {})
+            # Capture Pass 1 token stats for direct-answer path
+            _p1_usage = pass1_response.get("usage", {})
+            _p1_completion_tokens = _p1_usage.get("completion_tokens", 0)
+            _p1_elapsed = max(_t_pass1_end - _t_pass1_start, 0.001)
+
+            if req.think_mode:
+                raw_content = assistant_message.get("content") or ""
+                has_think = "<think>" in raw_content or "<thinking>" in raw_content
+                logger.debug(f"[Chat] think_mode: content_len={len(raw_content)}, has_think_tags={has_think}, finish_reason={finish_reason}")
+
+            # Resolve tool_calls: prefer structured, fallback to raw text parser
+            tool_calls = None
+            if finish_reason == "tool_calls" and assistant_message.get("tool_calls"):
+                tool_calls = assistant_message["tool_calls"]
+            else:
+                raw_content = assistant_message.get("content") or ""
+                tool_calls = parse_raw_tool_calls(raw_content)
+                if tool_calls:
+                    finish_reason = "tool_calls"
+                    logger.debug(f"[Chat] Parsed {len(tool_calls)} raw tool call(s) from content text")
 
         if finish_reason == "tool_calls" and tool_calls:
 
-            # Emit tool_start events so frontend can animate pills immediately
+            # Identical calls (same name + arguments) run once; every duplicate
+            # tool_call_id still gets the shared result in the Pass 2 context.
+            unique_calls: Dict[tuple, tuple] = {}
+            call_sigs = []
             for tc in tool_calls:
-                yield f"data: {json.dumps({'event_type': 'tool_start', 'tool': tc['function']['name']})}\n\n"
+                name = tc["function"]["name"]
+                args = _tool_call_args(tc)
+                sig = (name, json.dumps(args, sort_keys=True))
+                unique_calls.setdefault(sig, (name, args))
+                call_sigs.append(sig)
+            if len(unique_calls) < len(tool_calls):
+                logger.debug(f"[Chat] Skipping {len(tool_calls) - len(unique_calls)} duplicate tool call(s)")
+
+            # Emit tool_start events so frontend can animate pills immediately
+            for name, _args in unique_calls.values():
+                yield _sse({'event_type': 'tool_start', 'tool': name})
 
             # Execute all tool calls in parallel (MODEL_LOCK is NOT held here)
-            async def _run_one(tc):
-                name = tc["function"]["name"]
-                try:
-                    raw_args = tc["function"].get("arguments", "{}")
-                    args = json.loads(raw_args) if isinstance(raw_args, str) else raw_args
-                except json.JSONDecodeError:
-                    args = {}
-                result_str = await execute_tool_call(
+            async def _run_one(name, args):
+                return await execute_tool_call(
                     tool_name=name,
                     tool_args=args,
                     user_msg=user_msg,
@@ -1614,13 +2186,13 @@ async def chat_endpoint(req: ChatRequest):
                     web_search_custom_endpoint=getattr(req, 'web_search_custom_endpoint', None),
                     web_search_custom_api_key=getattr(req, 'web_search_custom_api_key', None),
                 )
-                return tc["id"], name, result_str
 
-            tool_results = await asyncio.gather(*[_run_one(tc) for tc in tool_calls])
+            results = await asyncio.gather(*[_run_one(name, args) for name, args in unique_calls.values()])
+            result_by_sig = dict(zip(unique_calls, results))
 
             # Emit tool_result events for frontend pill rendering
-            for _tc_id, name, result_str in tool_results:
-                yield f"data: {json.dumps({'event_type': 'tool_result', 'tool': name, 'results': [{'snippet': result_str[:300]}]})}\n\n"
+            for (name, _args), result_str in zip(unique_calls.values(), results):
+                yield _sse({'event_type': 'tool_result', 'tool': name, 'results': [{'snippet': result_str[:300]}]})
 
             # Build Pass 2 context: assistant tool-call turn + tool result messages
             # For raw-text tool calls (fallback parser), build a proper structured message
@@ -1628,18 +2200,21 @@ async def chat_endpoint(req: ChatRequest):
                 messages.append(assistant_message)
             else:
                 messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
-            for tc_id, name, result_str in tool_results:
+            for tc, sig in zip(tool_calls, call_sigs):
                 messages.append({
                     "role": "tool",
-                    "tool_call_id": tc_id,
-                    "content": result_str,
+                    "tool_call_id": tc["id"],
+                    "content": result_by_sig[sig],
                 })
 
             pass2_msgs = messages
 
         else:
             # No tool calls
-            if req.think_mode:
+            if _router or _skip_router:
+                # Router output is only a decision (or there was none); the main model writes the answer
+                pass2_msgs = _messages_pre_suffix if req.think_mode else messages
+            elif req.think_mode:
                 # Re-run as a real streaming pass on clean messages (model generates thinking naturally)
                 pass2_msgs = _messages_pre_suffix
             else:
@@ -1648,8 +2223,8 @@ async def chat_endpoint(req: ChatRequest):
                 chunk_size = 4
                 for i in range(0, len(content), chunk_size):
                     chunk = content[i:i + chunk_size]
-                    full_parts.append(chunk)
-                    yield f"data: {json.dumps({'content': chunk, 'stop': False})}\n\n"
+                    full_buf.write(chunk)
+                    yield _sse_content(chunk)
                     await asyncio.sleep(0)  # yield to event loop so each chunk flushes
                 _gen_stats = {
                     'tokens_per_second': round(_p1_completion_tokens / _p1_elapsed, 1),
@@ -1659,7 +2234,7 @@ async def chat_endpoint(req: ChatRequest):
 
         # Run Pass 2 streaming (shared by tool-call path and think-mode direct path)
         if pass2_msgs is not None:
-            queue: asyncio.Queue = asyncio.Queue()
+            channel = _TokenChannel(loop)
 
             def _gen_pass2():
                 try:
@@ -1672,31 +2247,43 @@ async def chat_endpoint(req: ChatRequest):
                             presence_penalty=1.5,
                             stream=True,
                         )
-                        for chunk in stream:
-                            delta = chunk["choices"][0]["delta"]
-                            content = delta.get("content", "")
-                            if content:
-                                loop.call_soon_threadsafe(queue.put_nowait, content)
-                        loop.call_soon_threadsafe(queue.put_nowait, None)  # sentinel
+                        for batch in _batched_deltas(stream, SSE_BATCH_TOKENS, SSE_BATCH_MS):
+                            if not channel.put(batch):
+                                break  # client went away
+                        channel.put(None)  # sentinel
                 except Exception as e:
-                    loop.call_soon_threadsafe(queue.put_nowait, Exception(str(e)))
+                    channel.put(Exception(str(e)))
 
-            import threading as _threading
-            t = _threading.Thread(target=_gen_pass2, daemon=True)
-            t.start()
+            _GEN_EXECUTOR.submit(_gen_pass2)
 
             _t_p2_start = loop.time()
-            while True:
-                item = await queue.get()
-                if item is None:
-                    break
-                if isinstance(item, Exception):
-                    yield f"data: {json.dumps({'content': f'Generation error: {item}', 'stop': True})}\n\n"
-                    return
-                full_parts.append(item)
-                yield f"data: {json.dumps({'content': item, 'stop': False})}\n\n"
+            _p2_tokens = 0
+            try:
+                done = False
+                while not done:
+                    # One SSE frame per drain, however many batches arrived meanwhile
+                    texts: List[str] = []
+                    error = None
+                    for item in await channel.drain():
+                        if item is None:
+                            done = True
+                            break
+                        if isinstance(item, Exception):
+                            error = item
+                            break
+                        text, n_tokens = item
+                        texts.append(text)
+                        _p2_tokens += n_tokens
+                    if texts:
+                        text = "".join(texts)
+                        full_buf.write(text)
+                        yield _sse_content(text)
+                    if error is not None:
+                        yield _sse({'content': f'Generation error: {error}', 'stop': True})
+                        return
+            finally:
+                channel.close()  # unblocks the worker if the client disconnected
             _t_p2_elapsed = max(loop.time() - _t_p2_start, 0.001)
-            _p2_tokens = sum(len(p) // 4 for p in full_parts)
             _gen_stats = {
                 'tokens_per_second': round(_p2_tokens / _t_p2_elapsed, 1),
                 'tokens_generated': _p2_tokens,
@@ -1704,19 +2291,23 @@ async def chat_endpoint(req: ChatRequest):
 
         # Emit stats event before stop so frontend can display tps
         if _gen_stats:
-            yield f"data: {json.dumps({'event_type': 'stats', 'stats': _gen_stats})}\n\n"
+            yield _sse({'event_type': 'stats', 'stats': _gen_stats})
 
         # Terminal stop event
-        full_response = "".join(full_parts)
+        full_response = full_buf.getvalue()
         if req.think_mode:
             logger.debug(f"[Chat] think Pass2 full_response repr: {repr(full_response[:200])}")
         completion_tokens = _gen_stats.get('tokens_generated') or len(full_response) // 4
-        yield f"data: {json.dumps({'content': '', 'stop': True, 'usage': {'prompt_tokens': prompt_token_count, 'completion_tokens': completion_tokens}})}\n\n"
 
-        # Persist assistant message (non-blocking)
-        await asyncio.to_thread(
-            database.add_message, session_id, "assistant", full_response, len(full_response) // 4
-        )
+        # Persist assistant message concurrently with the stop frame. As a task it
+        # also completes if the client disconnects once it has the stop frame.
+        persist = asyncio.create_task(_db_write(
+            database.add_message, session_id, "assistant", full_response, completion_tokens
+        ))
+        _pending_writes.add(persist)
+        persist.add_done_callback(_pending_writes.discard)
+        yield _sse({'content': '', 'stop': True, 'usage': {'prompt_tokens': prompt_token_count, 'completion_tokens': completion_tokens}})
+        await persist
 
     return StreamingResponse(
         event_stream(),
@@ -1745,13 +2336,7 @@ async def tutorial_chat_endpoint(req: TutorialChatRequest):
     messages = []
 
     # 1. System Prompt (Determine based on session_id lookup or fallback chain)
-    global tutorial_prompts
-    if req.session_id and req.session_id in tutorial_prompts:
-        sys_prompt = tutorial_prompts[req.session_id]
-    elif req.system_prompt:
-        sys_prompt = req.system_prompt
-    else:
-        sys_prompt = "You are a helpful AI assistant explaining how to use this application."
+    sys_prompt = _resolve_system_prompt(req.session_id, req.system_prompt) or _TUTORIAL_SYS_PROMPT
 
     messages.append({"role": "system", "content": sys_prompt})
 
@@ -1770,7 +2355,7 @@ async def tutorial_chat_endpoint(req: TutorialChatRequest):
     # Stream Response (Standard SSE format)
     async def event_stream():
         loop = asyncio.get_running_loop()
-        queue: asyncio.Queue = asyncio.Queue()
+        channel = _TokenChannel(loop)
 
         error_sent = False # Prevent double stop
 
@@ -1786,39 +2371,45 @@ async def tutorial_chat_endpoint(req: TutorialChatRequest):
                         stream=True,
                     )
 
-                    for chunk in stream:
-                        delta = chunk["choices"][0]["delta"]
-                        content = delta.get("content", "")
-                        if not content:
-                            continue
-                        loop.call_soon_threadsafe(queue.put_nowait, ("data", content))
+                    for text, _n in _batched_deltas(stream, TUTORIAL_SSE_BATCH_TOKENS, TUTORIAL_SSE_BATCH_MS):
+                        if not channel.put(("data", text)):
+                            break  # client went away
 
-                loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+                channel.put(("done", None))
 
             except Exception as e:
-                loop.call_soon_threadsafe(queue.put_nowait, ("error", str(e)))
-                loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+                channel.put(("error", str(e)))
+                channel.put(("done", None))
 
-        threading.Thread(target=_gen_worker, daemon=True).start()
+        _GEN_EXECUTOR.submit(_gen_worker)
 
-        while True:
-            kind, payload = await queue.get()
-
-            if kind == "data":
-                yield f"data: {json.dumps({'content': payload, 'stop': False})}\n\n"
-                continue
-
-            if kind == "error":
-                error_sent = True
-                yield f"data: {json.dumps({'content': f'[Error: {payload}]', 'stop': True})}\n\n"
-                break # Stop loop immediately on error
-
-            if kind == "done":
-                break
+        try:
+            done = False
+            while not done:
+                # One SSE frame per drain, however many batches arrived meanwhile
+                texts = []
+                error = None
+                for kind, payload in await channel.drain():
+                    if kind == "data":
+                        texts.append(payload)
+                        continue
+
+                    done = True
+                    if kind == "error":
+                        error = payload
+                    break # Stop on error or done
+
+                if texts:
+                    yield _sse_content("".join(texts))
+                if error is not None:
+                    error_sent = True
+                    yield _sse({'content': f'[Error: {error}]', 'stop': True})
+        finally:
+            channel.close()  # unblocks the worker if the client disconnected
 
         # Final stop event only if we didn't already send one via error
         if not error_sent:
-            yield f"data: {json.dumps({'content': '', 'stop': True})}\n\n"
+            yield _sse({'content': '', 'stop': True})
 
     return StreamingResponse(
         event_stream(),
@@ -1845,7 +2436,7 @@ async def tutorial_swap_prompt_endpoint(req: TutorialSwapPromptRequest):
         raise HTTPException(status_code=400, detail="session_id and prompt_text are required")
 
     # Store in session-specific temporary storage
-    tutorial_prompts[session_id] = prompt_text
+    _set_tutorial_prompt(session_id, prompt_text)
 
     logger.debug(f"[Tutorial] Swapped system prompt for session {session_id}: {prompt_text[:50]}...")
 
@@ -1855,6 +2446,32 @@ async def tutorial_swap_prompt_endpoint(req: TutorialSwapPromptRequest):
 # ------------------------------
 # Routes: Tutorial Commit
 # ------------------------------
+# Keeps created_at from the first write; only meta_json/last_updated change
+_SQL_UPSERT_MEMORY_META = """
+    INSERT INTO user_memory_meta (key, meta_json, created_at, last_updated)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        meta_json=excluded.meta_json, last_updated=excluded.last_updated
+"""
+
+# Every tutorial-committed key carries the same metadata, serialized once here
+_TUTORIAL_TIER_A_META = json.dumps({
+    "authority": "user_explicit",
+    "source": "user",
+    "intent": "identity",
+    "origin_session_id": "tutorial_init",
+    "reason": "tutorial_commit"
+})
+_TUTORIAL_TIER_B_META = json.dumps({
+    "authority": "user_explicit",
+    "source": "user",
+    "intent": "preference",
+    "origin_session_id": "tutorial_init",
+    "reason": "tutorial_commit",
+    "confidence": 1.0
+})
+
+
 @app.post("/tutorial/commit")
 async def tutorial_commit_endpoint(req: TutorialCommitRequest):
     """
@@ -1876,10 +2493,14 @@ async def tutorial_commit_endpoint(req: TutorialCommitRequest):
             raise HTTPException(status_code=400, detail=f"Empty value for Tier A key: {k}")
 
         safe_key = database._safe_key(k)
-        if safe_key not in memory_core.TIER_A_KEYS:
+        if safe_key not in _TIER_A_KEYS:
             raise HTTPException(status_code=400, detail=f"Unauthorized Tier A key: {safe_key}")
         validated_tier_a[safe_key] = v.strip()
 
+    # The questionnaire may have supplied the name without it reaching tier_a
+    if "preferred_name" not in validated_tier_a and _temp_user_name:
+        validated_tier_a["preferred_name"] = _temp_user_name
+
     # B) Tier B Validation
     validated_tier_b = []
     seen_keys = set()  # Track duplicate keys to prevent overwrites
@@ -1896,7 +2517,7 @@ async def tutorial_commit_endpoint(req: TutorialCommitRequest):
 
         safe_key = database._safe_key(raw_key)
         # Fallback to misc if not an allowed key
-        if safe_key not in database.ALLOWED_AUTO_MEMORY_KEYS:
+        if safe_key not in _AUTO_KEYS:
             safe_key = "misc"
 
         # Check for duplicates in this commit payload
@@ -1907,19 +2528,12 @@ async def tutorial_commit_endpoint(req: TutorialCommitRequest):
         validated_tier_b.append({"key": safe_key, "value": raw_val.strip()})
 
     # C) Defaults Validation (Allow-list)
-    ALLOWED_DEFAULTS = {
-        "default_model_name", "default_ctx_size", "default_max_tokens",
-        "default_temperature", "default_temp_profile", "default_system_prompt",
-        "web_search_mode", "web_search_provider", "web_search_custom_endpoint",
-        "theme", "accent_color",
-        "background_image", "background_opacity"
-    }
     validated_defaults = {}
     for k, v in req.defaults.items():
         # Skip default_system_prompt - tutorial prompt swapping shouldn't affect actual default
         if k == "default_system_prompt":
             continue
-        if k in ALLOWED_DEFAULTS and v is not None:
+        if k in _TUTORIAL_DEFAULT_KEYS and v is not None:
             if isinstance(v, (dict, list, bool)):
                 validated_defaults[k] = json.dumps(v)
             else:
@@ -1930,103 +2544,74 @@ async def tutorial_commit_endpoint(req: TutorialCommitRequest):
     # ------------------------------
     logger.info("[Tutorial] Committing results (Atomic)...")
 
-    conn = sqlite3.connect(database.DB_NAME)
-    cursor = conn.cursor()
+    def _commit_tx():
+        # Pooled WAL connection; _WRITE_LOCK serializes it with database.py writers
+        with database._WRITE_LOCK:
+            return _commit_on(database._connect_db())
 
-    try:
-        # Start Transaction explicitly
-        cursor.execute("BEGIN")
-        now = datetime.utcnow().isoformat()
+    def _commit_on(conn):
+        cursor = conn.cursor()
 
-        # A) Write Tier A (Identity)
-        for k, v in validated_tier_a.items():
-            # user_memory
-            cursor.execute("""
+        try:
+            # Start Transaction explicitly
+            cursor.execute("BEGIN")
+            now = datetime.utcnow().isoformat()
+
+            # A) Write Tier A (Identity)
+            cursor.executemany("""
                 INSERT INTO user_memory (key, value, category, last_updated)
                 VALUES (?, ?, 'identity', ?)
                 ON CONFLICT(key) DO UPDATE SET
                     value=excluded.value, category='identity', last_updated=excluded.last_updated
-            """, (k, v, now))
-
-            # user_memory_meta
-            meta = {
-                "authority": "user_explicit",
-                "source": "user",
-                "intent": "identity",
-                "origin_session_id": "tutorial_init",
-                "reason": "tutorial_commit"
-            }
-            meta_json = json.dumps(meta)
-
-            cursor.execute("SELECT 1 FROM user_memory_meta WHERE key = ?", (k,))
-            if cursor.fetchone():
-                cursor.execute("UPDATE user_memory_meta SET meta_json = ?, last_updated = ? WHERE key = ?", (meta_json, now, k))
-            else:
-                cursor.execute("INSERT INTO user_memory_meta (key, meta_json, created_at, last_updated) VALUES (?, ?, ?, ?)", (k, meta_json, now, now))
-
-        # B) Write Tier B (Preferences/Facts)
-        for item in validated_tier_b:
-            k = item["key"]
-            v = item["value"]
+            """, [(k, v, now) for k, v in validated_tier_a.items()])
+            cursor.executemany(
+                _SQL_UPSERT_MEMORY_META,
+                [(k, _TUTORIAL_TIER_A_META, now, now) for k in validated_tier_a],
+            )
 
-            # user_memory
-            cursor.execute("""
+            # B) Write Tier B (Preferences/Facts)
+            cursor.executemany("""
                 INSERT INTO user_memory (key, value, category, last_updated)
                 VALUES (?, ?, 'auto', ?)
                 ON CONFLICT(key) DO UPDATE SET
                     value=excluded.value, category='auto', last_updated=excluded.last_updated
-            """, (k, v, now))
-
-            # user_memory_meta
-            meta = {
-                "authority": "user_explicit",
-                "source": "user",
-                "intent": "preference",
-                "origin_session_id": "tutorial_init",
-                "reason": "tutorial_commit",
-                "confidence": 1.0
-            }
-            meta_json = json.dumps(meta)
-
-            cursor.execute("SELECT 1 FROM user_memory_meta WHERE key = ?", (k,))
-            if cursor.fetchone():
-                cursor.execute("UPDATE user_memory_meta SET meta_json = ?, last_updated = ? WHERE key = ?", (meta_json, now, k))
-            else:
-                cursor.execute("INSERT INTO user_memory_meta (key, meta_json, created_at, last_updated) VALUES (?, ?, ?, ?)", (k, meta_json, now, now))
+            """, [(item["key"], item["value"], now) for item in validated_tier_b])
+            cursor.executemany(
+                _SQL_UPSERT_MEMORY_META,
+                [(item["key"], _TUTORIAL_TIER_B_META, now, now) for item in validated_tier_b],
+            )
 
-        # C) Write Defaults (App Settings)
-        for k, v in validated_defaults.items():
-            cursor.execute("""
+            # C) Write Defaults (App Settings) + D) Mark Tutorial Complete
+            settings_rows = [(k, v, now) for k, v in validated_defaults.items()]
+            settings_rows.append(("tutorial_completed", "true", now))
+            cursor.executemany("""
                 INSERT INTO app_settings (key, value, last_updated)
                 VALUES (?, ?, ?)
                 ON CONFLICT(key) DO UPDATE SET
                     value=excluded.value, last_updated=excluded.last_updated
-            """, (k, v, now))
+            """, settings_rows)
 
-        # D) Mark Tutorial Complete
-        cursor.execute("""
-            INSERT INTO app_settings (key, value, last_updated)
-            VALUES ('tutorial_completed', 'true', ?)
-            ON CONFLICT(key) DO UPDATE SET
-                value='true', last_updated=?
-        """, (now, now))
+            conn.commit()
+            _invalidate_settings()
+            database.mark_user_memory_changed()
+            logger.info("[Tutorial] Commit success.")
 
-        conn.commit()
-        logger.info("[Tutorial] Commit success.")
+            # Clear all tutorial prompts and questionnaire state (session cleanup)
+            global tutorial_prompts, _temp_user_name
+            tutorial_prompts.clear()
+            _temp_user_name = None
+            logger.debug("[Tutorial] Cleared tutorial prompts.")
 
-        # Clear all tutorial prompts (session cleanup)
-        global tutorial_prompts
-        tutorial_prompts.clear()
-        logger.debug("[Tutorial] Cleared tutorial prompts.")
+            return {"status": "ok"}
 
-        return {"status": "ok"}
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"[Tutorial] Commit Failed (Rollback): {e}")
+            raise HTTPException(status_code=500, detail=f"Commit failed: {str(e)}")
+        finally:
+            conn.close()
 
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"[Tutorial] Commit Failed (Rollback): {e}")
-        raise HTTPException(status_code=500, detail=f"Commit failed: {str(e)}")
-    finally:
-        conn.close()
+    return await _db_write(_commit_tx)
 
 
 # ------------------------------
@@ -2040,43 +2625,40 @@ async def tutorial_reset_endpoint():
     """
     logger.info("[Tutorial] Resetting tutorial state...")
 
-    # Allow-list of keys to clear (same as Commit allow-list)
-    KEYS_TO_CLEAR = [
-        "default_model_name", "default_ctx_size", "default_max_tokens",
-        "default_temperature", "default_temp_profile", "default_system_prompt",
-        "web_search_mode", "web_search_provider", "web_search_custom_endpoint",
-        "theme", "accent_color",
-        "background_image", "background_opacity"
-    ]
+    def _reset_tx():
+        # Pooled WAL connection; _WRITE_LOCK serializes it with database.py writers
+        with database._WRITE_LOCK:
+            return _reset_on(database._connect_db())
 
-    conn = None
-    try:
-        conn = sqlite3.connect(database.DB_NAME)
-        cursor = conn.cursor()
+    def _reset_on(conn):
+        try:
+            cursor = conn.cursor()
 
-        # 1. Reset Completion Flag
-        now = datetime.utcnow().isoformat()
-        cursor.execute("""
-            INSERT INTO app_settings (key, value, last_updated)
-            VALUES ('tutorial_completed', 'false', ?)
-            ON CONFLICT(key) DO UPDATE SET
-                value='false', last_updated=?
-        """, (now, now))
+            # 1. Reset Completion Flag
+            now = datetime.utcnow().isoformat()
+            cursor.execute("""
+                INSERT INTO app_settings (key, value, last_updated)
+                VALUES ('tutorial_completed', 'false', ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value='false', last_updated=?
+            """, (now, now))
 
-        # 2. Clear Default Settings
-        placeholders = ','.join('?' for _ in KEYS_TO_CLEAR)
-        cursor.execute(f"DELETE FROM app_settings WHERE key IN ({placeholders})", KEYS_TO_CLEAR)
+            # 2. Clear Default Settings
+            # Same allow-list as commit
+            cursor.execute(_SQL_CLEAR_TUTORIAL_DEFAULTS, _TUTORIAL_DEFAULT_KEYS_TUPLE)
 
-        conn.commit()
-        return {"status": "ok", "message": "Tutorial reset complete."}
+            conn.commit()
+            _invalidate_settings()
+            return {"status": "ok", "message": "Tutorial reset complete."}
 
-    except Exception as e:
-        logger.error(f"[Tutorial] Reset Error: {e}")
-        raise HTTPException(status_code=500, detail=f"Reset failed: {str(e)}")
-    finally:
-        if conn:
+        except Exception as e:
+            logger.error(f"[Tutorial] Reset Error: {e}")
+            raise HTTPException(status_code=500, detail=f"Reset failed: {str(e)}")
+        finally:
             conn.close()
 
+    return await _db_write(_reset_tx)
+
 
 # ------------------------------
 # Routes: Server Control
@@ -2165,9 +2747,10 @@ async def get_api_settings():
         "fin_onboarding_done",
         "default_model",
     ]
+    all_settings = _cached_all_settings()
     result = {}
     for key in keys:
-        val = database.get_app_setting(key)
+        val = all_settings.get(key)
         if val is not None:
             result[key] = val
     return result
@@ -2193,6 +2776,6 @@ async def post_api_settings(req: AppSettingsRequest):
         updates["default_model"] = req.default_model.strip()
 
     for key, value in updates.items():
-        database.set_app_setting(key, value)
+        await _db_write(database.set_app_setting, key, value)
 
     return {"status": "ok", "updated": list(updates.keys())}
@@ -16,15 +16,23 @@ TIER-A (Identity): Core profile (preferred_name, location, timezone, language_pr
 TIER-B (Extended): Auto-learned facts, interests, projects, preferences
 """
 
+import atexit
+import bisect
+import functools
+import itertools
 import logging
+import os
+import queue
 import threading
 from dataclasses import dataclass
 from datetime import datetime
 import re
 import json
 import hashlib
+import heapq
 import time
-from typing import Dict, List, Optional, Set, Literal, Any, Union, Tuple
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Literal, Any, Union, Tuple
 
 from . import database
 
@@ -39,6 +47,16 @@ except ImportError:
     NUMPY_AVAILABLE = False
     logger.warning("[Memory] 'numpy' not found. Vector memory disabled.")
 
+# --- PRECOMPILED PATTERNS ---
+_RE_WS = re.compile(r"\s+")
+_RE_TRAIL = re.compile(r"[,:;)\]]+$")
+_RE_FIRST_CLAUSE = re.compile(r"[^\n.!?]*")
+_PHRASE_STRIP_CHARS = " \t\r\"'`“”‘’()[]{}"
+_RE_KEY = re.compile(r"^[a-z0-9_]+$")
+_RE_WORDS3 = re.compile(r"\w{3,}")
+_RE_REMEMBER = re.compile(r"^([a-zA-Z0-9_]+)\s*[=:]\s*(.+)$")
+_RE_WORD_RUN = re.compile(r"\w+")
+
 # --- RETRIEVAL CACHE ---
 _retrieval_cache: Dict[str, Tuple[str, float]] = {}
 RETRIEVAL_CACHE_TTL = 10.0  # Cache for 10 seconds
@@ -48,10 +66,28 @@ def _cache_key(query: str, k: int) -> str:
     """Generate cache key for memory query."""
     return hashlib.md5(f"{query}:{k}".encode()).hexdigest()
 
+# --- VECTOR MATRIX CACHE ---
+# Newest vector memories scored per query. Recent memories are usually the
+# relevant ones, so the default keeps the original window of 100; the cached
+# matrix makes larger windows cheap (~10 us at 100 rows, ~145 us at 2000).
+VECTOR_SCAN_LIMIT = int(os.getenv("LOCALIS_VECTOR_SCAN_LIMIT", "100"))
+_vec_ids = None  # np.ndarray of row ids, ascending
+_vec_matrix = None  # (N, d) int8 (SQ8), row i is the embedding of _vec_ids[i]
+_vec_generation = -1
+_VEC_LOCK = threading.Lock()
+
+# --- KV INVERTED INDEX ---
+# token -> row positions, rebuilt when database._memory_generation changes.
+# Tokens are maximal \w runs, so a query term (itself all \w) is a substring of
+# a row exactly when it is a substring of one of that row's tokens.
+_KV_INDEX: Dict[str, Any] = {"version": None, "rows": [], "postings": {}, "key_postings": {}}
+_KV_LOCK = threading.Lock()
+
 # --- IDENTITY CACHE ---
+# Valid while database._memory_generation (bumped on every user_memory write)
+# is unchanged
 _identity_cache: Optional[Dict[str, str]] = None
-_identity_cache_time: float = 0
-IDENTITY_CACHE_TTL = 30.0  # Cache for 30 seconds
+_identity_cache_version: Optional[int] = None
 
 # ------------------------------------------------------------------------------
 # Data Structures
@@ -123,6 +159,73 @@ BULLET_LIST_MAX_ITEMS = 50
 _EMBEDDER = None
 _EMBEDDER_LOCK = threading.Lock()
 
+# Embeddings keyed by an 8-byte content digest, so rewriting an unchanged value
+# (e.g. a bullet merge that adds nothing) skips the encode entirely
+EMBED_CACHE_MAX = 2048
+EMBED_BATCH_SIZE = 32
+_EMBED_CACHE: "OrderedDict[bytes, Any]" = OrderedDict()
+_EMBED_CACHE_LOCK = threading.Lock()
+
+
+# LOCALIS_EMBED_BACKEND: auto | onnx | openvino | torch. "auto" keeps PyTorch
+# (FP16) on CUDA and otherwise tries ONNX Runtime, then OpenVINO, then PyTorch.
+EMBED_BACKEND = os.getenv("LOCALIS_EMBED_BACKEND", "auto").strip().lower()
+# Pre-quantized int8 ONNX export (VNNI int8 GEMM kernels); plain onnx/model.onnx is the fallback
+EMBED_ONNX_FILE = os.getenv("LOCALIS_EMBED_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+
+# Token cap for memory-side encodes (BGE allows 512). SentenceTransformer already
+# pads each batch only to its longest member, so this bounds the cost of long
+# memory values without padding short queries up to a fixed shape. Applied by
+# clipping the text (~4 chars per token), never via the shared embedder's
+# max_seq_length: RAG encodes whole document chunks with the same model.
+EMBED_MAX_SEQ_LENGTH = int(os.getenv("LOCALIS_EMBED_MAX_SEQ_LENGTH", "256"))
+_EMBED_MAX_CHARS = EMBED_MAX_SEQ_LENGTH * 4
+
+# Intra-op threads for CPU encodes (torch and ONNX Runtime). Half the cores by
+# default so an encode does not contend with llama.cpp generation threads.
+EMBED_NUM_THREADS = int(os.getenv("LOCALIS_EMBED_THREADS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+
+# backend -> ordered (label, SentenceTransformer kwargs) attempts
+_CPU_EMBED_BACKENDS = {
+    "onnx": [
+        ("onnx-int8", {"backend": "onnx", "model_kwargs": {"file_name": EMBED_ONNX_FILE}}),
+        ("onnx", {"backend": "onnx"}),
+    ],
+    "openvino": [("openvino", {"backend": "openvino"})],
+    "torch": [("torch", {})],
+}
+
+
+def _ort_session_options():
+    """ORT SessionOptions with a bounded intra-op pool, or None without onnxruntime."""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = EMBED_NUM_THREADS
+    opts.inter_op_num_threads = 1
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return opts
+
+
+def _load_cpu_embedder(SentenceTransformer, backends: List[str]):
+    """First CPU backend in `backends` that loads, or None."""
+    for backend in backends:
+        for label, kwargs in _CPU_EMBED_BACKENDS.get(backend, ()):
+            if kwargs.get("backend") == "onnx":
+                session_options = _ort_session_options()
+                if session_options is not None:
+                    model_kwargs = {**kwargs.get("model_kwargs", {}), "session_options": session_options}
+                    kwargs = {**kwargs, "model_kwargs": model_kwargs}
+            try:
+                model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu", **kwargs)
+                logger.info(f"[Memory] Loaded embedding model {EMBEDDING_MODEL_NAME} on CPU ({label})")
+                return model
+            except Exception as e:
+                logger.warning(f"[Memory] Embedding backend {label} unavailable: {e}")
+    return None
+
 
 def get_embedder():
     """Lazy loader for SentenceTransformer with failure handling and GPU acceleration."""
@@ -135,18 +238,23 @@ def get_embedder():
                     import torch
 
                     # Auto-detect device
-                    device = "cuda" if torch.cuda.is_available() else "cpu"
-                    logger.info(f"[Memory] Loading embedding model {EMBEDDING_MODEL_NAME} on {device.upper()}...")
-
-                    _EMBEDDER = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+                    if EMBED_BACKEND == "auto" and torch.cuda.is_available():
+                        logger.info(f"[Memory] Loading embedding model {EMBEDDING_MODEL_NAME} on CUDA...")
+                        _EMBEDDER = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cuda")
 
-                    # Optimize for inference on GPU using FP16 for 2x faster processing
-                    if device == "cuda":
+                        # Optimize for inference on GPU using FP16 for 2x faster processing
                         try:
                             _EMBEDDER.half()
                             logger.info("[Memory] Enabled FP16 mode for GPU acceleration")
                         except Exception as e:
                             logger.warning(f"[Memory] Could not enable FP16: {e}")
+                    else:
+                        torch.set_num_threads(EMBED_NUM_THREADS)
+                        backends = ["onnx", "openvino", "torch"] if EMBED_BACKEND == "auto" else [EMBED_BACKEND]
+                        _EMBEDDER = _load_cpu_embedder(SentenceTransformer, backends)
+                        if _EMBEDDER is None:
+                            logger.error(f"[Memory] No embedding backend could be loaded ({EMBED_BACKEND})")
+                            return None
 
                 except ImportError:
                     logger.warning("[Memory] 'sentence-transformers' not found. Vector memory disabled.")
@@ -157,30 +265,92 @@ def get_embedder():
     return _EMBEDDER
 
 
-def embed_text(text: str) -> Optional[List[float]]:
+def _embed_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def _embed_cache_get(key: bytes) -> Any:
+    with _EMBED_CACHE_LOCK:
+        vec = _EMBED_CACHE.get(key)
+        if vec is not None:
+            _EMBED_CACHE.move_to_end(key)
+        return vec
+
+
+def _embed_cache_put(key: bytes, vec: Any) -> None:
+    with _EMBED_CACHE_LOCK:
+        _EMBED_CACHE[key] = vec
+        _EMBED_CACHE.move_to_end(key)
+        while len(_EMBED_CACHE) > EMBED_CACHE_MAX:
+            _EMBED_CACHE.popitem(last=False)
+
+
+def _clip_for_embed(text: str) -> str:
+    return text[:_EMBED_MAX_CHARS] if _EMBED_MAX_CHARS > 0 else text
+
+
+def _as_cached_vec(vec: Any) -> Any:
+    # Contiguous float32 and read-only: cached arrays are handed to every caller
+    vec = np.ascontiguousarray(vec, dtype=np.float32)
+    vec.flags.writeable = False
+    return vec
+
+
+def embed_text(text: str) -> Optional["np.ndarray"]:
+    """Normalized float32 embedding (read-only; .tolist() at JSON boundaries)."""
     if not NUMPY_AVAILABLE:
         return None
+    key = _embed_key(text)
+    vec = _embed_cache_get(key)
+    if vec is not None:
+        return vec
     model = get_embedder()
     if not model:
         return None
     try:
-        vec = model.encode(text, normalize_embeddings=True, convert_to_numpy=True)
-        return vec.tolist()
+        vec = model.encode(_clip_for_embed(text), normalize_embeddings=True, convert_to_numpy=True)
     except Exception as e:
         logger.error(f"[Memory] Embed error: {e}")
         return None
-
-
-def pack_embedding(vec: List[float]) -> bytes:
-    if not NUMPY_AVAILABLE or not vec:
+    vec = _as_cached_vec(vec)
+    _embed_cache_put(key, vec)
+    return vec
+
+
+def embed_texts(texts: List[str]) -> List[Optional["np.ndarray"]]:
+    """Batch form of embed_text: cache misses go through one encode call."""
+    if not NUMPY_AVAILABLE or not texts:
+        return [None] * len(texts)
+    keys = [_embed_key(t) for t in texts]
+    vecs = [_embed_cache_get(key) for key in keys]
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+    if missing:
+        model = get_embedder()
+        if not model:
+            return [None] * len(texts)
+        try:
+            encoded = model.encode(
+                [_clip_for_embed(texts[i]) for i in missing],
+                batch_size=EMBED_BATCH_SIZE,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+            )
+        except Exception as e:
+            logger.error(f"[Memory] Embed error: {e}")
+            return [None] * len(texts)
+        for i, vec in zip(missing, encoded):
+            vec = _as_cached_vec(vec)
+            _embed_cache_put(keys[i], vec)
+            vecs[i] = vec
+    return vecs
+
+
+def pack_embedding(vec: Any) -> bytes:
+    """Normalized embedding -> SQ8 blob (int8, round(x * 127)); see database.EMBEDDING_SQ8_SCALE."""
+    if not NUMPY_AVAILABLE or vec is None or len(vec) == 0:
         return b""
-    return np.array(vec, dtype=np.float32).tobytes()
-
-
-def unpack_embedding(blob: bytes) -> Any:
-    if not NUMPY_AVAILABLE:
-        return None
-    return np.frombuffer(blob, dtype=np.float32)
+    scaled = np.rint(np.asarray(vec, dtype=np.float32) * database.EMBEDDING_SQ8_SCALE)
+    return np.clip(scaled, -127, 127).astype(np.int8).tobytes()
 
 
 # ------------------------------------------------------------------------------
@@ -212,12 +382,10 @@ def _clean_phrase(s: str) -> str:
     """Conservative cleanup for extracted phrases."""
     if not s:
         return ""
-    out = s.strip()
-    out = out.split("\n", 1)[0]
-    out = re.split(r"[.!?]", out, maxsplit=1)[0].strip()
-    out = out.strip(" \t\r\"'`“”‘’()[]{}")
-    out = re.sub(r"\s+", " ", out).strip()
-    out = re.sub(r"[,:;)\]]+$", "", out).strip()
+    # Text up to the first newline or sentence end, then quotes/brackets trimmed
+    out = _RE_FIRST_CLAUSE.match(s.strip()).group().strip().strip(_PHRASE_STRIP_CHARS)
+    out = _RE_WS.sub(" ", out).strip()
+    out = _RE_TRAIL.sub("", out).strip()
     if len(out) < 2:
         return ""
     return out
@@ -226,30 +394,37 @@ def _clean_phrase(s: str) -> str:
 def _merge_bullets(existing: str, new_items: List[str]) -> str:
     """Merge bullet-list memories."""
 
+    def clean_all(values) -> List[str]:
+        return [c for c in map(_clean_phrase, map(str, values)) if c]
+
     def parse_existing_items(raw: str) -> List[str]:
-        if not raw or not raw.strip():
+        if not raw:
             return []
         t = raw.strip()
-        # Legacy JSON handling
-        if t[:1] in ("[", "{"):
+        if not t:
+            return []
+        # Legacy JSON handling (stored bullet lists start with "-" and skip this)
+        if t[0] in "[{":
             try:
                 obj = json.loads(t)
                 if isinstance(obj, list):
-                    return [_clean_phrase(str(x)) for x in obj if _clean_phrase(str(x))]
+                    return clean_all(obj)
                 if isinstance(obj, dict):
                     out = []
                     for _, v in obj.items():
                         if isinstance(v, list):
-                            out.extend([_clean_phrase(str(x)) for x in v if _clean_phrase(str(x))])
+                            out.extend(clean_all(v))
                         elif isinstance(v, str):
-                             if _clean_phrase(v): out.append(_clean_phrase(v))
+                            c = _clean_phrase(v)
+                            if c:
+                                out.append(c)
                     return out
             except Exception:
                 pass
 
-        lines = [ln.strip() for ln in t.splitlines() if ln.strip()]
         bullet_items = []
-        for ln in lines:
+        for ln in t.splitlines():
+            ln = ln.strip()
             if ln.startswith("-"):
                 item = _clean_phrase(ln[1:].strip())
                 if item:
@@ -262,15 +437,18 @@ def _merge_bullets(existing: str, new_items: List[str]) -> str:
 
     existing_items = parse_existing_items(existing)
 
-    # Dedupe case-insensitively
-    seen = set(x.lower() for x in existing_items)
+    # Dedupe case-insensitively; {lower: original}, each phrase lowercased once
+    seen = {x.lower(): x for x in existing_items}
     merged = list(existing_items)
 
     for it in (new_items or []):
         c = _clean_phrase(str(it))
-        if c and c.lower() not in seen:
+        if not c:
+            continue
+        lc = c.lower()
+        if lc not in seen:
+            seen[lc] = c
             merged.append(c)
-            seen.add(c.lower())
 
     # Keep newest
     if len(merged) > BULLET_LIST_MAX_ITEMS:
@@ -298,6 +476,16 @@ def _coerce_to_items(value: Optional[str]) -> List[str]:
 # NEW: Tool-Facing Public API
 # ------------------------------------------------------------------------------
 
+def _format_tier_b_line(item: MemoryItem) -> str:
+    # Truncate overly long items for display
+    display_content = item.content
+    if len(display_content) > 300:
+        display_content = display_content[:297] + "..."
+    if item.key and item.key != "misc":
+        return f"* [{item.key}] {display_content}"
+    return f"* {display_content}"
+
+
 def _do_memory_retrieve(query: str, session_id: str = None, k: int = 8) -> str:
     """
     Original retrieval logic (extracted for caching).
@@ -329,25 +517,23 @@ def _do_memory_retrieve(query: str, session_id: str = None, k: int = 8) -> str:
 
     # 3. Merge, Dedupe, and Rank
     # We use a simple scoring heuristic: if it came from both, sum score.
-    # Dedupe by content (normalized).
-    merged_map: Dict[str, MemoryItem] = {}
+    # Dedupe by content (normalized once per item), keyed by an 8-byte digest
+    # rather than the full text.
+    merged_map: Dict[bytes, MemoryItem] = {}
+    ws_sub = _RE_WS.sub
+    blake2b = hashlib.blake2b
 
     for item in candidates:
-        # Normalize content for deduplication
-        norm_content = re.sub(r"\s+", " ", item.content).strip().lower()
-
-        if norm_content in merged_map:
+        norm_key = blake2b(ws_sub(" ", item.content).strip().lower().encode(), digest_size=8).digest()
+        existing = merged_map.get(norm_key)
+        if existing is not None:
             # Boost score if found in multiple retrieval methods
-            merged_map[norm_content].score += item.score
+            existing.score += item.score
         else:
-            merged_map[norm_content] = item
+            merged_map[norm_key] = item
 
-    final_list = list(merged_map.values())
-    # Sort by descending relevance score
-    final_list.sort(key=lambda x: x.score, reverse=True)
-
-    # Cap at k items
-    top_items = final_list[:k]
+    # Top k by descending relevance score (ties keep candidate order)
+    top_items = heapq.nlargest(k, merged_map.values(), key=lambda x: x.score)
 
     # Log event
     log_event("tool_memory_retrieve", {
@@ -363,24 +549,12 @@ def _do_memory_retrieve(query: str, session_id: str = None, k: int = 8) -> str:
         output_parts.append(identity_block)
 
     if top_items:
-        lines = ["[RELEVANT MEMORY (Tier-B)]"]
-        current_chars = 0
-        for item in top_items:
-            # Truncate overly long items for display
-            display_content = item.content
-            if len(display_content) > 300:
-                display_content = display_content[:297] + "..."
-
-            line = f"* {display_content}"
-            if item.key and item.key != "misc":
-                line = f"* [{item.key}] {display_content}"
-
-            if current_chars + len(line) > MAX_TIER_B_CHARS:
-                break
-
-            lines.append(line)
-            current_chars += len(line) + 1
-        output_parts.append("\n".join(lines))
+        lines = [_format_tier_b_line(item) for item in top_items]
+        # Keep the longest prefix within budget: line i fits when the lines before
+        # it (each plus its newline) and line i itself total <= MAX_TIER_B_CHARS
+        sizes = list(itertools.accumulate(len(line) + 1 for line in lines))
+        cut = bisect.bisect_right(sizes, MAX_TIER_B_CHARS + 1)
+        output_parts.append("\n".join(["[RELEVANT MEMORY (Tier-B)]", *lines[:cut]]))
 
     if not output_parts:
         return "No relevant memories found."
@@ -478,7 +652,7 @@ def tool_memory_write(
              # Fallback to misc if strictly outside allowed universe?
              # For now, we trust the DB layer to handle category mapping,
              # but we ensure key safety.
-             if not re.match(r"^[a-z0-9_]+$", final_key):
+             if not _RE_KEY.match(final_key):
                  final_key = "misc"
 
         # Handle list merging for specific keys
@@ -499,12 +673,12 @@ def tool_memory_write(
         }
         database.upsert_user_memory_meta(final_key, meta)
 
-        # Also index in vector store for retrieval
-        add_vector_memory(clean_val, session_id, intent, authority, source, None)
+        # Also index in vector store for retrieval (encoded off the request path)
+        queued = queue_vector_memory(clean_val, session_id, intent, authority, source, None)
 
         _retrieval_cache.clear()
         log_event("tool_write_tier_b", {"key": final_key}, session_id)
-        return {"ok": True, "key": final_key}
+        return {"ok": True, "key": final_key, "queued": queued}
 
     return {"ok": False, "skipped_reason": "invalid_target"}
 
@@ -524,56 +698,91 @@ def tool_memory_forget(session_id: str, key: str) -> Dict[str, Any]:
 # KV Scoring Logic
 # ------------------------------------------------------------------------------
 
+def _kv_index() -> Dict[str, Any]:
+    """Returns the KV inverted index, rebuilding it if user_memory changed."""
+    with _KV_LOCK:
+        version = database._memory_generation
+        if _KV_INDEX["version"] == version:
+            return _KV_INDEX
+
+        # (key, value, meta_json); meta is only decoded for the rows returned
+        rows: List[Tuple[str, str, Optional[str]]] = []
+        postings: Dict[str, Set[int]] = {}
+        key_postings: Dict[str, Set[int]] = {}
+        for idx, (key, value, meta_json) in enumerate(database.iter_extended_user_memories()):
+            key, value = key or "", value or ""
+            rows.append((key, value, meta_json))
+            for tok in set(_RE_WORD_RUN.findall(value.lower())):
+                postings.setdefault(tok, set()).add(idx)
+            for tok in set(_RE_WORD_RUN.findall(key.replace("_", " "))):
+                key_postings.setdefault(tok, set()).add(idx)
+
+        _KV_INDEX.update(version=version, rows=rows, postings=postings, key_postings=key_postings)
+        return _KV_INDEX
+
+
+def _rows_matching(term: str, postings: Dict[str, Set[int]]) -> Set[int]:
+    """Rows with a token containing term (substring match, like `term in text`)."""
+    hits: Set[int] = set()
+    for tok, row_ids in postings.items():
+        if term in tok:
+            hits |= row_ids
+    return hits
+
+
+@functools.lru_cache(maxsize=256)
+def _query_terms(query: str) -> FrozenSet[str]:
+    """Tokenize query: lower, ignore short words. Cached for repeated lookups."""
+    return frozenset(_RE_WORDS3.findall(query.lower()))
+
+
 def _retrieve_kv_memory_scored(query: str, k: int = 8) -> List[MemoryItem]:
     """
-    Retrieves all KV memories, scores them by keyword overlap, and returns top K.
+    Scores KV memories by keyword overlap via the inverted index, returns top K.
     """
-    all_memories = database.get_extended_user_memories_with_meta()
-    if not all_memories:
+    query_terms = _query_terms(query)
+    if not query_terms:
         return []
 
-    # Tokenize query: lower, ignore short words
-    query_terms = set(w for w in re.findall(r"\w{3,}", query.lower()) if w)
-    if not query_terms:
+    index = _kv_index()
+    rows = index["rows"]
+    if not rows:
         return []
 
-    scored_candidates = []
-
-    for item in all_memories:
-        key_raw = item.get("key", "")
-        val_raw = item.get("value", "")
-        meta = item.get("meta") or {}
-
-        # Basic Scoring
-        score = 0
-
-        # 1. Key Intent Match (Boost)
-        # If query contains "book", boost "media_preferences"
-        key_normalized = key_raw.replace("_", " ")
-        if any(term in key_normalized for term in query_terms):
-            score += 2.0
-
-        # 2. Content Overlap
-        content_normalized = val_raw.lower()
-        overlap_count = sum(1 for term in query_terms if term in content_normalized)
-        score += overlap_count * 1.0
-
-        if score > 0:
-            scored_candidates.append(
-                MemoryItem(
-                    content=val_raw,
-                    intent=meta.get("intent", "reference_note"),
-                    authority=meta.get("authority", "imported"),
-                    source=meta.get("source", "import"),
-                    created_at=datetime.utcnow(),
-                    key=key_raw,
-                    score=score
-                )
+    scores: Counter = Counter()
+
+    # 1. Key Intent Match (Boost)
+    # If query contains "book", boost "media_preferences"
+    key_hits: Set[int] = set()
+    for term in query_terms:
+        key_hits |= _rows_matching(term, index["key_postings"])
+    for idx in key_hits:
+        scores[idx] += 2.0
+
+    # 2. Content Overlap: +1 per query term found in the value
+    for term in query_terms:
+        scores.update(_rows_matching(term, index["postings"]))
+
+    # Ties keep table order (most recently updated first), as a stable sort would
+    top = heapq.nlargest(k, sorted(scores), key=scores.__getitem__)
+
+    now = datetime.utcnow()
+    results = []
+    for idx in top:
+        key, value, meta_json = rows[idx]
+        meta = json.loads(meta_json) if meta_json else {}
+        results.append(
+            MemoryItem(
+                content=value,
+                intent=meta.get("intent", "reference_note"),
+                authority=meta.get("authority", "imported"),
+                source=meta.get("source", "import"),
+                created_at=now,
+                key=key,
+                score=float(scores[idx])
             )
-
-    # Sort desc
-    scored_candidates.sort(key=lambda x: x.score, reverse=True)
-    return scored_candidates[:k]
+        )
+    return results
 
 
 # ------------------------------------------------------------------------------
@@ -584,7 +793,7 @@ def parse_memory_command(user_text: str) -> Optional[Dict[str, str]]:
     text = user_text.strip()
     if text.lower().startswith("/remember "):
         payload = text[10:].strip()
-        match = re.match(r"^([a-zA-Z0-9_]+)\s*[=:]\s*(.+)$", payload)
+        match = _RE_REMEMBER.match(payload)
         if match:
             return {"cmd": "remember", "key": match.group(1), "value": match.group(2)}
         else:
@@ -600,12 +809,12 @@ def get_identity_context() -> Dict[str, str]:
 
     NOTE: Identity is GLOBAL - same name, location, timezone across all sessions.
     """
-    global _identity_cache, _identity_cache_time
+    global _identity_cache, _identity_cache_version
 
-    current_time = time.time()
+    version = database._memory_generation
 
-    # Return cached value if fresh
-    if _identity_cache is not None and (current_time - _identity_cache_time) < IDENTITY_CACHE_TTL:
+    # Return cached value if no memory write happened since it was built
+    if _identity_cache is not None and _identity_cache_version == version:
         return _identity_cache.copy()
 
     # Fetch from database
@@ -617,33 +826,26 @@ def get_identity_context() -> Dict[str, str]:
 
     # Update cache
     _identity_cache = identity
-    _identity_cache_time = current_time
+    _identity_cache_version = version
 
     return identity.copy()
 
 
 def invalidate_identity_cache():
     """Call this after updating Tier-A memory."""
-    global _identity_cache, _identity_cache_time
+    global _identity_cache, _identity_cache_version
     _identity_cache = None
-    _identity_cache_time = 0
+    _identity_cache_version = None
 
 
-def add_vector_memory(
-    content: str,
+def _vector_meta(
     session_id: Optional[str],
     intent: MemoryIntent,
     authority: MemoryAuthority,
     source: MemorySource,
     valid_until: Optional[datetime],
-) -> int:
-    vec = embed_text(content)
-    if not vec:
-        log_event("vector_skip", {"reason": "embedding_failed_or_disabled"}, session_id)
-        return -1
-
-    blob = pack_embedding(vec)
-    meta = {
+) -> Dict[str, Any]:
+    return {
         "intent": intent,
         "authority": authority,
         "source": source,
@@ -651,9 +853,158 @@ def add_vector_memory(
         "valid_from": datetime.utcnow().isoformat(),
         "valid_until": valid_until.isoformat() if valid_until else None,
     }
-    row_id = database.add_vector_memory_item(content, blob, meta)
-    # log_event("vector_memory_added", {"id": row_id}, session_id)
-    return row_id
+
+
+# --- BACKGROUND VECTOR WRITER ---
+# tool_memory_write hands (content, meta) here instead of blocking on the encoder;
+# the worker drains up to VEC_WRITE_BATCH items, encodes them in one batch and
+# inserts them in one transaction.
+VEC_WRITE_QUEUE_MAX = 256
+VEC_WRITE_BATCH = 32
+_VEC_Q: "queue.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = queue.Queue(maxsize=VEC_WRITE_QUEUE_MAX)
+_vec_writer: Optional[threading.Thread] = None
+_VEC_WRITER_LOCK = threading.Lock()
+
+
+def _write_vector_batch(batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+    # Skip contents already stored (or repeated within the batch) before encoding
+    pending: Dict[str, Dict[str, Any]] = {}
+    for content, meta in batch:
+        if content not in pending and database.find_vector_memory_id(content) is None:
+            pending[content] = meta
+    if not pending:
+        return
+    batch = list(pending.items())
+    vecs = embed_texts([content for content, _ in batch])
+    rows = []
+    for (content, meta), vec in zip(batch, vecs):
+        if vec is None:
+            log_event("vector_skip", {"reason": "embedding_failed_or_disabled"}, meta.get("origin_session_id"))
+            continue
+        rows.append((content, pack_embedding(vec), meta))
+    if rows:
+        database.add_vector_memory_items(rows)
+        # Retrieval results cached before the insert landed are now stale
+        _retrieval_cache.clear()
+
+
+def _vector_writer_loop() -> None:
+    while True:
+        item = _VEC_Q.get()
+        if item is None:
+            return
+        batch = [item]
+        stop = False
+        while len(batch) < VEC_WRITE_BATCH:
+            try:
+                nxt = _VEC_Q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                stop = True
+                break
+            batch.append(nxt)
+        try:
+            _write_vector_batch(batch)
+        except Exception as e:
+            logger.error(f"[Memory] Vector write failed ({len(batch)} items): {e}")
+        if stop:
+            return
+
+
+def queue_vector_memory(
+    content: str,
+    session_id: Optional[str],
+    intent: MemoryIntent,
+    authority: MemoryAuthority,
+    source: MemorySource,
+    valid_until: Optional[datetime],
+) -> bool:
+    """
+    Queues content for _write_vector_batch on the background writer, which
+    skips already-stored content, embeds and inserts in batches. Returns False
+    if the write had to run inline because the queue is full.
+    """
+    global _vec_writer
+    meta = _vector_meta(session_id, intent, authority, source, valid_until)
+    with _VEC_WRITER_LOCK:
+        if _vec_writer is None or not _vec_writer.is_alive():
+            _vec_writer = threading.Thread(target=_vector_writer_loop, daemon=True, name="vector-writer")
+            _vec_writer.start()
+    try:
+        _VEC_Q.put_nowait((content, meta))
+        return True
+    except queue.Full:
+        _write_vector_batch([(content, meta)])
+        return False
+
+
+def _drain_vector_writer(timeout: float = 10.0) -> None:
+    """Lets queued vector writes finish before interpreter exit."""
+    if _vec_writer is None or not _vec_writer.is_alive():
+        return
+    try:
+        _VEC_Q.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    _vec_writer.join(timeout)
+
+atexit.register(_drain_vector_writer)
+
+
+def _vector_matrix() -> Tuple[Any, Any]:
+    """
+    (ids, matrix) for every stored embedding, oldest first: one contiguous
+    (N, d) int8 (SQ8) matrix so a query is scored with a single matmul. Rows added
+    since the last call are appended; a deletion (generation bump) rebuilds.
+    Blobs whose length does not match the embedding width are skipped.
+    """
+    global _vec_ids, _vec_matrix, _vec_generation
+    with _VEC_LOCK:
+        generation = database._vector_generation
+        if generation != _vec_generation or _vec_ids is None:
+            _vec_ids = np.empty(0, dtype=np.int64)
+            _vec_matrix = None
+            _vec_generation = generation
+
+        last_id = int(_vec_ids[-1]) if _vec_ids.size else 0
+        new_ids: List[int] = []
+        new_blobs: List[bytes] = []
+        width = _vec_matrix.shape[1] if _vec_matrix is not None else None
+        for row_id, blob in database.iter_vector_embeddings_after(last_id):
+            if not blob:
+                continue
+            if width is None:
+                width = len(blob)
+            if len(blob) != width:
+                continue
+            new_ids.append(row_id)
+            new_blobs.append(blob)
+
+        if new_ids:
+            rows = np.frombuffer(b"".join(new_blobs), dtype=np.int8).reshape(len(new_ids), -1)
+            _vec_ids = np.concatenate((_vec_ids, np.asarray(new_ids, dtype=np.int64)))
+            _vec_matrix = rows.copy() if _vec_matrix is None else np.vstack((_vec_matrix, rows))
+        return _vec_ids, _vec_matrix
+
+
+# Rows widened to float32 per block: bounds the temporary to ~0.75 MB (fits in L2)
+# instead of a float32 copy of the whole scanned matrix per query
+SQ8_SCORE_BLOCK = 512
+
+def _score_sq8(matrix: Any, q: Any) -> Any:
+    """matrix (N, d) int8 @ q (d,) float32 -> (N,) float32, block by block."""
+    n = matrix.shape[0]
+    if n <= SQ8_SCORE_BLOCK:
+        return matrix.astype(np.float32) @ q
+    scores = np.empty(n, dtype=np.float32)
+    block = np.empty((SQ8_SCORE_BLOCK, matrix.shape[1]), dtype=np.float32)
+    for start in range(0, n, SQ8_SCORE_BLOCK):
+        stop = min(start + SQ8_SCORE_BLOCK, n)
+        rows = block[: stop - start]
+        np.copyto(rows, matrix[start:stop], casting="unsafe")
+        np.matmul(rows, q, out=scores[start:stop])
+    return scores
 
 
 def retrieve_vector_memory(query: str, k: int = 5) -> List[MemoryItem]:
@@ -662,43 +1013,50 @@ def retrieve_vector_memory(query: str, k: int = 5) -> List[MemoryItem]:
 
     NOTE: Searches ALL vector memories globally (no session filtering).
     """
-    if not NUMPY_AVAILABLE:
+    if not NUMPY_AVAILABLE or k <= 0:
         return []
 
     query_vec = embed_text(query)
-    if not query_vec:
+    if query_vec is None:
         return []
 
-    q_arr = np.array(query_vec, dtype=np.float32)
-    # Reduced from 2000 to 100 for performance
-    # Most recent memories are typically most relevant
-    candidates = database.list_vector_memory_items(limit=100)
-    scored_items = []
+    ids, matrix = _vector_matrix()
+    if matrix is None:
+        return []
+    if query_vec.shape[0] != matrix.shape[1]:
+        return []
 
-    for row in candidates:
-        if not row["embedding"]:
-            continue
-        try:
-            item_vec = unpack_embedding(row["embedding"])
-            score = float(np.dot(q_arr, item_vec))
-            if score >= VECTOR_SIMILARITY_CUTOFF:
-                meta = row["meta"]
-                scored_items.append(
-                    MemoryItem(
-                        id=row["id"],
-                        content=row["content"],
-                        intent=meta.get("intent", "reference_note"),
-                        authority=meta.get("authority", "imported"),
-                        source=meta.get("source", "import"),
-                        created_at=datetime.utcnow(),
-                        score=score
-                    )
-                )
-        except Exception:
-            pass
-
-    scored_items.sort(key=lambda x: x.score, reverse=True)
-    return scored_items[:k]
+    # Score the newest VECTOR_SCAN_LIMIT rows in one SGEMV, then keep only the
+    # top-k above the cutoff (argpartition, then sort just those k). The query
+    # stays float; folding 1/127 into it dequantizes the SQ8 rows.
+    ids, matrix = ids[-VECTOR_SCAN_LIMIT:], matrix[-VECTOR_SCAN_LIMIT:]
+    scores = _score_sq8(matrix, query_vec * (1.0 / database.EMBEDDING_SQ8_SCALE))
+    idx = np.nonzero(scores >= VECTOR_SIMILARITY_CUTOFF)[0]
+    if idx.size > k:
+        idx = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+    # Best first; ties go to the newer memory
+    idx = idx[np.lexsort((-ids[idx], -scores[idx]))]
+
+    items = database.get_vector_memory_items([int(i) for i in ids[idx]])
+    now = datetime.utcnow()
+    scored_items = []
+    for i in idx:
+        row = items.get(int(ids[i]))
+        if row is None:
+            continue  # deleted since the matrix was built
+        meta = row["meta"]
+        scored_items.append(
+            MemoryItem(
+                id=row["id"],
+                content=row["content"],
+                intent=meta.get("intent", "reference_note"),
+                authority=meta.get("authority", "imported"),
+                source=meta.get("source", "import"),
+                created_at=now,
+                score=float(scores[i])
+            )
+        )
+    return scored_items
 
 
 def propose_memory_write(user_text: str, session_id: str) -> Optional[MemoryProposal]:
@@ -6,6 +6,7 @@ import os
 import sys
 import threading
 import subprocess
+import time
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
@@ -14,7 +15,6 @@ from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, Field
 
 from . import database
-from llama_cpp import Llama
 
 DEFAULT_TUTORIAL_REPO = "johnhaul/Qwen3-0.6B-Q4_K_M-GGUF"
 DEFAULT_TUTORIAL_FILE = "qwen3-0.6b-q4_k_m.gguf"
@@ -43,8 +43,34 @@ def _models_dir(request: Request) -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p
 
+# /setup/status is polled by the UI; the directory listing is reused for a short
+# TTL (dropped when a download finishes) and setup_completed until the settings
+# generation changes
+MODELS_LIST_TTL = 2.0
+_models_cache: Dict[str, tuple] = {}  # models_dir -> (expires_at, names)
+_setup_completed_cache: Optional[tuple] = None  # (settings generation, completed)
+
 def _list_models(models_dir: Path) -> List[str]:
-    return sorted([p.name for p in models_dir.glob("*.gguf") if p.is_file()])
+    now = time.monotonic()
+    cache_key = str(models_dir)
+    hit = _models_cache.get(cache_key)
+    if hit and hit[0] > now:
+        return hit[1]
+    # DirEntry.is_file() uses the type from the directory read; no stat per entry
+    with os.scandir(models_dir) as entries:
+        names = sorted(e.name for e in entries if e.name.endswith(".gguf") and e.is_file())
+    _models_cache[cache_key] = (now + MODELS_LIST_TTL, names)
+    return names
+
+def _setup_completed() -> bool:
+    global _setup_completed_cache
+    gen = database._settings_generation
+    hit = _setup_completed_cache
+    if hit and hit[0] == gen:
+        return hit[1]
+    completed = (database.get_app_setting("setup_completed") == "true")
+    _setup_completed_cache = (gen, completed)
+    return completed
 
 class DownloadTutorialModelRequest(BaseModel):
     repo_id: str = Field(default=DEFAULT_TUTORIAL_REPO)
@@ -53,9 +79,9 @@ class DownloadTutorialModelRequest(BaseModel):
 @router.get("/status")
 def setup_status(request: Request):
     models_dir = _models_dir(request)
-    models = _list_models(models_dir)
+    models = list(_list_models(models_dir))
 
-    setup_completed = (database.get_app_setting("setup_completed") == "true")
+    setup_completed = _setup_completed()
     tutorial_present = (models_dir / DEFAULT_TUTORIAL_FILE).exists()
 
     return {
@@ -118,6 +144,9 @@ def download_tutorial_model(req: DownloadTutorialModelRequest, request: Request)
 
         def _job():
             try:
+                # Imported here so app startup does not load llama.cpp's native library
+                from llama_cpp import Llama
+
                 # This downloads via HF and also validates the file by loading it briefly.
                 # Requires huggingface-hub (as documented by llama-cpp-python).
                 llm = Llama.from_pretrained(
@@ -133,6 +162,7 @@ def download_tutorial_model(req: DownloadTutorialModelRequest, request: Request)
                 gc.collect()
 
                 local_path = models_dir / Path(req.filename).name
+                _models_cache.clear()
                 _download_state.update(
                     {
                         "status": "done",
@@ -0,0 +1,93 @@
+"""
+Small-talk pre-filter for text chat.
+
+Flags messages that can never need a tool (greetings, thanks, farewells and
+plain arithmetic) so /chat can skip the Pass 1 tool decision for them.
+
+Caller contract:
+    if is_smalltalk(user_msg):
+        # stream the answer directly, no Pass 1
+    # otherwise run Pass 1 as usual
+
+Anything ambiguous must return False: a false positive silently blocks a tool
+call, while a false negative only costs one Pass 1 round trip.
+"""
+
+import re
+
+# A message qualifies only if it is short and made entirely of these words or
+# of arithmetic; anything else (lights, notes, memory, search...) goes to Pass 1.
+# Greetings, thanks and farewells only: answers like "yes please" or "ok" may
+# be consenting to a tool the assistant just offered, so they must reach Pass 1.
+SMALLTALK_MAX_LEN = 40
+SMALLTALK_WORDS = frozenset({
+    "hi", "hello", "hey", "yo", "hiya", "sup", "morning", "evening", "afternoon",
+    "good", "night", "gn", "there", "thanks", "thank", "thx", "ty", "you", "so",
+    "much", "very", "bye", "goodbye", "cya", "see", "later",
+})
+_STRIP_RE = re.compile(r"[^\w\s]")
+
+# At least one operator between two operands: bare numbers ("15", "2024") are
+# answers to follow-up questions, not arithmetic
+_OPERAND = r"\(*\s*\d+(?:\.\d+)?\s*\)*"
+_ARITHMETIC_RE = re.compile(
+    r"^(?P<prefix>what'?s|what is|calc|calculate)?\s*"
+    rf"(?P<expr>{_OPERAND}(?:\s*[+\-*/x×÷^%]\s*{_OPERAND})+)"
+    r"\s*(?P<suffix>=?\s*\??)$"
+)
+_OPERATOR_RE = re.compile(r"[+\-*/x×÷^%]")
+# Dates, phone numbers and ranges ("2024-10-15", "555-1234", "3/4") look like
+# '-' or '/' sums; only treat those as arithmetic when the user asks for a result
+_AMBIGUOUS_OPERATORS = frozenset("-/")
+
+
+def _is_arithmetic(text: str) -> bool:
+    m = _ARITHMETIC_RE.match(text)
+    if not m:
+        return False
+    if set(_OPERATOR_RE.findall(m.group("expr"))) <= _AMBIGUOUS_OPERATORS:
+        return bool(m.group("prefix") or m.group("suffix").strip())
+    return True
+
+
+def is_smalltalk(user_msg: str) -> bool:
+    if not user_msg or len(user_msg) >= SMALLTALK_MAX_LEN:
+        return False
+    text = user_msg.lower().strip()
+    if _is_arithmetic(text):
+        return True
+    words = _STRIP_RE.sub(" ", text).split()
+    return bool(words) and all(w in SMALLTALK_WORDS for w in words)
+
+
+if __name__ == "__main__":
+    cases = [
+        ("hi",                 True),
+        ("thank you so much!", True),
+        ("good night",         True),
+        ("2+2",                True),
+        ("what's 12 * 7?",     True),
+        ("(3 + 4) x 2",        True),
+        ("10 - 3 =",           True),
+        ("what is 10/4",       True),
+        ("yes please",         False),
+        ("ok",                 False),
+        ("15",                 False),
+        ("2024",               False),
+        ("3",                  False),
+        ("42.5",               False),
+        ("(555) 123-4567",     False),
+        ("555-1234",           False),
+        ("2024-10-15",         False),
+        ("10/15",              False),
+        ("turn on the lights", False),
+    ]
+
+    passed = 0
+    for text, expected in cases:
+        result = is_smalltalk(text)
+        assert result == expected, f"FAIL: {text!r}\n  got:      {result}\n  expected: {expected}"
+        print(f"  PASS: {text!r}")
+        passed += 1
+
+    print(f"\n{passed}/{len(cases)} tests passed.")
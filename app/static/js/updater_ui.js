@@ -1,7 +1,8 @@
 // app/static/js/updater_ui.js
 (() => {
     const API = {
-        status: async () => (await fetch("/update/status")).json(),
+        // force=true skips the server's short status cache (manual "Check")
+        status: async (force = false) => (await fetch(force ? "/update/status?force=1" : "/update/status")).json(),
  apply: async () =>
  (await fetch("/update/apply", {
      method: "POST",
@@ -29,7 +30,7 @@
         document.body.appendChild(overlay);
 
         document.getElementById("upd-btn-close").onclick = () => setVisible(false);
-        document.getElementById("upd-btn-refresh").onclick = async () => render(await API.status());
+        document.getElementById("upd-btn-refresh").onclick = async () => render(await API.status(true));
         document.getElementById("upd-btn-apply").onclick = async () => {
             const body = document.getElementById("upd-body");
             body.textContent = "Applying update...";
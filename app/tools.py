@@ -1,21 +1,38 @@
 # app/tools.py
+import asyncio
+import functools
 import logging
 import os
+import random
+import time
 import httpx
-from dotenv import load_dotenv
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# --- SOFT DEPENDENCY: orjson (C/SIMD JSON); falls back to stdlib json ---
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
 # ------------------------------
 # Load Secrets
 # ------------------------------
 # Priority order:
 # 1. LOCALIS_DATA_DIR/secret.env if LOCALIS_DATA_DIR is set and file exists
 # 2. Fallback to repo root secret.env
+# Runs on first search rather than at import: main.py has already loaded the
+# same secret.env by then, so this only matters when tools is used standalone.
+@functools.lru_cache(maxsize=1)
 def _load_secrets():
     """Load secrets from the appropriate location based on environment."""
+    from dotenv import load_dotenv
+
     data_dir_env = os.getenv("LOCALIS_DATA_DIR")
     if data_dir_env:
         data_dir_path = Path(data_dir_env) / "secret.env"
@@ -27,15 +44,171 @@ def _load_secrets():
     base_dir = Path(__file__).resolve().parent.parent
     load_dotenv(dotenv_path=base_dir / "secret.env")
 
-_load_secrets()
-
 # Note: We rely on os.getenv() inside functions to ensure fresh values
 # if the environment changes at runtime, rather than caching module-level constants.
 
+# ------------------------------
+# Shared HTTP Client
+# ------------------------------
+# One pooled client for every provider, so repeat searches reuse keep-alive
+# connections instead of paying a TCP+TLS handshake per call. With 'h2'
+# (httpx[http2] in requirements.txt) requests to one host are multiplexed
+# over a single HTTP/2 connection; without it we stay on HTTP/1.1.
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Separate budgets: fail fast on dead hosts (connect) and pool starvation,
+# while still giving a slow search backend its full read window
+HTTP_TIMEOUT_READ = float(os.getenv("LOCALIS_HTTP_TIMEOUT_READ", "10"))
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _http_client() -> httpx.AsyncClient:
+    """Returns the shared AsyncClient, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=5.0, read=HTTP_TIMEOUT_READ, write=5.0, pool=2.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            http2=_HTTP2,
+        )
+    return _HTTP_CLIENT
+
+async def aclose_http_client() -> None:
+    """Closes the shared client (app shutdown)."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
+# ------------------------------
+# Provider Resilience
+# ------------------------------
+# Per-provider circuit breaker: after BREAKER_MAX_FAILURES consecutive failures
+# (connection errors, timeouts, 5xx/429) calls short-circuit for
+# BREAKER_RESET_AFTER seconds, then one trial call is let through (half-open).
+BREAKER_MAX_FAILURES = 5
+BREAKER_RESET_AFTER = 30.0
+_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+_RETRY_ATTEMPTS = 3
+
+class _CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < BREAKER_RESET_AFTER:
+            return False
+        # Half-open: let exactly one trial call through and restart the window,
+        # so concurrent callers stay blocked until the trial succeeds (closing
+        # the circuit) or fails; a cancelled trial just waits one more window
+        self.opened_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= BREAKER_MAX_FAILURES:
+            if self.opened_at is None:
+                logger.warning(f"[Tools] {self.name} unavailable; pausing calls for {BREAKER_RESET_AFTER:.0f}s")
+            self.opened_at = time.monotonic()
+
+_breakers: Dict[str, _CircuitBreaker] = {}
+
+def _breaker(name: str) -> _CircuitBreaker:
+    b = _breakers.get(name)
+    if b is None:
+        b = _breakers[name] = _CircuitBreaker(name)
+    return b
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+async def _provider_request(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the provider's circuit breaker. Connection failures
+    and 429/502/503/504 are retried with jittered backoff; auth and other 4xx
+    errors are returned as-is. Timeouts are not retried (each already cost the
+    full timeout) but count toward opening the circuit.
+    """
+    breaker = _breaker(name)
+    if not breaker.allow():
+        raise ProviderUnavailable(f"{name} circuit open")
+
+    for attempt in range(_RETRY_ATTEMPTS):
+        last = attempt == _RETRY_ATTEMPTS - 1
+        try:
+            r = await _http_client().request(method, url, **kwargs)
+        except httpx.ConnectError:
+            if last:
+                breaker.record_failure()
+                raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        else:
+            if r.status_code not in _RETRY_STATUSES or last:
+                if r.status_code >= 500 or r.status_code == 429:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                return r
+        await asyncio.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
 # ------------------------------
 # Search Logic
 # ------------------------------
 
+# Successful results per (provider mode, normalized query, custom endpoint);
+# error codes are never cached so a failed search is retried next time
+SEARCH_CACHE_TTL = float(os.getenv("LOCALIS_SEARCH_TTL", "300"))
+SEARCH_CACHE_MAX = 512
+_search_cache: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()
+
+def _search_cache_get(key: tuple) -> Optional[str]:
+    hit = _search_cache.get(key)
+    if hit is None:
+        return None
+    if time.monotonic() - hit[0] >= SEARCH_CACHE_TTL:
+        del _search_cache[key]
+        return None
+    _search_cache.move_to_end(key)
+    return hit[1]
+
+def _search_cache_put(key: tuple, result: str) -> None:
+    _search_cache[key] = (time.monotonic(), result)
+    _search_cache.move_to_end(key)
+    while len(_search_cache) > SEARCH_CACHE_MAX:
+        _search_cache.popitem(last=False)
+
+# (custom endpoint, query) -> (ETag, Last-Modified, formatted result). Lets the
+# custom provider revalidate with a conditional GET once the TTL cache expires;
+# a 304 reuses the stored result without downloading or parsing a body.
+VALIDATOR_CACHE_MAX = 256
+_validator_cache: "OrderedDict[tuple, Tuple[Optional[str], Optional[str], str]]" = OrderedDict()
+
+def _store_validators(key: tuple, headers: Any, result: str) -> None:
+    etag = headers.get("etag")
+    last_modified = headers.get("last-modified")
+    if not etag and not last_modified:
+        _validator_cache.pop(key, None)
+        return
+    _validator_cache[key] = (etag, last_modified, result)
+    _validator_cache.move_to_end(key)
+    while len(_validator_cache) > VALIDATOR_CACHE_MAX:
+        _validator_cache.popitem(last=False)
+
 async def web_search(
     query: str,
     provider: Optional[str] = None,
@@ -44,111 +217,165 @@ async def web_search(
 ) -> str:
     """
     Performs a real-time web search using Brave, Tavily, or a custom provider.
-    Returns a formatted string of results or an error code.
+    Returns a formatted string of results or an error code. Identical queries
+    within SEARCH_CACHE_TTL seconds are answered from memory.
 
     provider: "auto" (default), "brave", "tavily", "custom"
     """
-    results = []
+    _load_secrets()
 
     # Normalize provider
     mode = (provider or "auto").lower().strip()
 
+    # Determine keys once: override if mode names the provider explicitly, else use env
+    brave_key = custom_api_key if (mode == "brave" and custom_api_key) else os.getenv("BRAVE_API_KEY")
+    tavily_key = custom_api_key if (mode == "tavily" and custom_api_key) else os.getenv("TAVILY_API_KEY")
+    if mode == "auto" and not brave_key and not tavily_key:
+        return "ERROR_NO_PROVIDER_CONFIGURED"
+
+    cache_key = (mode, query.strip().lower(), custom_endpoint or "")
+    if SEARCH_CACHE_TTL > 0:
+        cached = _search_cache_get(cache_key)
+        if cached is not None:
+            logger.debug("[Tools] Search cache hit for: %s", query)
+            return cached
+
+    result = await _search_providers(query, mode, custom_endpoint, custom_api_key, brave_key, tavily_key)
+    if SEARCH_CACHE_TTL > 0 and not result.startswith("ERROR_"):
+        _search_cache_put(cache_key, result)
+    return result
+
+async def _search_providers(
+    query: str,
+    mode: str,
+    custom_endpoint: Optional[str],
+    custom_api_key: Optional[str],
+    brave_key: Optional[str],
+    tavily_key: Optional[str]
+) -> str:
+    """Runs the search against the provider(s) selected by mode (uncached)."""
+    results = []
+
     # --- Custom Provider ---
     if mode == "custom":
         if not custom_endpoint:
             return "ERROR_CUSTOM_ENDPOINT_MISSING"
 
         try:
-            logger.debug(f"[Tools] Searching Custom Provider for: {query}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                params = {"q": query}
-                # Attach custom key if provided
-                if custom_api_key:
-                    params["api_key"] = custom_api_key
-
-                # GET request by default
-                r = await client.get(custom_endpoint, params=params)
-
-                if r.status_code == 200:
-                    try:
-                        data = r.json()
-                        # Expected Shape: { "results": [ { "title": "...", "snippet": "...", "url": "..." } ] }
-                        res_list = data.get("results")
-                        if not isinstance(res_list, list):
-                            return "ERROR_CUSTOM_BAD_FORMAT"
-
-                        for item in res_list:
-                            title = item.get("title", "No Title")
-                            snippet = item.get("snippet", "")
-                            url = item.get("url", "")
-                            results.append(f"[Custom] {title}: {snippet} ({url})")
-
-                        if results:
-                            return "\n".join(results)
-                        return "ERROR_NO_RESULTS"
-                    except Exception:
+            logger.debug("[Tools] Searching Custom Provider for: %s", query)
+            params = {"q": query}
+            # Attach custom key if provided
+            if custom_api_key:
+                params["api_key"] = custom_api_key
+
+            # Conditional GET when an earlier response carried validators
+            validator_key = (custom_endpoint, query)
+            cached = _validator_cache.get(validator_key)
+            headers = {}
+            if cached:
+                etag, last_modified, _ = cached
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
+            # GET request by default
+            r = await _provider_request(f"custom:{custom_endpoint}", "GET", custom_endpoint, params=params, headers=headers)
+
+            if r.status_code == 304 and cached:
+                _validator_cache.move_to_end(validator_key)
+                return cached[2]
+
+            if r.status_code == 200:
+                try:
+                    data = _loads(r.content)
+                    # Expected Shape: { "results": [ { "title": "...", "snippet": "...", "url": "..." } ] }
+                    res_list = data.get("results")
+                    if not isinstance(res_list, list):
                         return "ERROR_CUSTOM_BAD_FORMAT"
-                else:
-                    return f"ERROR_CUSTOM_{r.status_code}"
-        except Exception as e:
-            return f"ERROR_CUSTOM_CONNECTION: {e}"
 
-    # --- Brave Search ---
-    # Determine key: override if mode is explicit 'brave', else use env
-    brave_key = custom_api_key if (mode == "brave" and custom_api_key) else os.getenv("BRAVE_API_KEY")
+                    results.extend(
+                        f"[Custom] {item.get('title', 'No Title')}: {item.get('snippet', '')} ({item.get('url', '')})"
+                        for item in res_list
+                    )
 
-    # Run if mode is 'brave' OR mode is 'auto'
-    if mode in ["brave", "auto"] and brave_key:
-        try:
-            logger.debug(f"[Tools] Searching Brave for: {query}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                headers = {"X-Subscription-Token": brave_key, "Accept": "application/json"}
-                r = await client.get(
-                    "https://api.search.brave.com/res/v1/web/search",
-                    headers=headers,
-                    params={"q": query, "count": 3}
-                )
-
-                if r.status_code == 200:
-                    data = r.json()
-                    # Brave returns results in 'web.results'
-                    for item in data.get("web", {}).get("results", []):
-                        title = item.get('title', 'No Title')
-                        desc = item.get('description', '')
-                        results.append(f"[Brave] {title}: {desc}")
-
-                    # If we found results in explicit 'brave' mode or 'auto' mode, we are done
-                    if results: return "\n".join(results)
+                    if results:
+                        result = "\n".join(results)
+                        _store_validators(validator_key, r.headers, result)
+                        return result
+                    return "ERROR_NO_RESULTS"
+                except Exception:
+                    return "ERROR_CUSTOM_BAD_FORMAT"
+            else:
+                return f"ERROR_CUSTOM_{r.status_code}"
         except Exception as e:
-            logger.warning(f"[Tools] Brave error: {e}")
+            return f"ERROR_CUSTOM_CONNECTION: {e}"
 
-    # --- Tavily Search ---
-    # Determine key: override if mode is explicit 'tavily', else use env
-    tavily_key = custom_api_key if (mode == "tavily" and custom_api_key) else os.getenv("TAVILY_API_KEY")
+    # Run Brave if mode is 'brave' or 'auto'; Tavily if mode is 'tavily' or 'auto'
+    brave_task = asyncio.ensure_future(_brave(query, brave_key)) if mode in ("brave", "auto") and brave_key else None
+    tavily_task = asyncio.ensure_future(_tavily(query, tavily_key)) if mode in ("tavily", "auto") and tavily_key else None
 
-    # Run if mode is 'tavily' OR (mode is 'auto' AND no results yet)
-    if (mode == "tavily" or (mode == "auto" and not results)) and tavily_key:
-        try:
-            logger.debug(f"[Tools] Searching Tavily for: {query}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                r = await client.post(
-                    "https://api.tavily.com/search",
-                    json={"api_key": tavily_key, "query": query, "max_results": 3}
-                )
-
-                if r.status_code == 200:
-                    data = r.json()
-                    for item in data.get("results", []):
-                        title = item.get('title', 'No Title')
-                        content = item.get('content', '')
-                        results.append(f"[Tavily] {title}: {content}")
-
-                    if results: return "\n".join(results)
-        except Exception as e:
-            logger.warning(f"[Tools] Tavily error: {e}")
+    # In 'auto' mode both run concurrently; Brave still wins when it has results,
+    # and Tavily (already in flight) is the fallback instead of a second round trip
+    try:
+        for task in (brave_task, tavily_task):
+            if task is None:
+                continue
+            results = await task
+            if results:
+                return "\n".join(results)
+    finally:
+        for task in (brave_task, tavily_task):
+            if task is not None and not task.done():
+                task.cancel()
 
     return "ERROR_NO_RESULTS"
 
+async def _brave(query: str, api_key: str) -> List[str]:
+    """Brave results as formatted lines ([] on error or no results)."""
+    results = []
+    try:
+        logger.debug("[Tools] Searching Brave for: %s", query)
+        headers = {"X-Subscription-Token": api_key, "Accept": "application/json"}
+        r = await _provider_request(
+            "brave", "GET",
+            "https://api.search.brave.com/res/v1/web/search",
+            headers=headers,
+            params={"q": query, "count": 3}
+        )
+
+        if r.status_code == 200:
+            data = _loads(r.content)
+            # Brave returns results in 'web.results'
+            results.extend(
+                f"[Brave] {item.get('title', 'No Title')}: {item.get('description', '')}"
+                for item in data.get("web", {}).get("results", ())
+            )
+    except Exception as e:
+        logger.warning(f"[Tools] Brave error: {e}")
+    return results
+
+async def _tavily(query: str, api_key: str) -> List[str]:
+    """Tavily results as formatted lines ([] on error or no results)."""
+    results = []
+    try:
+        logger.debug("[Tools] Searching Tavily for: %s", query)
+        r = await _provider_request(
+            "tavily", "POST",
+            "https://api.tavily.com/search",
+            json={"api_key": api_key, "query": query, "max_results": 3}
+        )
+
+        if r.status_code == 200:
+            data = _loads(r.content)
+            results.extend(
+                f"[Tavily] {item.get('title', 'No Title')}: {item.get('content', '')}"
+                for item in data.get("results", ())
+            )
+    except Exception as e:
+        logger.warning(f"[Tools] Tavily error: {e}")
+    return results
+
 
 # ------------------------------
 # Tool Definitions & Wrappers
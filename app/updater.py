@@ -1,11 +1,17 @@
 # app/updater.py
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
 import os
+import re
+import shutil
 import subprocess
+import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, Request, HTTPException
@@ -23,7 +29,8 @@ def _get_git_exe() -> str:
     """
     Returns the git executable path from LOCALIS_GIT_EXE environment variable.
     Falls back to 'git' if not set or if the specified path doesn't exist.
-    Caches the result for performance.
+    The result is resolved once to an absolute, canonical path so that
+    subprocess does not repeat the PATH search on every git call.
     """
     global _GIT_EXE
 
@@ -40,10 +47,17 @@ def _get_git_exe() -> str:
             if git_path != 'git':
                 logger.info(f"[Updater] Using bundled git: {git_path}")
 
+        resolved = shutil.which(_GIT_EXE)
+        if resolved:
+            _GIT_EXE = os.path.realpath(resolved)
+
     return _GIT_EXE
 
 
 def register_updater(app, project_root: Path) -> None:
+    # Including the router twice would run every /update request twice
+    if hasattr(app.state, "project_root"):
+        raise RuntimeError("register_updater() called more than once for this app")
     app.state.project_root = str(project_root)
     app.include_router(router)
 
@@ -52,47 +66,175 @@ def _root(request: Request) -> Path:
     return Path(request.app.state.project_root)
 
 
+# On Windows, run git without allocating (and flashing) a console window
+_SUBPROCESS_KW: Dict[str, Any] = (
+    {"creationflags": subprocess.CREATE_NO_WINDOW} if sys.platform.startswith("win") else {}
+)
+
+
+_GIT_OK = False
+
+
 def _git_available() -> bool:
     """
     Checks if git is available by running 'git --version'.
     Uses the git executable specified by LOCALIS_GIT_EXE if set.
+    Only a positive result is cached: after a failure the executable is
+    re-resolved and re-checked on the next call, so installing git or fixing
+    PATH takes effect without a restart.
     """
+    global _GIT_OK
+    if _GIT_OK:
+        return True
     try:
         git_exe = _get_git_exe()
-        subprocess.run([git_exe, "--version"], capture_output=True, text=True, check=True)
+        subprocess.run([git_exe, "--version"], capture_output=True, text=True, check=True, **_SUBPROCESS_KW)
+        _GIT_OK = True
         return True
     except Exception as e:
         logger.warning(f"[Updater] Git not available: {e}")
+        _invalidate_git_cache()
         return False
 
 
+@functools.lru_cache(maxsize=8)
+def _is_git_clone(root: Path) -> bool:
+    return (root / ".git").exists()
+
+
+def _invalidate_git_cache() -> None:
+    """Forgets the cached git executable, availability and clone checks."""
+    global _GIT_EXE, _GIT_OK
+    _GIT_EXE = None
+    _GIT_OK = False
+    _is_git_clone.cache_clear()
+    _git_base_cmd.cache_clear()
+
+
+@functools.lru_cache(maxsize=8)
+def _git_base_cmd(root: Path) -> Tuple[str, ...]:
+    # "git -C <root>" rather than cwd= so subprocess needn't chdir per call
+    return (_get_git_exe(), "-C", str(root))
+
+
 def _run_git(root: Path, args: list[str]) -> subprocess.CompletedProcess:
     """
     Runs a git command in the specified directory.
     Uses the git executable specified by LOCALIS_GIT_EXE if set.
     """
-    git_exe = _get_git_exe()
-    return subprocess.run([git_exe] + args, cwd=str(root), capture_output=True, text=True)
+    return subprocess.run([*_git_base_cmd(root), *args], capture_output=True, text=True, **_SUBPROCESS_KW)
+
+
+# "# branch.ab +<ahead> -<behind>" header of 'git status --porcelain=v2 --branch'
+_BRANCH_AB_RE = re.compile(r"^\+(\d+) -(\d+)$")
+
+
+# git cannot run fetch/pull concurrently on one working tree; serialize per repo
+_repo_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _repo_lock(root: Path) -> asyncio.Lock:
+    lock = _repo_locks.get(str(root))
+    if lock is None:
+        lock = _repo_locks[str(root)] = asyncio.Lock()
+    return lock
+
+
+# Last /update/status payload per repo; polls within the TTL skip the fetch.
+# checked_at in the payload stays the time of the real check.
+STATUS_CACHE_TTL = 30.0
+_status_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
 
 
 @router.get("/status")
-def update_status(request: Request) -> Dict[str, Any]:
+async def update_status(request: Request, force: bool = False) -> Dict[str, Any]:
     """
     Returns the current git repository status including branch, commits ahead/behind,
-    and whether the working tree is dirty.
+    and whether the working tree is dirty. Cached for STATUS_CACHE_TTL seconds
+    unless force=1 ("Check now").
     """
     root = _root(request)
+    # git fetch is network-bound; run the git calls off the event loop
+    async with _repo_lock(root):
+        hit = _status_cache.get(str(root))
+        if not force and hit and time.monotonic() - hit[0] < STATUS_CACHE_TTL:
+            return hit[1]
+        status = await asyncio.to_thread(_update_status, root)
+        _status_cache[str(root)] = (time.monotonic(), status)
+        return status
+
 
+def _update_status(root: Path) -> Dict[str, Any]:
     if not _git_available():
         return {"supported": False, "reason": "git_not_found"}
 
-    if not (root / ".git").exists():
+    if not _is_git_clone(root):
         return {"supported": False, "reason": "not_a_git_clone"}
 
-    fetch = _run_git(root, ["fetch", "--prune"])
+    fetch = _run_git(root, _status_fetch_args(root))
     if fetch.returncode != 0:
         return {"supported": False, "reason": "git_fetch_failed", "stderr": fetch.stderr.strip()}
 
+    fields = _status_fields(root)
+    if fields is None:
+        fields = _status_fields_legacy(root)
+
+    return {
+        "supported": True,
+        "root": str(root),
+        **fields,
+        "checked_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _status_fields(root: Path) -> Optional[Dict[str, Any]]:
+    """
+    Branch, heads, upstream, ahead/behind and dirty flag from one
+    'git status --porcelain=v2 --branch' (plus a rev-parse of the upstream).
+    None if porcelain v2 is unsupported (git < 2.11).
+    """
+    st = _run_git(root, ["status", "--porcelain=v2", "--branch"])
+    if st.returncode != 0:
+        return None
+
+    headers: Dict[str, str] = {}
+    dirty = False
+    for line in st.stdout.splitlines():
+        if line.startswith("# branch."):
+            name, _, value = line[len("# branch."):].partition(" ")
+            headers[name] = value
+        elif line:
+            dirty = True
+
+    oid = headers.get("oid")
+    head = headers.get("head")
+    upstream = headers.get("upstream")
+
+    behind = ahead = None
+    m = _BRANCH_AB_RE.match(headers.get("ab", ""))
+    if m:
+        ahead, behind = int(m.group(1)), int(m.group(2))
+
+    remote_head = None
+    if upstream:
+        remote = _run_git(root, ["rev-parse", upstream])
+        if remote.returncode == 0:
+            remote_head = remote.stdout.strip()
+
+    return {
+        # Same values 'rev-parse --abbrev-ref HEAD' / 'rev-parse HEAD' report
+        "branch": "HEAD" if head == "(detached)" else head,
+        "local_head": None if oid in (None, "(initial)") else oid,
+        "upstream": upstream,
+        "remote_head": remote_head,
+        "behind": behind,
+        "ahead": ahead,
+        "dirty": dirty,
+    }
+
+
+def _status_fields_legacy(root: Path) -> Dict[str, Any]:
+    """_status_fields for git without porcelain v2: one command per field."""
     branch = _run_git(root, ["rev-parse", "--abbrev-ref", "HEAD"])
     head = _run_git(root, ["rev-parse", "HEAD"])
     dirty = _run_git(root, ["status", "--porcelain"])
@@ -115,8 +257,6 @@ def update_status(request: Request) -> Dict[str, Any]:
             ahead = int(a.stdout.strip())
 
     return {
-        "supported": True,
-        "root": str(root),
         "branch": branch.stdout.strip() if branch.returncode == 0 else None,
         "local_head": head.stdout.strip() if head.returncode == 0 else None,
         "upstream": upstream,
@@ -124,25 +264,51 @@ def update_status(request: Request) -> Dict[str, Any]:
         "behind": behind,
         "ahead": ahead,
         "dirty": bool(dirty.stdout.strip()),
-        "checked_at": datetime.now(timezone.utc).isoformat(),
     }
 
 
+def _status_fetch_args(root: Path) -> list[str]:
+    """
+    Fetch arguments for a status check: only the current branch's upstream ref,
+    without tags. Falls back to the full 'fetch --prune' when there is no
+    upstream (or git predates %(upstream:remotename), 2.16). Shallow fetches
+    are deliberately avoided; they would turn the clone shallow.
+    """
+    refs = _run_git(root, [
+        "for-each-ref",
+        "--format=%(HEAD)%09%(upstream:remotename)%09%(upstream:remoteref)%09%(upstream)",
+        "refs/heads",
+    ])
+    if refs.returncode == 0:
+        for line in refs.stdout.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 4 and parts[0] == "*" and all(parts[1:]):
+                _, remote, remote_ref, tracking_ref = parts
+                return ["fetch", "--prune", "--no-tags", remote, f"+{remote_ref}:{tracking_ref}"]
+    return ["fetch", "--prune"]
+
+
 class ApplyUpdateRequest(BaseModel):
     ff_only: bool = Field(default=True)
 
 
 @router.post("/apply")
-def apply_update(req: ApplyUpdateRequest, request: Request) -> Dict[str, Any]:
+async def apply_update(req: ApplyUpdateRequest, request: Request) -> Dict[str, Any]:
     """
     Applies pending git updates by pulling from the upstream branch.
     Requires a clean working tree and uses fast-forward-only merge by default.
     """
     root = _root(request)
+    async with _repo_lock(root):
+        # HEAD and ahead/behind change (or the attempt fetched); drop the cached status
+        _status_cache.pop(str(root), None)
+        return await asyncio.to_thread(_apply_update, root, req.ff_only)
+
 
+def _apply_update(root: Path, ff_only: bool) -> Dict[str, Any]:
     if not _git_available():
         raise HTTPException(status_code=400, detail="git_not_found")
-    if not (root / ".git").exists():
+    if not _is_git_clone(root):
         raise HTTPException(status_code=400, detail="not_a_git_clone")
 
     dirty = _run_git(root, ["status", "--porcelain"])
@@ -154,7 +320,7 @@ def apply_update(req: ApplyUpdateRequest, request: Request) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=f"git_fetch_failed: {fetch.stderr.strip()}")
 
     pull_args = ["pull"]
-    if req.ff_only:
+    if ff_only:
         pull_args += ["--ff-only"]
 
     pull = _run_git(root, pull_args)
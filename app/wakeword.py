@@ -298,7 +298,7 @@ def _submit_chat(text: str, session_id: str) -> None:
         _ha_url   = os.getenv("LOCALIS_HA_URL", "")
         _ha_token = os.getenv("LOCALIS_HA_TOKEN", "")
         if _ha_url and _ha_token:
-            print("[FastPath] firing direct HA call")
+            logger.info("[FastPath] firing direct HA call")
             try:
                 with httpx.Client(timeout=10.0) as client:
                     client.post(